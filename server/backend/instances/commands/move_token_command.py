@@ -21,13 +21,24 @@ class MoveTokenCommand(Command):
         token = instance.act.map.get_token_by_id(self.token_id)
         if token is None:
             return Command.Response(False, "Token not found."), {}
+        # Updates are applied to the issuer's view, which only holds the tiles and tokens its token has seen,
+        # so moving can reveal tiles and tokens or hide them and the view is compared from before the move
+        map = instance.act.map
+        previous_view = map.export_view_data(self.statblock_id)
         token.set_position((self.to_x, self.to_y, token.height))
+        view_data = map.export_view_data(self.statblock_id)
 
-        index = instance.act.map.get_token_index(self.token_id)
+        updates = []
+        if view_data["tiles"] != previous_view["tiles"]:
+            updates.append(DataUpdate.set(view_data["tiles"], "tiles"))
+        token_ids = [token_data["id"] for token_data in view_data["tokens"]]
+        if token_ids != [token_data["id"] for token_data in previous_view["tokens"]]:
+            updates.append(DataUpdate.set(view_data["tokens"], "tokens"))
+        elif self.token_id in token_ids:
+            index = token_ids.index(self.token_id)
+            updates.append(DataUpdate.set(self.to_x, "tokens", index, "x"))
+            updates.append(DataUpdate.set(self.to_y, "tokens", index, "y"))
         return Command.Response(True, f"Token moved to ({self.to_x}, {self.to_y})."), {
-            "updates": [
-                DataUpdate.set(self.to_x, "tokens", index, "x"),
-                DataUpdate.set(self.to_y, "tokens", index, "y")
-            ],
-            "hash": crosshash(instance.act.map.export_view_data(self.token_id))
+            "updates": updates,
+            "hash": crosshash(view_data)
         }
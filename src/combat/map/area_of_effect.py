@@ -0,0 +1,86 @@
+import numpy as np
+
+class AreaOfEffect:
+    """
+    An area of effect with a shape, measured in feet from a point of origin, such as the sphere of a fireball or the cone of burning hands.
+    A tile is inside the area if its middle is. Positions are given in tiles, format: (x, y, height), with the point of origin
+    and aiming position at the middle of their tiles.
+    """
+    SPHERE = "sphere"
+    CUBE = "cube"
+    CONE = "cone"
+    LINE = "line"
+    CYLINDER = "cylinder"
+    SHAPES = (SPHERE, CUBE, CONE, LINE, CYLINDER)
+    # Width of a line in feet, if not given
+    DEFAULT_LINE_WIDTH = 5
+    # Allowed error in feet for tiles on the edge of an area
+    TOLERANCE = 1e-6
+
+    def __init__(self, shape: str, origin, size: int, target = None, width: int = None, height: int = None):
+        """
+        param shape: str - the shape of the area, see AreaOfEffect.SHAPES
+        param origin: tuple - the point of origin, format: (x, y, height)
+        param size: int - the radius of a sphere or cylinder, length of a cone or line, or width of a cube, in feet
+        param target (optional): tuple - the position a cone, line or cube is aimed toward, format: (x, y, height). Cubes without one are centered on the point of origin
+        param width (optional): int - the width of a line in feet
+        param height (optional): int - the height of a cylinder in feet, by default the same as its radius
+        """
+        if shape not in AreaOfEffect.SHAPES:
+            raise ValueError(f"Unknown area of effect shape: {shape}.")
+        if target is None and shape in (AreaOfEffect.CONE, AreaOfEffect.LINE):
+            raise ValueError(f"A {shape} needs a position to aim toward.")
+        self.shape = shape
+        self.origin = tuple(origin)
+        self.size = size
+        self.target = None if target is None else tuple(target)
+        self.width = AreaOfEffect.DEFAULT_LINE_WIDTH if width is None else width
+        self.height = size if height is None else height
+
+    def contains(self, xs, ys, hs, tile_size: int):
+        """
+        Returns which of the given tiles are inside the area.
+
+        param xs, ys, hs: np.ndarray - the x, y and height of each tile
+        param tile_size: int - the size of a tile in feet
+
+        returns: np.ndarray - bool mask of the tiles inside the area
+        """
+        # Offsets in feet from the point of origin to the middle of each tile
+        dx, dy, dh = ((np.asarray(values) - start) * tile_size for values, start in zip((xs, ys, hs), self.origin))
+
+        if self.shape == AreaOfEffect.SPHERE:
+            return dx * dx + dy * dy + dh * dh <= self.size * self.size
+        if self.shape == AreaOfEffect.CYLINDER:
+            # Cylinders rise from the point of origin's height
+            return (dx * dx + dy * dy <= self.size * self.size) & (dh >= 0) & (dh < self.height)
+        if self.shape == AreaOfEffect.CUBE:
+            return self._contains_cube(dx, dy, dh, tile_size)
+
+        direction = (np.array(self.target) - np.array(self.origin)) * tile_size
+        length = np.linalg.norm(direction)
+        if length == 0:
+            return np.zeros(np.shape(dx), dtype = bool)
+        ux, uy, uh = direction / length
+        # Distance along the aimed direction, and from the aimed direction
+        along = dx * ux + dy * uy + dh * uh
+        across = np.sqrt(np.maximum(0, dx * dx + dy * dy + dh * dh - along * along))
+        inside = (along > 0) & (along <= self.size + AreaOfEffect.TOLERANCE)
+        if self.shape == AreaOfEffect.CONE:
+            # A cone is as wide as it is far from its point of origin
+            return inside & (across <= along / 2 + AreaOfEffect.TOLERANCE)
+        return inside & (across <= self.width / 2 + AreaOfEffect.TOLERANCE)
+
+    def _contains_cube(self, dx, dy, dh, tile_size):
+        # Cubes are a whole amount of tiles wide, with the extra tile of an even width on the positive side
+        tiles = max(1, round(self.size / tile_size))
+        lowest = [-((tiles - 1) // 2), -((tiles - 1) // 2)]
+        if self.target is not None:
+            # Cubes aimed at a position start next to the point of origin, on the side toward it
+            offsets = [self.target[0] - self.origin[0], self.target[1] - self.origin[1]]
+            axis = 0 if abs(offsets[0]) >= abs(offsets[1]) else 1
+            if offsets[axis] != 0:
+                lowest[axis] = 1 if offsets[axis] > 0 else -tiles
+        # Cubes rise from the point of origin's height
+        tx, ty, th = dx / tile_size, dy / tile_size, dh / tile_size
+        return (tx >= lowest[0]) & (tx < lowest[0] + tiles) & (ty >= lowest[1]) & (ty < lowest[1] + tiles) & (th >= 0) & (th < tiles)
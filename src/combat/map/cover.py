@@ -0,0 +1,224 @@
+import numpy as np
+from src.combat.map.versioned_cache import VersionedCache
+
+class CoverEngine:
+    """
+    Computes the cover a token has against attacks from another token, from the walls between them.
+    Lines are traced from each corner of the attacker's space to the corners of each square of the defender's space.
+    A line gets the highest cover of the walls it crosses, at the height it crosses them, and is blocked by raised ground and walls giving total cover.
+    A corner and square get the highest cover of the walls crossed by their lines, or more the more of their lines are blocked,
+    and the attacker uses the corner and square giving the least cover.
+
+    The lines of every attacker and defender pair are traced together, and results are cached per pair until the map changes or a token moves.
+    """
+    # Cover values, as used by MapTileWall
+    NONE = 0
+    HALF = 1
+    THREE_QUARTERS = 2
+    TOTAL = 3
+    # Bonus to armor class given by each cover value
+    AC_BONUS = (0, 2, 5, 0)
+    # Cover given by the amount of blocked lines from a corner to a square, out of 4
+    BLOCKED_LINE_COVER = np.array([NONE, HALF, HALF, THREE_QUARTERS, TOTAL], dtype = np.int8)
+
+    DEFAULT_CACHE_SIZE = 4096
+
+    def __init__(self, map, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._map = map
+        self.cache = VersionedCache(cache_size)
+
+    @staticmethod
+    def _space(token):
+        """Returns the (x, y, height, diameter) of the space a token takes up."""
+        x, y, height = token.get_position()
+        return (int(x), int(y), int(height), int(token.diameter))
+
+    def _on_map(self, token):
+        x, y, height, diameter = self._space(token)
+        return 0 <= x and x + diameter <= self._map.width and 0 <= y and y + diameter <= self._map.height and 0 <= height
+
+    def get_cover(self, attacker, defender):
+        """
+        Returns the cover the defender has against attacks from the attacker.
+
+        param attacker: Token - the attacking token, tokens extending a larger token use the space of the larger token
+        param defender: Token - the defending token
+
+        returns: int - the cover value, see CoverEngine.NONE to CoverEngine.TOTAL
+        """
+        return int(self.get_cover_matrix([attacker], [defender])[0, 0])
+
+    def get_cover_matrix(self, attackers: list, defenders: list):
+        """
+        Returns the cover of every defender against every attacker, tracing the lines of all uncached pairs together.
+
+        param attackers: list[Token] - the attacking tokens
+        param defenders: list[Token] - the defending tokens, such as the targets of an area of effect
+
+        returns: np.ndarray - the cover values, indexed by [attacker, defender]
+        """
+        attackers = [getattr(token, "_parent", token) for token in attackers]
+        defenders = [getattr(token, "_parent", token) for token in defenders]
+        versions = (self._map.version, self._map.occupancy_version)
+        matrix = np.zeros((len(attackers), len(defenders)), dtype = np.int8)
+        missing = []
+        for i, attacker in enumerate(attackers):
+            for j, defender in enumerate(defenders):
+                cover = self.cache.get((id(attacker), id(defender)), versions)
+                if cover is None:
+                    missing.append((i, j))
+                else:
+                    matrix[i, j] = cover
+
+        # Tokens not placed on the map have no walls between them
+        missing = [(i, j) for i, j in missing if self._on_map(attackers[i]) and self._on_map(defenders[j])]
+        if missing:
+            spaces = [(self._space(attackers[i]), self._space(defenders[j])) for i, j in missing]
+            for (i, j), cover in zip(missing, self._compute(spaces).tolist()):
+                matrix[i, j] = cover
+                self.cache.put((id(attackers[i]), id(defenders[j])), versions, cover)
+        return matrix
+
+    def _compute(self, spaces: list):
+        """Returns the cover of each (attacker space, defender space) pair, see _space."""
+        # Build every line as (corner and square combination, start, end), with the start at a corner of the
+        # attacker's space and the end at a corner of a square of the defender's space
+        # Each end also gets the direction into its own space, see _crossings
+        combos, x0, y0, h0, x1, y1, h1 = [], [], [], [], [], [], []
+        sx0, sy0, sx1, sy1 = [], [], [], []
+        combo_pairs = []
+        for pair, ((ax, ay, ah, ad), (dx, dy, dh, dd)) in enumerate(spaces):
+            for cx in range(ax, ax + ad + 1):
+                for cy in range(ay, ay + ad + 1):
+                    for sx in range(dx, dx + dd):
+                        for sy in range(dy, dy + dd):
+                            combo = len(combo_pairs)
+                            combo_pairs.append(pair)
+                            for ex, ey in ((sx, sy), (sx + 1, sy), (sx, sy + 1), (sx + 1, sy + 1)):
+                                combos.append(combo)
+                                x0.append(cx)
+                                y0.append(cy)
+                                h0.append(ah)
+                                x1.append(ex)
+                                y1.append(ey)
+                                h1.append(dh)
+                                sx0.append(np.sign(2 * ax + ad - 2 * cx))
+                                sy0.append(np.sign(2 * ay + ad - 2 * cy))
+                                sx1.append(np.sign(2 * sx + 1 - 2 * ex))
+                                sy1.append(np.sign(2 * sy + 1 - 2 * ey))
+        x0, y0, h0, x1, y1, h1, sx0, sy0, sx1, sy1 = (np.array(values, dtype = np.int64) for values in (x0, y0, h0, x1, y1, h1, sx0, sy0, sx1, sy1))
+
+        line_cover = np.maximum(
+            self._crossings(x0, y0, h0, x1, y1, h1, sx0, sy0, sx1, sy1, vertical = True),
+            self._crossings(y0, x0, h0, y1, x1, h1, sy0, sx0, sy1, sx1, vertical = False)
+        )
+
+        # Walls with partial cover give their cover to every line crossing them, while lines blocked entirely only
+        # give total cover once all four lines of a corner and square are blocked
+        combos = np.array(combos)
+        blocked = line_cover == CoverEngine.TOTAL
+        combo_cover = np.zeros(len(combo_pairs), dtype = np.int8)
+        np.maximum.at(combo_cover, combos, np.where(blocked, 0, line_cover).astype(np.int8))
+        blocked_lines = np.zeros(len(combo_pairs), dtype = np.int64)
+        np.add.at(blocked_lines, combos, blocked)
+        combo_cover = np.maximum(combo_cover, CoverEngine.BLOCKED_LINE_COVER[blocked_lines])
+        cover = np.full(len(spaces), CoverEngine.TOTAL, dtype = np.int8)
+        np.minimum.at(cover, np.array(combo_pairs), combo_cover)
+        return cover
+
+    def _crossings(self, u0, v0, h0, u1, v1, h1, su0, sv0, su1, sv1, vertical: bool):
+        """
+        Returns the highest cover of the walls each line crosses at a line of the grid, given in (u, v) coordinates.
+        For the lines of the grid between columns of tiles u is x and v is y, for those between rows of tiles it is the other way around.
+        A line passing through a corner of tiles is only blocked by walls meeting at the corner that separate both of its sides.
+
+        Lines start and end on the edges of the tokens' spaces, so each end is treated as starting just inside its own space,
+        in the direction (su, sv) toward its middle. Walls on the edge of a space facing the other token are then crossed.
+        """
+        layer = self._map.traversal
+        max_height = self._map._max_height
+        size_u, size_v = (self._map.width, self._map.height) if vertical else (self._map.height, self._map.width)
+        def lookup(array, a, b, level = None):
+            """Returns array values at tiles (a, b) in (u, v) coordinates, with tiles outside of the map giving 0."""
+            inside = (0 <= a) & (a < size_u) & (0 <= b) & (b < size_v)
+            a, b = np.clip(a, 0, size_u - 1), np.clip(b, 0, size_v - 1)
+            x, y = (a, b) if vertical else (b, a)
+            values = array[x, y] if level is None else array[x, y, level]
+            return np.where(inside, values, 0)
+        # Walls between tiles (a, b) and (a + 1, b), and between tiles (a, b) and (a, b + 1)
+        u_walls, v_walls = (layer.cover_x, layer.cover_y) if vertical else (layer.cover_y, layer.cover_x)
+
+        def crossing_cover(u, v, at_corner, height, line_du, line_dv):
+            """Returns the cover of crossing u = u between rows v and v + 1, or at the corner (u, v), moving in the direction (line_du, line_dv)."""
+            level = np.clip(np.floor(height).astype(np.int64), 0, max_height - 1)
+            def wall(walls, a, b):
+                return lookup(walls, a, b, level)
+            def solid(a, b):
+                return height < lookup(layer.ground, a, b)
+
+            # Crossing between two tiles
+            between_cover = wall(u_walls, u - 1, v)
+            between_solid = solid(u - 1, v) | solid(u, v)
+
+            # Running along a line of the grid, between the walls before and after the corner
+            along_cover = np.minimum(wall(u_walls, u - 1, v - 1), wall(u_walls, u - 1, v))
+            along_solid = (solid(u - 1, v - 1) & solid(u - 1, v)) | (solid(u, v - 1) & solid(u, v))
+
+            # Crossing diagonally from the start tile (su, sv) to the end tile (eu, ev), with a wall on each side of the corner
+            su, eu = np.where(line_du > 0, u - 1, u), np.where(line_du > 0, u, u - 1)
+            sv, ev = np.where(line_dv > 0, v - 1, v), np.where(line_dv > 0, v, v - 1)
+            start_u, end_u = wall(u_walls, u - 1, sv), wall(u_walls, u - 1, ev)
+            start_v, end_v = wall(v_walls, su, v - 1), wall(v_walls, eu, v - 1)
+            diagonal_cover = np.maximum(np.maximum(np.minimum(start_u, end_u), np.minimum(start_v, end_v)),
+                                        np.maximum(np.minimum(start_u, start_v), np.minimum(end_u, end_v)))
+            diagonal_solid = solid(su, sv) | solid(eu, ev) | (solid(su, ev) & solid(eu, sv))
+
+            corner_cover = np.where(line_dv == 0, along_cover, diagonal_cover)
+            corner_solid = np.where(line_dv == 0, along_solid, diagonal_solid)
+            line_cover = np.where(at_corner, corner_cover, between_cover)
+            return np.where(np.where(at_corner, corner_solid, between_solid), CoverEngine.TOTAL, line_cover)
+
+        cover = np.zeros(len(u0), dtype = np.int8)
+        low, high = np.minimum(u0, u1), np.maximum(u0, u1)
+        du, dv = u1 - u0, v1 - v0
+        longest = int((high - low).max()) if len(u0) else 0
+        for offset in range(1, longest):
+            k = low + offset
+            crossing = k < high
+            if not crossing.any():
+                continue
+            # The line crosses u = k at v = v0 + dv * (k - u0) / du, kept as an exact fraction
+            span = np.where(crossing, du, 1)
+            numerator = v0 * span + dv * (k - u0)
+            # Lines run between the middles of the heights of the tokens
+            height = h0 + 0.5 + (h1 - h0) * (k - u0) / span
+            line_cover = crossing_cover(k[crossing], (numerator // span)[crossing], (numerator % span == 0)[crossing],
+                                        height[crossing], du[crossing], dv[crossing])
+            cover[crossing] = np.maximum(cover[crossing], line_cover)
+
+        # Ends on the grid line u = u0 or u1 cross it if their own space is on the other side of it. The row crossed is
+        # given by the sign of the small offset in v from the end, which is 0 if the end is crossed at its corner
+        direction = np.sign(du)
+        for ends, u, v, su, sv, height in ((direction * su0 < 0, u0, v0, su0, sv0, h0), (direction * su1 > 0, u1, v1, su1, sv1, h1)):
+            crossing = ends & (du != 0)
+            offset = np.sign(sv * du - su * dv) * direction
+            row = np.where(offset < 0, v - 1, v)
+            self._add_crossings(cover, crossing, crossing_cover, u, row, offset == 0, height + 0.5, du, dv)
+
+        # Lines running along a grid line from one side of it to the other cross it halfway, found the same way
+        crossing = (du == 0) & (su0 * su1 < 0)
+        middle, offset = v0 + v1, sv0 + sv1
+        row = np.where(middle % 2 == 1, middle // 2, np.where(offset < 0, middle // 2 - 1, middle // 2))
+        at_corner = (middle % 2 == 0) & (offset == 0)
+        line_dv = np.where(dv != 0, dv, sv1 - sv0)
+        self._add_crossings(cover, crossing, crossing_cover, u0, row, at_corner, (h0 + h1) / 2 + 0.5, su1 - su0, line_dv)
+        return cover
+
+    @staticmethod
+    def _add_crossings(cover, crossing, crossing_cover, u, v, at_corner, height, line_du, line_dv):
+        """Adds the cover of the crossings of the lines selected by the crossing mask to their cover, see _crossings."""
+        if not crossing.any():
+            return
+        height = np.broadcast_to(height, crossing.shape)
+        line_cover = crossing_cover(u[crossing], v[crossing], at_corner[crossing], height[crossing], line_du[crossing], line_dv[crossing])
+        cover[crossing] = np.maximum(cover[crossing], line_cover)
@@ -0,0 +1,108 @@
+import numpy as np
+from src.combat.map.versioned_cache import VersionedCache
+
+class FieldOfView:
+    """
+    Computes which positions of the map can be seen from a position, for every position at once.
+    Lines of sight to all positions are stepped through together, one tile at a time, and are blocked by solid ground
+    (below the height of a tile) and by walls that are impassable at the height the line crosses them.
+    Results are cached per viewing position until the map changes.
+    """
+    DEFAULT_CACHE_SIZE = 32
+
+    def __init__(self, map, cache_size: int = DEFAULT_CACHE_SIZE):
+        self._map = map
+        self.cache = VersionedCache(cache_size)
+
+    def get_visibility(self, position3D):
+        """
+        Returns which positions can be seen from the given position.
+
+        param position3D: tuple - the position to look from, format: (x, y, height)
+
+        returns: np.ndarray - bool mask of the visible positions, indexed by [x, y, height]
+        """
+        return self._get_masks(position3D)[0]
+
+    def get_reached(self, position3D):
+        """
+        Returns which positions lines of sight from the given position reach, which are the visible positions and
+        the solid positions whose side or top can be seen, such as raised ground.
+
+        param position3D: tuple - the position to look from, format: (x, y, height)
+
+        returns: np.ndarray - bool mask of the reached positions, indexed by [x, y, height]
+        """
+        return self._get_masks(position3D)[1]
+
+    def _get_masks(self, position3D):
+        position3D = tuple(int(value) for value in position3D)
+        versions = (self._map.version,)
+        masks = self.cache.get(position3D, versions)
+        if masks is None:
+            masks = self._compute(position3D)
+            for mask in masks:
+                mask.flags.writeable = False
+            self.cache.put(position3D, versions, masks)
+        return masks
+
+    def can_see(self, start, end):
+        """Returns whether the end position can be seen from the start position. Positions outside of the map can't be seen."""
+        width, height, max_height = self._map.width, self._map.height, self._map._max_height
+        if not all(0 <= start[i] < size and 0 <= end[i] < size for i, size in enumerate((width, height, max_height))):
+            return False
+        return bool(self.get_visibility(start)[int(end[0]), int(end[1]), int(end[2])])
+
+    def _compute(self, position3D):
+        layer = self._map.traversal
+        width, height, max_height = self._map.width, self._map.height, self._map._max_height
+        vx, vy, vh = position3D
+
+        # Positions below the ground of their tile are solid, walls are looked up by flat [x, y, height] index
+        solid = (np.arange(max_height)[None, None, :] < layer.ground[:, :, None]).ravel()
+        has_walls = layer.wall_x.any() or layer.wall_y.any()
+        wall_x, wall_y = layer.wall_x.ravel(), layer.wall_y.ravel()
+        def flat(x, y, h):
+            return (x * height + y) * max_height + h
+
+        xs, ys, hs = np.meshgrid(np.arange(width), np.arange(height), np.arange(max_height), indexing = "ij")
+        dx, dy, dh = (xs - vx).ravel(), (ys - vy).ravel(), (hs - vh).ravel()
+        # Every line advances at most one tile along each axis per step, lines are sorted by length so the lines
+        # still being stepped through are always the end of the arrays
+        steps = np.maximum(np.maximum(np.abs(dx), np.abs(dy)), np.abs(dh))
+        order = np.argsort(steps, kind = "stable")
+        dx, dy, dh, steps = dx[order], dy[order], dh[order], steps[order]
+        total_steps = int(steps[-1]) if steps.size else 0
+
+        blocked = np.zeros(steps.shape, dtype = bool)
+        reached = np.ones(steps.shape, dtype = bool)
+        px, py, ph = np.full(steps.shape, vx), np.full(steps.shape, vy), np.full(steps.shape, vh)
+        for step in range(1, total_steps + 1):
+            first = int(np.searchsorted(steps, step))
+            fraction = step / steps[first:]
+            nx = np.floor(vx + dx[first:] * fraction + 0.5).astype(np.int64)
+            ny = np.floor(vy + dy[first:] * fraction + 0.5).astype(np.int64)
+            nh = np.floor(vh + dh[first:] * fraction + 0.5).astype(np.int64)
+            line_blocked = np.zeros(nx.shape, dtype = bool)
+            if has_walls:
+                # A wall blocks the line if it is impassable at the heights before and after crossing it
+                cx, cy, ch = px[first:], py[first:], ph[first:]
+                left, top = np.minimum(cx, nx), np.minimum(cy, ny)
+                crosses_x, crosses_y = cx != nx, cy != ny
+                def crossing(walls, wx, wy):
+                    return walls[flat(wx, wy, ch)] & walls[flat(wx, wy, nh)]
+                # Diagonal steps pass a corner, and are only blocked if both ways around it are
+                x_first = (crosses_x & crossing(wall_x, left, cy)) | (crosses_y & crossing(wall_y, nx, top))
+                y_first = (crosses_y & crossing(wall_y, cx, top)) | (crosses_x & crossing(wall_x, left, ny))
+                line_blocked |= np.where(crosses_x & crosses_y, x_first & y_first, x_first | y_first)
+
+            # Lines ending at a solid position still reach it, as long as nothing blocked them before
+            ending = steps[first:] == step
+            reached[first:][ending] = ~(blocked[first:][ending] | line_blocked[ending])
+            blocked[first:] |= line_blocked | solid[flat(nx, ny, nh)]
+            px[first:], py[first:], ph[first:] = nx, ny, nh
+
+        visible, reached_positions = np.empty(steps.shape, dtype = bool), np.empty(steps.shape, dtype = bool)
+        visible[order] = ~blocked
+        reached_positions[order] = reached
+        return visible.reshape((width, height, max_height)), reached_positions.reshape((width, height, max_height))
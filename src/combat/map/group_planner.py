@@ -0,0 +1,233 @@
+import heapq
+from src.combat.map.movement_profile import MovementProfile
+
+class GroupPlanner:
+    """
+    Plans the moves of several tokens at once so their paths never collide, using cooperative A*.
+    Tokens are planned one at a time in the given order, each with a space-time A* that avoids the cells reserved by
+    the tokens planned before it, and then reserves the cells of its own path at each step of time.
+
+    Search state is shared between the tokens: all tokens with the same movement profile use a single distance field
+    toward all of the goals as their heuristic, and a single traversal context, so adding tokens to a move mostly adds
+    the cost of their own space-time searches.
+    """
+    # Cost in feet of waiting in place for one step, so waiting is only done when moving isn't possible
+    WAIT_COST = 5
+    # Extra steps of time a token may spend waiting for others to pass, on top of the steps needed to reach its goal
+    WAIT_STEPS = 4
+
+    def __init__(self, navigation, moves: list, max_steps: int = None):
+        """
+        param navigation: NavigationHandler - the navigation of the map
+        param moves: list[tuple] - the (token, end position) of each token to move, in the order they are planned
+        param max_steps (optional): int - the most steps of time a single path may take, by default based on the distance to its goal
+        """
+        self._navigation = navigation
+        self._map = navigation._map
+        self._graph = navigation._graph
+        self._moves = moves
+        self._max_steps = max_steps
+        # Tokens in the group are avoided with reservations instead, other tokens are costed like in any other query
+        group = {id(token) for token, _ in moves}
+        self._occupied = {cell for cell in self._map.get_occupied_cells() if any(id(other) not in group for other in self._map.get_tokens(*cell))}
+        self._contexts = {}
+        self._fields = {}
+        self.replans = 0
+        self._clear_reservations()
+
+    def _clear_reservations(self):
+        # Maps (x, y, time) to the token using the cell at that time, and (x, y) to the token standing there for good and the time it starts to
+        self._reserved = {}
+        self._held_from = {}
+        self._holder = {}
+        # Maps (x, y) to the last time it is reserved by a token's path
+        self._last_reserved = {}
+        # (x, y, x, y, time) of the steps taken from time to time + 1, to stop tokens from swapping places or crossing diagonally
+        self._steps = set()
+
+    def _footprint(self, token, x, y):
+        return [(x + dx, y + dy) for dx in range(token.diameter) for dy in range(token.diameter)]
+
+    def _is_free(self, token, x, y, time):
+        for cell in self._footprint(token, x, y):
+            if not (0 <= cell[0] < self._map.width and 0 <= cell[1] < self._map.height):
+                return False
+            owner = self._reserved.get((cell[0], cell[1], time))
+            if owner is not None and owner is not token:
+                return False
+            if self._held_from.get(cell, float('inf')) <= time and self._holder.get(cell) is not token:
+                return False
+        return True
+
+    def _is_free_from(self, token, x, y, time):
+        """Returns whether the token can stay at the given position from the given time on, without blocking tokens planned before it."""
+        for cell in self._footprint(token, x, y):
+            if self._last_reserved.get(cell, -1) >= time:
+                return False
+        return self._is_free(token, x, y, time)
+
+    def _hold(self, token, position, time):
+        for cell in self._footprint(token, position[0], position[1]):
+            self._held_from[cell] = time
+            self._holder[cell] = token
+
+    def _reserve_start(self, token):
+        x, y, _ = token.get_position()
+        for cell in self._footprint(token, x, y):
+            self._reserved[(cell[0], cell[1], 0)] = token
+
+    def _reserve(self, token, path: list):
+        for time, position in enumerate(path):
+            for cell in self._footprint(token, position[0], position[1]):
+                self._reserved[(cell[0], cell[1], time)] = token
+                self._last_reserved[cell] = max(self._last_reserved.get(cell, -1), time)
+            if time > 0:
+                previous = path[time - 1]
+                self._steps.add((previous[0], previous[1], position[0], position[1], time - 1))
+        self._hold(token, path[-1], len(path) - 1)
+
+    def plan(self):
+        """
+        Returns the planned path of each token, in the order of the moves.
+        Paths list the position of the token at each step of time, so a token waiting for another to pass repeats its position.
+        A token that can't reach its end position stays where it is, and the other tokens are planned again around it.
+
+        returns: list - the Path of each token, or None if the token can't reach its end position without colliding
+        """
+        stuck = set()
+        while True:
+            self._clear_reservations()
+            for token, _ in self._moves:
+                if id(token) in stuck:
+                    self._hold(token, token.get_position(), 0)
+                else:
+                    self._reserve_start(token)
+
+            plans = []
+            for token, end in self._moves:
+                if id(token) in stuck:
+                    plans.append(None)
+                    continue
+                path, distance = self._search(token, tuple(token.get_position()), tuple(end))
+                if path is not None:
+                    self._reserve(token, path)
+                    plans.append(self._navigation.Path(path, distance))
+                    continue
+                stuck.add(id(token))
+                x, y, _ = token.get_position()
+                if any(self._last_reserved.get(cell, -1) > 0 for cell in self._footprint(token, x, y)):
+                    # The tokens planned before pass through the start of the stuck token after it was meant to leave
+                    break
+                self._hold(token, token.get_position(), 0)
+                plans.append(None)
+            else:
+                return plans
+            self.replans += 1
+
+    def _context(self, profile):
+        key = profile.with_distance_moved(0)
+        if key not in self._contexts:
+            self._contexts[key] = self._navigation.TraversalContext(self._map, key, occupied = self._occupied)
+        return self._contexts[key]
+
+    def _field(self, context):
+        """Returns the distance from every node to the nearest goal of any token, which never overestimates the distance to a token's own goal."""
+        key = context.profile
+        if key not in self._fields:
+            goal_ids = sorted({self._graph.node_id(tuple(end)) for _, end in self._moves} - {None})
+            versions = (self._map.version, self._map.occupancy_version)
+            cache_key = ("group field", tuple(goal_ids), key, frozenset(id(token) for token, _ in self._moves))
+            field = self._navigation.cache.get(cache_key, versions)
+            if field is None:
+                field = self._navigation._search_field(context, goal_ids)
+                self._navigation.cache.put(cache_key, versions, field)
+            self._fields[key] = field.distances.tolist()
+        return self._fields[key]
+
+    def _search(self, token, start, end):
+        """
+        Runs A* over (node, time) states from the start to the end position, avoiding reserved cells.
+
+        returns: tuple[list, int] - the position at each step of time and the distance moved, or (None, None) if the end can't be reached
+        """
+        start_id, goal_id = self._graph.node_id(start), self._graph.node_id(end)
+        if start_id is None or goal_id is None:
+            return None, None
+
+        profile = MovementProfile.from_statblock(token)
+        context = self._context(profile)
+        positions, offsets, targets, lengths, blocked, node_layers = self._graph.search_lists()
+        field = self._field(context)
+        layers = context.layers
+        get_traversal_distance = self._navigation._get_traversal_distance
+
+        # Every step but the last starts with speed left, so a state whose distance to the nearest goal overruns the
+        # fastest speed of the token by more than the costliest possible step can't reach its goal
+        already_moved = profile.distance_moved
+        costliest_step = self._navigation.TILE_VERT_DIAGONAL * (1 + max(2, int(self._map.traversal.multiplier.max())))
+        speed_limit = max(profile.walk, profile.fly, profile.swim, profile.climb, profile.burrow) + costliest_step
+        if already_moved + field[start_id] >= speed_limit:
+            return None, None
+        # Searching space and time for an end position that can't be reached at all would go through every state, so check that first
+        own_context = self._navigation.TraversalContext(self._map, profile, occupied = self._occupied)
+        if self._navigation._search(own_context, start_id, goal_id = goal_id)[1][goal_id] is None:
+            return None, None
+        max_steps = self._max_steps
+        if max_steps is None:
+            max_steps = int(field[start_id] // self._navigation.TILE_SIZE) + GroupPlanner.WAIT_STEPS + len(self._moves)
+
+        # States are (node id, time), with the cost (movement plus waiting) and distance moved to reach them.
+        # The shared context has no distance moved, so the token's own distance moved is added to the distance moved of each state
+        costs = {(start_id, 0): 0}
+        moved = {(start_id, 0): 0}
+        previous = {(start_id, 0): None}
+        queue = [(field[start_id], 0, start_id, 0)]
+        while queue:
+            _, cost, node_id, time = heapq.heappop(queue)
+            state = (node_id, time)
+            if cost > costs[state]:
+                continue
+            position = positions[node_id]
+            if node_id == goal_id and self._is_free_from(token, position[0], position[1], time):
+                path = []
+                while state is not None:
+                    path.append(positions[state[0]])
+                    state = previous[state]
+                return path[::-1], moved[(node_id, time)]
+            if time >= max_steps:
+                continue
+
+            # Waiting in place is a step to the same node
+            steps = [(node_id, None)] + [(targets[edge], edge) for edge in range(offsets[node_id], offsets[node_id + 1]) if not blocked[edge]]
+            for neighbor_id, edge in steps:
+                if not node_layers[neighbor_id] & layers:
+                    continue
+                neighbor = positions[neighbor_id]
+                if not self._is_free(token, neighbor[0], neighbor[1], time + 1):
+                    continue
+                if (neighbor[0], neighbor[1], position[0], position[1], time) in self._steps:
+                    continue
+                # Diagonal steps can't cross the other diagonal of the same square taken by another token at the same time
+                if neighbor[0] != position[0] and neighbor[1] != position[1] and (
+                        (position[0], neighbor[1], neighbor[0], position[1], time) in self._steps or
+                        (neighbor[0], position[1], position[0], neighbor[1], time) in self._steps):
+                    continue
+                if edge is None:
+                    step_cost, step_moved = GroupPlanner.WAIT_COST, 0
+                else:
+                    step_moved = get_traversal_distance(already_moved + moved[state], context, position, neighbor, lengths[edge])
+                    if step_moved is None:
+                        continue
+                    step_cost = step_moved
+
+                neighbor_moved = moved[state] + step_moved
+                if already_moved + neighbor_moved + field[neighbor_id] >= speed_limit:
+                    continue
+                neighbor_state = (neighbor_id, time + 1)
+                neighbor_cost = cost + step_cost
+                if neighbor_cost < costs.get(neighbor_state, float('inf')):
+                    costs[neighbor_state] = neighbor_cost
+                    moved[neighbor_state] = neighbor_moved
+                    previous[neighbor_state] = state
+                    heapq.heappush(queue, (neighbor_cost + field[neighbor_id], neighbor_cost, neighbor_id, time + 1))
+        return None, None
@@ -0,0 +1,270 @@
+import heapq
+
+class ClusterLayer:
+    """
+    Abstract navigation graph over square clusters of tiles, used to route long moves on large maps (HPA*).
+    Each border between two clusters gets an entrance per connected opening, and the entrances of a cluster are
+    connected by the cost of moving between them inside the cluster. A route over entrances picks the clusters a
+    move passes through, and the exact path is then searched for inside those clusters only.
+
+    Step costs are those of each step on its own, ignoring tokens and the distance already moved, since they are
+    shared by every query made with the same movement profile. Clusters are only recomputed when their tiles change.
+    """
+    DEFAULT_CLUSTER_SIZE = 8
+
+    def __init__(self, navigation, profile, cluster_size: int = DEFAULT_CLUSTER_SIZE):
+        """
+        param navigation: NavigationHandler - the navigation of the map
+        param profile: MovementProfile - the movement profile the layer is made for
+        param cluster_size: int - the width and height of a cluster in tiles
+        """
+        self._navigation = navigation
+        self._map = navigation._map
+        self._graph = navigation._graph
+        self._profile = profile.with_distance_moved(0)
+        self._cluster_size = cluster_size
+        self._clusters_x = -(-self._map.width // cluster_size)
+        self._clusters_y = -(-self._map.height // cluster_size)
+
+        # Maps a (cluster, cluster) border to its (node, node) entrance pairs, the first node in the first cluster
+        self._border_entrances = {}
+        # Maps a cluster to its entrance node ids
+        self._cluster_entrances = {}
+        # Maps an entrance node id to {node id: cost} of the entrances it connects to, inside its cluster and across borders
+        self._intra_edges = {}
+        self._inter_edges = {}
+
+        self._map_version = self._map.version
+        self._context = None
+        self.rebuilds = 0
+        self._update_clusters(self.all_clusters())
+
+    @property
+    def cluster_size(self):
+        return self._cluster_size
+
+    def all_clusters(self):
+        return [(cx, cy) for cx in range(self._clusters_x) for cy in range(self._clusters_y)]
+
+    def cluster_of(self, position3D):
+        """Returns the (cluster x, cluster y) index of the cluster containing the given position."""
+        return (position3D[0] // self._cluster_size, position3D[1] // self._cluster_size)
+
+    def cluster_bounds(self, cluster):
+        """Returns the tiles of the given cluster, format: (x0, y0, x1, y1) inclusive."""
+        cx, cy = cluster
+        size = self._cluster_size
+        return (cx * size, cy * size, min(self._map.width, (cx + 1) * size) - 1, min(self._map.height, (cy + 1) * size) - 1)
+
+    def _adjacent_clusters(self, cluster):
+        cx, cy = cluster
+        for nx, ny in ((cx - 1, cy), (cx + 1, cy), (cx, cy - 1), (cx, cy + 1)):
+            if 0 <= nx < self._clusters_x and 0 <= ny < self._clusters_y:
+                yield (nx, ny)
+
+    def _static_context(self):
+        if self._context is None:
+            self._context = self._navigation.TraversalContext(self._map, self._profile, ignore_tokens = True)
+        return self._context
+
+    def _step_cost(self, context, from_id, to_id, length):
+        positions = self._graph.search_lists()[0]
+        return self._navigation._get_traversal_distance(0, context, positions[from_id], positions[to_id], length)
+
+    def sync(self):
+        """Recomputes the clusters touched by map changes made since the layer was last synced."""
+        if self._map_version == self._map.version:
+            return
+        regions = self._map.get_dirty_regions(self._map_version)
+        self._map_version = self._map.version
+        self._context = None
+        if regions is None:
+            self._update_clusters(self.all_clusters())
+            return
+
+        dirty = set()
+        for x0, y0, x1, y1 in regions:
+            # Changes on the edge of a cluster can open or close the border with the cluster next to it
+            first = self.cluster_of((max(0, x0 - 1), max(0, y0 - 1)))
+            last = self.cluster_of((min(self._map.width - 1, x1 + 1), min(self._map.height - 1, y1 + 1)))
+            for cx in range(first[0], last[0] + 1):
+                for cy in range(first[1], last[1] + 1):
+                    dirty.add((cx, cy))
+        self._update_clusters(dirty)
+
+    def _update_clusters(self, clusters):
+        self.rebuilds += 1
+        context = self._static_context()
+        clusters = set(clusters)
+        borders = set()
+        for cluster in clusters:
+            for other in self._adjacent_clusters(cluster):
+                borders.add((min(cluster, other), max(cluster, other)))
+        for border in borders:
+            self._update_border(context, border)
+
+        affected = set(clusters)
+        for cluster in clusters:
+            affected.update(self._adjacent_clusters(cluster))
+        for cluster in affected:
+            entrances = set()
+            for other in self._adjacent_clusters(cluster):
+                for first, second in self._border_entrances.get((min(cluster, other), max(cluster, other)), []):
+                    entrances.add(first if cluster < other else second)
+            for node_id in self._cluster_entrances.get(cluster, ()):
+                if node_id not in entrances:
+                    self._intra_edges.pop(node_id, None)
+            self._cluster_entrances[cluster] = entrances
+
+            bounds = self.cluster_bounds(cluster)
+            for node_id in entrances:
+                costs = self._search_cluster(context, node_id, bounds)
+                self._intra_edges[node_id] = {other: costs[other] for other in entrances if other != node_id and other in costs}
+
+    def _update_border(self, context, border):
+        for first, second in self._border_entrances.get(border, []):
+            self._inter_edges.get(first, {}).pop(second, None)
+            self._inter_edges.get(second, {}).pop(first, None)
+
+        # Find every open (node, node) pair straight across the border, as cells of a (along the border, height) grid
+        (ax, ay), (bx, by) = border
+        a_bounds, b_bounds = self.cluster_bounds((ax, ay)), self.cluster_bounds((bx, by))
+        if ax != bx:
+            cells = [((a_bounds[2], y, h), (b_bounds[0], y, h)) for y in range(a_bounds[1], a_bounds[3] + 1) for h in range(self._map._max_height)]
+        else:
+            cells = [((x, a_bounds[3], h), (x, b_bounds[1], h)) for x in range(a_bounds[0], a_bounds[2] + 1) for h in range(self._map._max_height)]
+        open_cells = {}
+        for along, (a_position, b_position) in enumerate(cells):
+            a_id, b_id = self._graph.node_id(a_position), self._graph.node_id(b_position)
+            edge = self._edge(a_id, b_id)
+            if edge is None:
+                continue
+            forward = self._step_cost(context, a_id, b_id, self._graph.lengths[edge])
+            backward = self._step_cost(context, b_id, a_id, self._graph.lengths[edge])
+            if forward is not None or backward is not None:
+                open_cells[(along // self._map._max_height, a_position[2])] = (a_id, b_id, forward, backward)
+
+        # Each connected opening becomes one entrance, at the middle of its lowest height
+        entrances = []
+        seen = set()
+        for cell in sorted(open_cells):
+            if cell in seen:
+                continue
+            component, stack = [], [cell]
+            seen.add(cell)
+            while stack:
+                current = stack.pop()
+                component.append(current)
+                for d_along in (-1, 0, 1):
+                    for d_height in (-1, 0, 1):
+                        neighbor = (current[0] + d_along, current[1] + d_height)
+                        if neighbor in open_cells and neighbor not in seen:
+                            seen.add(neighbor)
+                            stack.append(neighbor)
+            lowest = min(height for _, height in component)
+            row = sorted(along for along, height in component if height == lowest)
+            a_id, b_id, forward, backward = open_cells[(row[len(row) // 2], lowest)]
+            entrances.append((a_id, b_id))
+            if forward is not None:
+                self._inter_edges.setdefault(a_id, {})[b_id] = forward
+            if backward is not None:
+                self._inter_edges.setdefault(b_id, {})[a_id] = backward
+        self._border_entrances[border] = entrances
+
+    def _edge(self, from_id, to_id):
+        _, offsets, targets, _, blocked, _ = self._graph.search_lists()
+        for edge in range(offsets[from_id], offsets[from_id + 1]):
+            if targets[edge] == to_id:
+                return None if blocked[edge] else edge
+        return None
+
+    def _search_cluster(self, context, source_id, bounds, reverse = False):
+        """
+        Returns {node id: cost} of moving from the source node to every node in the given bounds, without leaving them.
+        If reverse is set, returns the cost of moving from every node to the source node instead.
+        """
+        positions, offsets, targets, lengths, blocked, node_layers = self._graph.search_lists()
+        x0, y0, x1, y1 = bounds
+        get_traversal_distance = self._navigation._get_traversal_distance
+        costs = {source_id: 0}
+        queue = [(0, source_id)]
+        while queue:
+            current_cost, current_id = heapq.heappop(queue)
+            if current_cost > costs[current_id]:
+                continue
+            current_position = positions[current_id]
+            for edge in range(offsets[current_id], offsets[current_id + 1]):
+                if blocked[edge]:
+                    continue
+                neighbor_id = targets[edge]
+                if not node_layers[neighbor_id] & context.layers:
+                    continue
+                neighbor_position = positions[neighbor_id]
+                if not (x0 <= neighbor_position[0] <= x1 and y0 <= neighbor_position[1] <= y1):
+                    continue
+                if reverse:
+                    step_cost = get_traversal_distance(0, context, neighbor_position, current_position, lengths[edge])
+                else:
+                    step_cost = get_traversal_distance(0, context, current_position, neighbor_position, lengths[edge])
+                if step_cost is None:
+                    continue
+                cost = current_cost + step_cost
+                if cost < costs.get(neighbor_id, float('inf')):
+                    costs[neighbor_id] = cost
+                    heapq.heappush(queue, (cost, neighbor_id))
+        return costs
+
+    def find_corridor(self, start_id: int, goal_id: int):
+        """
+        Returns the clusters a move from the start node to the goal node should pass through, found over the entrances of the clusters.
+
+        param start_id: int - the id of the starting node
+        param goal_id: int - the id of the goal node
+
+        returns:
+            set[tuple] - the (cluster x, cluster y) of the clusters along the route
+            None - if the entrances don't connect the nodes
+        """
+        self.sync()
+        context = self._static_context()
+        positions = self._graph.search_lists()[0]
+        start_cluster, goal_cluster = self.cluster_of(positions[start_id]), self.cluster_of(positions[goal_id])
+
+        # Temporarily connect the start and goal nodes to the entrances of their clusters
+        start_costs = self._search_cluster(context, start_id, self.cluster_bounds(start_cluster))
+        start_edges = {node_id: start_costs[node_id] for node_id in self._cluster_entrances.get(start_cluster, ()) if node_id in start_costs}
+        goal_costs = self._search_cluster(context, goal_id, self.cluster_bounds(goal_cluster), reverse = True)
+        goal_edges = {node_id: goal_costs[node_id] for node_id in self._cluster_entrances.get(goal_cluster, ()) if node_id in goal_costs}
+
+        goal = positions[goal_id]
+        estimate_distance = self._navigation.estimate_distance
+        costs = {start_id: 0}
+        previous = {start_id: None}
+        queue = [(estimate_distance(positions[start_id], goal), 0, start_id)]
+        while queue:
+            _, current_cost, current_id = heapq.heappop(queue)
+            if current_cost > costs[current_id]:
+                continue
+            if current_id == goal_id:
+                break
+            if current_id == start_id:
+                edges = start_edges.items()
+            else:
+                edges = list(self._intra_edges.get(current_id, {}).items()) + list(self._inter_edges.get(current_id, {}).items())
+                if current_id in goal_edges:
+                    edges.append((goal_id, goal_edges[current_id]))
+            for neighbor_id, step_cost in edges:
+                cost = current_cost + step_cost
+                if cost < costs.get(neighbor_id, float('inf')):
+                    costs[neighbor_id] = cost
+                    previous[neighbor_id] = current_id
+                    heapq.heappush(queue, (cost + estimate_distance(positions[neighbor_id], goal), cost, neighbor_id))
+
+        if goal_id not in previous:
+            return None
+        corridor = set()
+        current = goal_id
+        while current is not None:
+            corridor.add(self.cluster_of(positions[current]))
+            current = previous[current]
+        return corridor
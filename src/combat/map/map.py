@@ -1,12 +1,23 @@
 import json
+import numpy as np
+from collections import deque
 from src.stats.statblock import Statblock
+from src.combat.map.cover import CoverEngine
+from src.combat.map.field_of_view import FieldOfView
 from src.combat.map.map_token import Token
 from src.combat.map.map_tile import MapTile
 from src.combat.map.map_tile_wall import MapTileWall
+from src.combat.map.spatial_hash import SpatialHash
+from src.combat.map.threat_map import ThreatMap
+from src.combat.map.traversal_layer import TraversalLayer
+from src.events.observer import Observer
+from src.util.constants import EventType
 from server.backend.database.util.data_storer import DataStorer
 
-class Map(DataStorer):
+class Map(DataStorer, Observer):
     TILE_SIZE = 5
+    # Amount of dirty regions kept for structures catching up with map changes, older changes require a full rebuild
+    MAX_TRACKED_CHANGES = 256
 
     def __init__(self, width: int, height: int, max_height: int = 1):
         super().__init__()
@@ -20,6 +31,16 @@ class Map(DataStorer):
         self._tokens = []
         self._map_props = []
 
+        # Maps (x, y) to the tokens with a footprint covering it, and statblock ids to tokens and their index in _tokens
+        self._occupancy = {}
+        self._occupied_cells = {}
+        self._tokens_by_id = {}
+        self._token_indices = {}
+        # Incremented whenever a token is added or moves
+        self._occupancy_version = 0
+        self._threats = ThreatMap(self)
+        self._spatial_hash = SpatialHash(Map.TILE_SIZE)
+
         for y in range(self._height):
             self._tiles.append([])
             for x in range(self._width):
@@ -40,6 +61,20 @@ class Map(DataStorer):
                 tile._wall_right = MapTileWall(height = max_height)
 
                 self._tiles[y].append(tile)
+
+        self._connect_tiles(self._tiles)
+        self._traversal = TraversalLayer(self)
+        self._field_of_view = FieldOfView(self)
+        self._cover = CoverEngine(self)
+        # Incremented on every change to tiles or walls, with the (version, region) of recent changes
+        self._version = 0
+        self._changes = deque(maxlen = Map.MAX_TRACKED_CHANGES)
+
+        # Exported data of each tile, indexed by [y][x] and refreshed for the regions that changed since the version it was made for
+        self._tile_view_data = None
+        self._tile_view_version = None
+        # Maps a statblock id to {(x, y): tile data} of the tiles it has seen, as they were when it last saw them
+        self._remembered_tiles = {}
         
         def _export_tile_data(v):
             tile_list = []
@@ -57,6 +92,12 @@ class Map(DataStorer):
                 new_tile._wall_bottom = MapTileWall.new_from_data(tile_data["wall_bottom"])
                 new_tile._wall_right = MapTileWall.new_from_data(tile_data["wall_right"])
                 tiles[new_tile.y][new_tile.x] = new_tile
+            self._connect_tiles(tiles)
+            self._tiles = tiles
+            self._traversal = TraversalLayer(self)
+            self._version += 1
+            self._changes.clear()
+            self._remembered_tiles.clear()
             return tiles
 
         def _import_token_data(df, v):
@@ -64,12 +105,13 @@ class Map(DataStorer):
             for token_data in v:
                 statblock = Statblock(id = token_data["statblock_id"])
                 tokens.append(Token(statblock, (token_data["x"], token_data["y"], token_data["height"]), self))
+            self._rebuild_token_index(tokens)
             return tokens
 
         self.map_data_property("_width", "width")
         self.map_data_property("_height", "height")
         self.map_data_property("_max_height", "max_height")
-        self.map_data_property("_tiles", "tiles", export_function = _export_tile_data, import_function = _import_tile_data, import_reliant_properties = ["_width", "_height"])
+        self.map_data_property("_tiles", "tiles", export_function = _export_tile_data, import_function = _import_tile_data, import_reliant_properties = ["_width", "_height", "_max_height"])
         # self.map_data_property("_walls", "walls")
         self.map_data_property("_tokens", "tokens",
             export_function = lambda v: [token.export_data() for token in v],
@@ -77,6 +119,79 @@ class Map(DataStorer):
         )
         self.map_data_property("_map_props", "map_props")
     
+    def _connect_tiles(self, tiles: list):
+        # Maps each wall to the (x, y) of the tiles on either side of it
+        self._wall_cells = {}
+        for row in tiles:
+            for tile in row:
+                tile.connect(self)
+                for wall in (tile._wall_top, tile._wall_left, tile._wall_bottom, tile._wall_right):
+                    if id(wall) not in self._wall_cells:
+                        self._wall_cells[id(wall)] = []
+                        wall.connect(self)
+                    self._wall_cells[id(wall)].append(tile.position)
+
+    def signal(self, event: str, *data):
+        if event == EventType.MAP_TILE_CHANGED:
+            tile = data[0]
+            self._traversal.update_tile(tile.x, tile.y)
+            self._mark_dirty(tile.x - 1, tile.y - 1, tile.x + 1, tile.y + 1)
+        elif event == EventType.MAP_WALL_CHANGED:
+            cells = self._wall_cells.get(id(data[0]), [])
+            if not cells:
+                return
+            self._traversal.update_walls(cells)
+            xs, ys = [cell[0] for cell in cells], [cell[1] for cell in cells]
+            self._mark_dirty(min(xs), min(ys), max(xs), max(ys))
+
+    def _mark_dirty(self, x0: int, y0: int, x1: int, y1: int):
+        self._version += 1
+        self._changes.append((self._version, (max(0, x0), max(0, y0), min(self._width - 1, x1), min(self._height - 1, y1))))
+
+    @property
+    def traversal(self):
+        return self._traversal
+
+    @property
+    def field_of_view(self):
+        return self._field_of_view
+
+    @property
+    def cover(self):
+        return self._cover
+
+    @property
+    def spatial_hash(self):
+        return self._spatial_hash
+
+    @property
+    def threats(self):
+        return self._threats
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def occupancy_version(self):
+        return self._occupancy_version
+
+    def get_dirty_regions(self, since_version: int):
+        """
+        Returns the regions of the map that changed after the given version.
+
+        param since_version: int - the version of the map that was last seen
+
+        returns:
+            list[tuple] - the changed regions, format: (x0, y0, x1, y1) inclusive
+            None - if changes that old are no longer tracked, and everything should be treated as changed
+        """
+        if since_version == self._version:
+            return []
+        if not self._changes or self._changes[0][0] > since_version + 1:
+            return None
+        return [region for version, region in self._changes if version > since_version]
+
     @property
     def width(self):
         return self._width
@@ -85,7 +200,79 @@ class Map(DataStorer):
     def height(self):
         return self._height
 
-    def export_view_data(self, statblock_id):
+    def _export_tile_view(self, tile):
+        tile_data = {
+            "x": tile.x,
+            "y": tile.y,
+            "height": tile.height,
+            "max_depth": tile._max_depth,
+            "swimmable": tile.swimmable,
+            "terrain_difficulty": tile.terrain_difficulty,
+            "walls": {
+                "top": tile.get_wall(MapTileWall.WallDirection.TOP).export_data(),
+                "left": tile.get_wall(MapTileWall.WallDirection.LEFT).export_data()
+            }
+        }
+        if tile.x >= self._width - 1:
+            tile_data["walls"]["right"] = tile.get_wall(MapTileWall.WallDirection.RIGHT).export_data()
+        if tile.y >= self._height - 1:
+            tile_data["walls"]["bottom"] = tile.get_wall(MapTileWall.WallDirection.BOTTOM).export_data()
+        return tile_data
+
+    def _get_tile_view_data(self):
+        """Returns the exported data of each tile indexed by [y][x], only exporting the tiles that changed since the last call again."""
+        if self._tile_view_version == self._version:
+            return self._tile_view_data
+        regions = self.get_dirty_regions(self._tile_view_version) if self._tile_view_data is not None else None
+        if regions is None:
+            self._tile_view_data = [[self._export_tile_view(tile) for tile in row] for row in self._tiles]
+        else:
+            # New dicts are made for changed tiles, so tiles remembered by statblocks keep how they looked when they were seen
+            for x0, y0, x1, y1 in regions:
+                for y in range(y0, y1 + 1):
+                    for x in range(x0, x1 + 1):
+                        self._tile_view_data[y][x] = self._export_tile_view(self._tiles[y][x])
+        self._tile_view_version = self._version
+        return self._tile_view_data
+
+    def _export_token_view(self, token):
+        return {
+            "x": token.get_position()[0],
+            "y": token.get_position()[1],
+            "height": token.get_position()[2],
+            "id": token.statblock_id,
+            "name": token.get_name(),
+            "diameter": token.diameter
+        }
+
+    def get_visible_tiles(self, position3D, view_range: int = None):
+        """
+        Returns which tiles can be seen from the given position, at any height or by their side or top.
+
+        param position3D: tuple - the position to look from, format: (x, y, height)
+        param view_range (optional): int - the furthest distance in feet that can be seen, unlimited if not given
+
+        returns: np.ndarray - bool mask of the visible tiles, indexed by [x, y]
+        """
+        visible = self._field_of_view.get_reached(position3D).any(axis = 2)
+        if view_range is not None:
+            xs, ys = np.meshgrid(np.arange(self._width), np.arange(self._height), indexing = "ij")
+            distances = np.sqrt((xs - position3D[0]) ** 2 + (ys - position3D[1]) ** 2).astype(int) * Map.TILE_SIZE
+            visible &= distances <= view_range
+        return visible
+
+    def export_view_data(self, statblock_id, view_range: int = None):
+        """
+        Returns the map as seen by the token of the given statblock.
+        Tiles it can see are exported as they are now, and tiles it has seen before as they were when it last saw them,
+        each marked with whether it is visible. Only the tokens it can see are exported.
+        Statblocks without a token on the map see the whole map.
+
+        param statblock_id: str - the id of the statblock viewing the map
+        param view_range (optional): int - the furthest distance in feet the statblock can see, unlimited if not given
+
+        returns: dict - the view data of the map
+        """
         view_data = {
             "width": self._width,
             "height": self._height,
@@ -93,61 +280,175 @@ class Map(DataStorer):
             "tiles": [],
             "tokens": []
         }
-        
-        # TODO: Limit tiles and tokens to the statblock's view range
-        for y in range(self._height):
-            for x in range(self._width):
-                tile = self._tiles[y][x]
-                tile_data = {
-                    "x": tile.x,
-                    "y": tile.y,
-                    "height": tile.height,
-                    "max_depth": tile._max_depth,
-                    "swimmable": tile.swimmable,
-                    "terrain_difficulty": tile.terrain_difficulty,
-                    "walls": {
-                        "top": tile.get_wall(MapTileWall.WallDirection.TOP).export_data(),
-                        "left": tile.get_wall(MapTileWall.WallDirection.LEFT).export_data()
-                    }
-                }
-                if x >= self._width - 1:
-                    tile_data["walls"]["right"] = tile.get_wall(MapTileWall.WallDirection.RIGHT).export_data()
-                if y >= self._height - 1:
-                    tile_data["walls"]["bottom"] = tile.get_wall(MapTileWall.WallDirection.BOTTOM).export_data()
-                view_data["tiles"].append(tile_data)
-        
+        tile_view_data = self._get_tile_view_data()
+
+        viewer = self.get_token_by_id(statblock_id)
+        if viewer is None:
+            view_data["tiles"] = [tile_data for row in tile_view_data for tile_data in row]
+            view_data["tokens"] = [self._export_token_view(token) for token in self._tokens]
+            return view_data
+
+        visible = self.get_visible_tiles(viewer.get_position(), view_range)
+        visible_cells = list(zip(*np.nonzero(visible)))
+        remembered = self._remembered_tiles.setdefault(statblock_id, {})
+        for x, y in visible_cells:
+            remembered[(int(x), int(y))] = tile_view_data[y][x]
+
+        for x, y in sorted(remembered, key = lambda cell: (cell[1], cell[0])):
+            view_data["tiles"].append({**remembered[(x, y)], "visible": bool(visible[x, y])})
+
+        heights = self._field_of_view.get_visibility(viewer.get_position())
         for token in self._tokens:
-            view_data["tokens"].append({
-                "x": token.get_position()[0],
-                "y": token.get_position()[1],
-                "height": token.get_position()[2],
-                "id": token.statblock_id,
-                "name": token.get_name(),
-                "diameter": token.diameter
-            })
-        
+            if token is not viewer:
+                token_height = min(max(0, token.height), self._max_height - 1)
+                cells = self._occupied_cells.get(id(token), [tuple(token.get_position()[:2])])
+                if not any(0 <= x < self._width and 0 <= y < self._height and visible[x, y] and heights[x, y, token_height] for x, y in cells):
+                    continue
+            view_data["tokens"].append(self._export_token_view(token))
+
         return view_data
 
     def add_token(self, token):
         self._tokens.append(token)
         token._map = self
+        self._index_token(token, len(self._tokens) - 1)
+
+    def _index_token(self, token, index: int):
+        self._tokens_by_id.setdefault(token.statblock_id, token)
+        self._token_indices.setdefault(token.statblock_id, index)
+        self._occupy(token)
+
+    def _rebuild_token_index(self, tokens: list):
+        self._occupancy = {}
+        self._occupied_cells = {}
+        self._tokens_by_id = {}
+        self._token_indices = {}
+        self._spatial_hash.clear()
+        for index, token in enumerate(tokens):
+            self._index_token(token, index)
+
+    def _occupy(self, token):
+        self._occupancy_version += 1
+        cells = [tuple(token.get_position()[:2])] + [tuple(extension.get_position()[:2]) for extension in token._extensions.values()]
+        self._occupied_cells[id(token)] = cells
+        for cell in cells:
+            self._occupancy.setdefault(cell, []).append(token)
+        self._spatial_hash.update(token, cells)
+
+    def _vacate(self, token):
+        for cell in self._occupied_cells.pop(id(token), []):
+            occupants = self._occupancy[cell]
+            occupants.remove(token)
+            if not occupants:
+                del self._occupancy[cell]
+
+    def update_token_position(self, token):
+        """
+        Updates the occupancy index after a token on the map has moved. Called by Token.set_position.
+
+        param token: Token - the token that moved
+        """
+        if id(token) not in self._occupied_cells:
+            return
+        self._vacate(token)
+        self._occupy(token)
 
     def get_tokens(self, x: int = None, y: int = None):
         if x is None and y is None:
             return self._tokens
-        return [token for token in self._tokens if token.get_position()[2:] == (x, y)]
+        return list(self._occupancy.get((x, y), ()))
+
+    def is_occupied(self, x: int, y: int, ignore = None):
+        """
+        Returns whether any token's footprint covers the given tile.
+
+        param x: int - the x position of the tile
+        param y: int - the y position of the tile
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not count, such as the one that is moving
+
+        returns: bool - whether the tile is occupied
+        """
+        return any(token is not ignore and token._statblock is not ignore for token in self._occupancy.get((x, y), ()))
     
+    def get_occupied_cells(self, ignore = None):
+        """
+        Returns the set of (x, y) tiles covered by any token's footprint.
+
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not count, such as the one that is moving
+
+        returns: set[tuple] - the occupied tiles
+        """
+        return {cell for cell in self._occupancy if self.is_occupied(*cell, ignore = ignore)}
+
+    def get_tokens_in_area(self, area, line_of_effect: bool = False, ignore = None):
+        """
+        Returns the tokens with any part of their footprint inside an area of effect, found from the tiles in the occupancy index.
+
+        param area: AreaOfEffect - the area of effect
+        param line_of_effect (optional): bool - whether to only include tokens seen from the point of origin, which walls and raised ground block
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include, such as the one creating the area
+
+        returns: list[Token] - the tokens inside the area, in map order
+        """
+        cells = [(x, y, token) for (x, y), tokens in self._occupancy.items() for token in tokens
+                 if token is not ignore and token._statblock is not ignore]
+        if not cells:
+            return []
+        xs = np.array([x for x, _, _ in cells])
+        ys = np.array([y for _, y, _ in cells])
+        hs = np.array([token.get_position()[2] for _, _, token in cells])
+        inside = area.contains(xs, ys, hs, self.TILE_SIZE)
+        if line_of_effect:
+            origin = area.origin
+            if not all(0 <= origin[i] < size for i, size in enumerate((self._width, self._height, self._max_height))):
+                return []
+            visible = self._field_of_view.get_visibility(origin)
+            inside &= visible[xs, ys, np.clip(hs, 0, self._max_height - 1)]
+
+        affected = {id(cells[index][2]) for index in np.flatnonzero(inside)}
+        return [token for token in self._tokens if id(token) in affected]
+
+    def get_tokens_in_range(self, position3D, distance: int, ignore = None):
+        """
+        Returns the tokens within a distance of a position, closest first, only looking at the tokens near it.
+
+        param position3D: tuple - the position to measure from, format: (x, y, height)
+        param distance: int - the distance in feet
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include, such as the one measuring from its own position
+
+        returns: list[Token] - the tokens in range
+        """
+        return [token for _, token in self._spatial_hash.get_in_radius(position3D, distance, ignore)]
+
+    def get_nearest_tokens(self, position3D, count: int, max_distance: int = None, ignore = None):
+        """
+        Returns the closest tokens to a position, only looking at the tokens near it.
+
+        param position3D: tuple - the position to measure from, format: (x, y, height)
+        param count: int - the most tokens to return
+        param max_distance (optional): int - the furthest distance in feet a token may be at
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include
+
+        returns: list[Token] - up to count tokens, closest first
+        """
+        return [token for _, token in self._spatial_hash.get_nearest(position3D, count, max_distance, ignore)]
+
+    def get_tokens_in_bounds(self, x0: int, y0: int, x1: int, y1: int, ignore = None):
+        """
+        Returns the tokens with any part of their footprint inside the given tiles, only looking at the tokens near them.
+
+        param x0, y0, x1, y1: int - the bounds of the tiles, inclusive
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include
+
+        returns: list[Token] - the tokens in the bounds, in the order they were added to the map
+        """
+        return self._spatial_hash.get_in_bounds(x0, y0, x1, y1, ignore)
+
     def get_token_index(self, statblock_id: str):
-        for index, token in enumerate(self._tokens):
-            if token.statblock_id == statblock_id:
-                return index
-        return None
+        return self._token_indices.get(statblock_id)
 
     def get_token_by_id(self, statblock_id: str):
-        for token in self._tokens:
-            if token.statblock_id == statblock_id:
-                return token
-        return None
+        return self._tokens_by_id.get(statblock_id)
 
     def get_token_spaces(self):
         tokens_and_extensions = []
@@ -160,7 +461,7 @@ class Map(DataStorer):
     def get_map_props(self, x: int = None, y: int = None):
         if x is None and y is None:
             return self._map_props
-        return [map_prop for map_prop in self._map_props if map_prop.get_position()[2:] == (x, y)]
+        return [map_prop for map_prop in self._map_props if map_prop.get_position()[:2] == (x, y)]
 
     def get_tile(self, x: int, y: int):
         if x < 0 or x >= self._width or y < 0 or y >= self._height:
@@ -171,6 +472,11 @@ class Map(DataStorer):
         return [tile for row in self._tiles for tile in row]
 
     def get_climb_dc(self, position):
+        x, y, height = position
+        dc = self._traversal.climb_dc[x, y, height]
+        return None if dc == TraversalLayer.NO_CLIMB else int(dc)
+
+    def _compute_climb_dc(self, position):
         x, y, height = position
         tile = self.get_tile(x, y)
         dc_list = []
@@ -1,6 +1,15 @@
 from __future__ import annotations
 import heapq
+import numpy as np
+from collections import OrderedDict
+from collections.abc import Mapping
 from src.combat.map.map import Map
+from src.combat.map.movement_profile import MovementProfile
+from src.combat.map.group_planner import GroupPlanner
+from src.combat.map.hierarchical_navigation import ClusterLayer
+from src.combat.map.navigation_graph import NavigationGraph
+from src.combat.map.path_cache import PathCache
+from src.combat.map.traversal_layer import TraversalLayer
 
 class NavigationHandler:
     # Tile size in feet.
@@ -9,26 +18,43 @@ class NavigationHandler:
     TILE_DIAGONAL = int(TILE_SIZE * 1.414)
     TILE_VERT_DIAGONAL = int(TILE_SIZE * 1.732)
 
+    # Movement profile of distance fields made without a statblock, which can walk any distance
+    FIELD_PROFILE = MovementProfile(walk = float('inf'))
+
+    # Amount of movement profiles a ClusterLayer is kept for
+    MAX_CLUSTER_LAYERS = 4
+
     def __init__(self, map: Map):
         self._map = map
+        self.cache = PathCache()
+        self._cluster_layers = OrderedDict()
+        self._build_graph()
+
+    def _build_graph(self):
+        self._graph = NavigationGraph(self._map.width, self._map.height, self._map._max_height,
+            NavigationHandler.TILE_SIZE, NavigationHandler.TILE_DIAGONAL, NavigationHandler.TILE_VERT_DIAGONAL)
+        self._graph.update_blocked(self._map.traversal)
+        self._graph.update_node_layers(self._map.traversal)
+        self._map_version = self._map.version
+        self._cluster_layers.clear()
+
+    def sync(self):
+        """
+        Brings the navigation graph up to date with changes made to the map since it was last synced.
+        Only the edges around the changed regions are recomputed, unless the changes are too old to be tracked.
+        Called before every query, so it only needs to be called directly to control when the work is done.
+        """
+        if self._map_version == self._map.version:
+            return
+        regions = self._map.get_dirty_regions(self._map_version)
+        if regions is None:
+            self._build_graph()
+            return
+        for region in regions:
+            self._graph.update_blocked(self._map.traversal, region)
+            self._graph.update_node_layers(self._map.traversal, region)
+        self._map_version = self._map.version
 
-        self._node_graph = {}
-
-        for x in range(self._map.width):
-            for y in range(self._map.height):
-                for h in range(self._map._max_height):
-                    self._node_graph[(x, y, h)] = NavNode((x, y, h))
-                    for dx in range(-1, 2):
-                        for dy in range(-1, 2):
-                            for dh in range(-1, 2):
-                                if dx == 0 and dy == 0 and dh == 0:
-                                    continue
-                                if not self._node_graph.get((x + dx, y + dy, h + dh)):
-                                    continue
-                                DISTANCES = [NavigationHandler.TILE_SIZE, NavigationHandler.TILE_DIAGONAL, NavigationHandler.TILE_VERT_DIAGONAL]
-                                distance = DISTANCES[abs(dx) + abs(dy) + abs(dh) - 1]
-                                self._node_graph[(x, y, h)].add_neighbor(self._node_graph[(x + dx, y + dy, h + dh)], distance)
-    
     class Path:
         def __init__(self, path, distance):
             self.path = path
@@ -42,70 +68,593 @@ class NavigationHandler:
         def end(self):
             return self.path[-1]
 
-    def get_all_paths(self, statblock, start):
+    class TraversalContext:
+        """
+        Movement profile and per-tile data for a single navigation query, resolved once before searching.
+        The search loop only reads from this, instead of querying the statblock and map on every edge.
+        """
+        def __init__(self, map: Map, profile: MovementProfile, mover = None, ignore_tokens = False, threat_cost = 0, occupied: set = None):
+            self.profile = profile
+            self._ground, self._swimmable, self._max_depth, self._multiplier, self._climb_dcs = map.traversal.lists()
+            if occupied is not None:
+                self._occupied = occupied
+            else:
+                self._occupied = set() if ignore_tokens else map.get_occupied_cells(ignore = mover)
+            # Node layers of the graph the profile can enter
+            self.layers = NavigationGraph.layers_for(profile)
+            # Extra cost of each token whose reach a step leaves, see ThreatMap
+            self.threat_cost = threat_cost
+            self._threats = map.threats.get_threat_sets(ignore = mover) if threat_cost else {}
+
+        def tile(self, x, y):
+            """Returns (ground height, swimmable, max depth, movement cost multiplier) of the tile at the given position."""
+            ft_mult = self._multiplier[x][y]
+            if ft_mult < 2 and (x, y) in self._occupied:
+                ft_mult = 2
+            return self._ground[x][y], self._swimmable[x][y], self._max_depth[x][y], ft_mult
+
+        def climb_dc(self, position3D):
+            x, y, height = position3D
+            dc = self._climb_dcs[x][y][height]
+            return None if dc == TraversalLayer.NO_CLIMB else dc
+
+        def threat_penalty(self, current, destination):
+            """Returns the extra cost of moving from the current position to the destination, for each token whose reach it leaves."""
+            threats = self._threats.get((current[0], current[1]))
+            if not threats:
+                return 0
+            return self.threat_cost * len(threats - self._threats.get((destination[0], destination[1]), frozenset()))
+
+    def create_context(self, statblock, profile: MovementProfile = None):
+        """
+        Returns the TraversalContext for a query made by the given statblock.
+
+        param statblock: Statblock - the statblock of the entity, or None if only a profile is given
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the statblock if not given
+
+        returns: TraversalContext - the resolved context for the query
         """
-        Returns a dictionary of all paths to other nodes from the start node with the given statblock.
+        self.sync()
+        if profile is None:
+            profile = MovementProfile.from_statblock(statblock)
+        return NavigationHandler.TraversalContext(self._map, profile, statblock)
+
+    class PathMap(Mapping):
+        """
+        Read-only mapping of every reachable position to the Path leading there, as found by a single search.
+        Only the distance and predecessor of each node are stored, the Path of a position is reconstructed when it is looked up.
+        """
+        def __init__(self, graph: NavigationGraph, distances: list, previous: list, reached: list):
+            self._graph = graph
+            self._positions = graph.search_lists()[0]
+            self._distances = distances
+            self._previous = previous
+            self._reached = reached
+
+        def _node_id(self, position3D):
+            node_id = self._graph.node_id(tuple(position3D))
+            if node_id is None or self._previous[node_id] is None:
+                return None
+            return node_id
+
+        def distance(self, position3D):
+            """
+            Returns the movement cost to the given position without building its path.
+
+            param position3D: tuple - the position, format: (x, y, height)
+
+            returns:
+                int - the movement cost in feet
+                None - if the position is unreachable
+            """
+            node_id = self._node_id(position3D)
+            return None if node_id is None else self._distances[node_id]
+
+        def costs(self):
+            """Returns a dictionary of every reachable position to its movement cost, without building any paths."""
+            return {self._positions[node_id]: self._distances[node_id] for node_id in self._reached}
+
+        def __getitem__(self, position3D):
+            node_id = self._node_id(position3D)
+            if node_id is None:
+                raise KeyError(position3D)
+            path = []
+            current = node_id
+            while current != -1:
+                path.append(self._positions[current])
+                current = self._previous[current]
+            path.reverse()
+            return NavigationHandler.Path(path, self._distances[node_id])
+
+        def __contains__(self, position3D):
+            return self._node_id(position3D) is not None
+
+        def __iter__(self):
+            return (self._positions[node_id] for node_id in self._reached)
+
+        def __len__(self):
+            return len(self._reached)
+
+        def __repr__(self):
+            return f"<PathMap {len(self._reached)} reachable>"
+
+    def get_all_paths(self, statblock, start, profile: MovementProfile = None):
+        """
+        Returns a mapping of all paths to other nodes from the start node with the given statblock.
+        Paths are only built for the positions that are looked up.
 
         param statblock: Statblock - the statblock of the entity
         param start: tuple - the starting position, format: (x, y, height)
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the statblock if not given
 
-        returns: dict[tuple, list[tuple]] - the dictionary of paths to other nodes
+        returns: PathMap - the mapping of reachable positions to their paths
         """
-        start_node = self._node_graph[start]
-        distances = {node._position3D: float('inf') for node in self._node_graph.values()}
-        previous = {node: None for node in self._node_graph.values()}
-        distances[start_node._position3D] = 0
+        distances, previous, reached, _ = self._query(statblock, start, profile)
 
-        queue = [(0, start_node)]
-        paths = {start_node._position3D: NavigationHandler.Path([start_node._position3D], 0)}
-        
+        # TODO: Remove paths with endpoints on positions which have a token on them
+
+        return NavigationHandler.PathMap(self._graph, distances, previous, reached)
+
+    class Reachable:
+        """
+        Result of a movement budget bounded search.
+        costs maps each position reachable within the budget to its movement cost in feet,
+        frontier holds the reachable positions where movement was cut short by the budget.
+        """
+        def __init__(self, costs: dict, frontier: set):
+            self.costs = costs
+            self.frontier = frontier
+
+        def __contains__(self, position3D):
+            return tuple(position3D) in self.costs
+
+        def __len__(self):
+            return len(self.costs)
+
+    def reachable_within(self, token, budget_ft, start = None, profile: MovementProfile = None):
+        """
+        Returns the positions the token can move to without spending more than the given amount of movement.
+        The search stops expanding past the budget, so its cost scales with the budget instead of the map size.
+
+        param token: Token - the token that is moving
+        param budget_ft: int - the amount of movement in feet that can be spent
+        param start (optional): tuple - the starting position, defaults to the position of the token, format: (x, y, height)
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the token if not given
+
+        returns: Reachable - the reachable positions with their costs, and the frontier positions
+        """
+        if start is None:
+            start = token.get_position()
+        distances, previous, reached, cut_edges = self._query(token, start, profile, budget = budget_ft)
+
+        positions = self._graph.search_lists()[0]
+        costs = {positions[node_id]: distances[node_id] for node_id in reached}
+        frontier = {positions[node_id] for node_id, neighbor_id in cut_edges if previous[neighbor_id] is None}
+        return NavigationHandler.Reachable(costs, frontier)
+
+    class DistanceField:
+        """
+        Movement cost from every position to the nearest of a set of source positions, with the step to take from each position to get there.
+        Distances and next steps are NumPy arrays indexed by node id, unreachable positions have an infinite distance and a next step of -1.
+        """
+        def __init__(self, graph: NavigationGraph, distances, next_steps, nearest_sources):
+            self._graph = graph
+            self.distances = distances
+            self.next_steps = next_steps
+            self.nearest_sources = nearest_sources
+
+        def _node_id(self, position3D):
+            node_id = self._graph.node_id(tuple(position3D))
+            if node_id is None:
+                raise KeyError(position3D)
+            return node_id
+
+        def distance(self, position3D):
+            """Returns the movement cost from the given position to the nearest source, or None if no source can be reached."""
+            distance = self.distances[self._node_id(position3D)]
+            return None if distance == float('inf') else int(distance)
+
+        def next_step(self, position3D):
+            """Returns the position to move to from the given position to get closer to the nearest source, or None at a source or if no source can be reached."""
+            next_id = self.next_steps[self._node_id(position3D)]
+            return None if next_id < 0 else self._graph.position(int(next_id))
+
+        def direction(self, position3D):
+            """Returns the (dx, dy, dheight) of the next step from the given position, or None if there is no next step."""
+            next_position = self.next_step(position3D)
+            if next_position is None:
+                return None
+            return tuple(next_position[i] - position3D[i] for i in range(3))
+
+        def nearest_source(self, position3D):
+            """Returns the source position closest to the given position, or None if no source can be reached."""
+            source_id = self.nearest_sources[self._node_id(position3D)]
+            return None if source_id < 0 else self._graph.position(int(source_id))
+
+        def within(self, distance):
+            """Returns the list of positions at most the given movement cost away from a source."""
+            return [self._graph.position(int(node_id)) for node_id in np.flatnonzero(self.distances <= distance)]
+
+    def get_distance_field(self, sources: list, statblock = None, profile: MovementProfile = None):
+        """
+        Returns the movement cost from every position to the nearest of the given positions, computed in a single search.
+        Costs are those of each step on its own, without limiting how far the entity can move in a turn.
+        Results are cached until the map or the position of any token changes.
+
+        param sources: list[tuple] - the positions to measure the distance to, such as the positions of enemies, format: (x, y, height)
+        param statblock (optional): Statblock - the statblock of the entity that would be moving
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the statblock if not given, unlimited walking if neither is given
+
+        returns: DistanceField - the distances and flow directions toward the sources
+        """
+        self.sync()
+        if profile is None:
+            profile = MovementProfile.from_statblock(statblock) if statblock is not None else NavigationHandler.FIELD_PROFILE
+        profile = profile.with_distance_moved(0)
+        source_ids = sorted({self._graph.node_id(tuple(source)) for source in sources} - {None})
+
+        versions = (self._map.version, self._map.occupancy_version)
+        key = ("field", tuple(source_ids), profile, id(statblock) if statblock is not None else None)
+        field = self.cache.get(key, versions)
+        if field is None:
+            context = NavigationHandler.TraversalContext(self._map, profile, statblock)
+            field = self._search_field(context, source_ids)
+            self.cache.put(key, versions, field)
+        return field
+
+    def _search_field(self, context, source_ids: list):
+        """
+        Runs a multi-source Dijkstra's algorithm toward the source nodes, following every edge in reverse.
+        Each step is costed as if no distance was moved before it, since the distance moved depends on where the entity starts.
+
+        param context: TraversalContext - the movement profile and tile data of the query
+        param source_ids: list[int] - the ids of the source nodes
+
+        returns: DistanceField - the distance field of the sources
+        """
+        positions, offsets, targets, lengths, blocked, node_layers = self._graph.search_lists()
+        distances = [float('inf')] * self._graph.node_count
+        next_steps = [-1] * self._graph.node_count
+        nearest_sources = [-1] * self._graph.node_count
+        layers = context.layers
+        queue = []
+        for source_id in source_ids:
+            distances[source_id] = 0
+            nearest_sources[source_id] = source_id
+            queue.append((0, source_id))
+        heapq.heapify(queue)
+
+        while queue:
+            current_distance, current_id = heapq.heappop(queue)
+            if current_distance > distances[current_id]:
+                continue
+
+            current_position = positions[current_id]
+            for edge in range(offsets[current_id], offsets[current_id + 1]):
+                if blocked[edge]:
+                    continue
+                neighbor_id = targets[edge]
+                if not node_layers[neighbor_id] & layers:
+                    continue
+
+                # Edges are symmetric, so this is the cost of moving from the neighbor to the current node
+                traversal_cost = self._get_traversal_distance(0, context, positions[neighbor_id], current_position, lengths[edge])
+                if traversal_cost is None:
+                    continue
+
+                distance = current_distance + traversal_cost
+                if distance < distances[neighbor_id]:
+                    distances[neighbor_id] = distance
+                    next_steps[neighbor_id] = current_id
+                    nearest_sources[neighbor_id] = nearest_sources[current_id]
+                    heapq.heappush(queue, (distance, neighbor_id))
+
+        return NavigationHandler.DistanceField(self._graph, np.array(distances), np.array(next_steps, dtype = np.int32), np.array(nearest_sources, dtype = np.int32))
+
+    class RoutePlan:
+        """
+        Route to a position that may take several turns of movement.
+        path holds every position along the route and turns the turn each position is reached on, starting at 1 for the current turn.
+        """
+        def __init__(self, path: list, turns: list, distance):
+            self.path = path
+            self.turns = turns
+            self.distance = distance
+
+        @property
+        def total_turns(self):
+            return self.turns[-1]
+
+        @property
+        def next_waypoint(self):
+            """The furthest position along the route that can be reached this turn."""
+            waypoint = self.path[0]
+            for position, turn in zip(self.path, self.turns):
+                if turn > 1:
+                    break
+                waypoint = position
+            return waypoint
+
+        def waypoints(self):
+            """Returns the position the entity ends each turn at, the last being the end of the route."""
+            waypoints = []
+            for i in range(1, len(self.path)):
+                if self.turns[i] != self.turns[i - 1]:
+                    waypoints.append(self.path[i - 1])
+            waypoints.append(self.path[-1])
+            return waypoints
+
+    def plan_route(self, statblock, start, end, profile: MovementProfile = None, max_turns: int = None):
+        """
+        Returns the route reaching the end position in the fewest turns, and using the least movement on its last turn, in a single search.
+        The first turn starts with the distance the entity has already moved, every following turn starts with its full speed.
+
+        param statblock: Statblock - the statblock of the entity
+        param start: tuple - the starting position, format: (x, y, height)
+        param end: tuple - the ending position, format: (x, y, height)
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the statblock if not given
+        param max_turns (optional): int - the maximum amount of turns to plan for, unlimited if not given
+
+        returns:
+            RoutePlan - the route to the end position
+            None - if the end position can't be reached
+        """
+        self.sync()
+        if profile is None:
+            profile = MovementProfile.from_statblock(statblock)
+        start_id, end_id = self._graph.node_id(tuple(start)), self._graph.node_id(tuple(end))
+        if start_id is None:
+            raise KeyError(start)
+        if end_id is None:
+            return None
+
+        context = NavigationHandler.TraversalContext(self._map, profile.with_distance_moved(0), statblock)
+        turns, used, previous = self._search_turns(context, start_id, end_id, profile.distance_moved, max_turns)
+        if previous[end_id] is None:
+            return None
+
+        positions = self._graph.search_lists()[0]
+        path, path_turns = [], []
+        distance = 0
+        current = end_id
+        while current != -1:
+            path.append(positions[current])
+            path_turns.append(turns[current])
+            current = previous[current]
+        path.reverse()
+        path_turns.reverse()
+        # Movement spent on each node, summed per turn
+        for i in range(1, len(path)):
+            node_id, previous_id = self._graph.node_id(path[i]), self._graph.node_id(path[i - 1])
+            if path_turns[i] == path_turns[i - 1]:
+                distance += used[node_id] - used[previous_id]
+            else:
+                distance += used[node_id]
+        return NavigationHandler.RoutePlan(path, path_turns, distance)
+
+    def _search_turns(self, context, start_id, goal_id, initial_used = 0, max_turns: int = None):
+        """
+        Runs Dijkstra's algorithm over (turn, movement used this turn) labels, starting a new turn whenever a move doesn't fit in the current one.
+        Using more movement never makes the next move cheaper, so the labels can be settled in order like distances.
+
+        param context: TraversalContext - the movement profile and tile data of the query, with no distance moved
+        param start_id: int - the id of the starting node
+        param goal_id: int - the id of the node to search toward
+        param initial_used (optional): int - the movement already used on the first turn
+        param max_turns (optional): int - the maximum turn to expand to
+
+        returns: tuple[list, list, list] - the turn, movement used on that turn and predecessor of every node (None if unreached, -1 for the start)
+        """
+        positions, offsets, targets, lengths, blocked, node_layers = self._graph.search_lists()
+        turns = [float('inf')] * self._graph.node_count
+        used = [float('inf')] * self._graph.node_count
+        previous = [None] * self._graph.node_count
+        turns[start_id], used[start_id], previous[start_id] = 1, initial_used, -1
+        layers = context.layers
+
+        queue = [(1, initial_used, start_id)]
+        while queue:
+            current_turn, current_used, current_id = heapq.heappop(queue)
+            if (current_turn, current_used) > (turns[current_id], used[current_id]):
+                continue
+            if current_id == goal_id:
+                break
+
+            current_position = positions[current_id]
+            for edge in range(offsets[current_id], offsets[current_id + 1]):
+                if blocked[edge]:
+                    continue
+                neighbor_id = targets[edge]
+                if not node_layers[neighbor_id] & layers:
+                    continue
+
+                neighbor_turn, neighbor_used = current_turn, current_used
+                traversal_cost = self._get_traversal_distance(current_used, context, current_position, positions[neighbor_id], lengths[edge])
+                if traversal_cost is None:
+                    # Out of movement for this turn, continue the move with a full turn of movement
+                    neighbor_turn, neighbor_used = current_turn + 1, 0
+                    traversal_cost = self._get_traversal_distance(0, context, current_position, positions[neighbor_id], lengths[edge])
+                    if traversal_cost is None or (max_turns is not None and neighbor_turn > max_turns):
+                        continue
+
+                neighbor_used += traversal_cost
+                if (neighbor_turn, neighbor_used) < (turns[neighbor_id], used[neighbor_id]):
+                    turns[neighbor_id], used[neighbor_id] = neighbor_turn, neighbor_used
+                    previous[neighbor_id] = current_id
+                    heapq.heappush(queue, (neighbor_turn, neighbor_used, neighbor_id))
+
+        return turns, used, previous
+
+    def plan_group_moves(self, moves: list, max_steps: int = None):
+        """
+        Returns collision free paths for several tokens moving at the same time, such as a party following its leader.
+        Tokens are planned in the given order and later tokens move around or wait for earlier ones, see GroupPlanner.
+
+        param moves: list[tuple] - the (token, end position) of each token to move, format of end position: (x, y, height)
+        param max_steps (optional): int - the most steps of time a single path may take
+
+        returns: list - the Path of each token in the order of the moves, listing its position at each step of time, or None if it can't reach its end position
+        """
+        self.sync()
+        return GroupPlanner(self, moves, max_steps).plan()
+
+    def _versions(self, threat_cost = 0):
+        """Returns the versions cached searches depend on, including the ThreatMap's if they are priced by threats."""
+        if threat_cost:
+            return (self._map.version, self._map.occupancy_version, self._map.threats.version)
+        return (self._map.version, self._map.occupancy_version)
+
+    def _query(self, statblock, start, profile: MovementProfile = None, budget = None, goal = None, threat_cost = 0):
+        """
+        Returns the result of a search from the start position, reusing a cached result of the same query when the map and tokens haven't changed.
+        A search toward a goal is answered from a cached unbounded search from the same start if there is one.
+
+        param statblock: Statblock - the statblock of the entity, or None if only a profile is given
+        param start: tuple - the starting position, format: (x, y, height)
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the statblock if not given
+        param budget (optional): int - the maximum distance to expand to
+        param goal (optional): tuple - the position to search toward, format: (x, y, height)
+        param threat_cost (optional): int - the extra cost of leaving the reach of each token, see ThreatMap
+
+        returns: tuple[list, list, list, list] - the distances, predecessors and reached ids of the search, and the edges cut by the budget (None without a budget)
+        """
+        self.sync()
+        if profile is None:
+            profile = MovementProfile.from_statblock(statblock)
+        start_id = self._graph.node_id(tuple(start))
+        if start_id is None:
+            raise KeyError(start)
+        goal_id = self._graph.node_id(tuple(goal)) if goal is not None else None
+
+        versions = self._versions(threat_cost)
+        mover = id(statblock) if statblock is not None else None
+        key = (start_id, profile, mover, budget, goal_id, threat_cost)
+        result = self.cache.get(key, versions)
+        if result is None and goal_id is not None:
+            result = self.cache.peek((start_id, profile, mover, None, None, threat_cost), versions)
+        if result is None:
+            context = NavigationHandler.TraversalContext(self._map, profile, statblock, threat_cost = threat_cost)
+            cut_edges = [] if budget is not None else None
+            distances, previous, reached = self._search(context, start_id, budget, cut_edges, goal_id)
+            result = (distances, previous, reached, cut_edges)
+            self.cache.put(key, versions, result)
+        return result
+
+    @staticmethod
+    def estimate_distance(start, end):
+        """
+        Returns the shortest possible movement cost between two positions, ignoring terrain and speed.
+        Every step costs at least its edge length, so this never overestimates and is used as the A* heuristic.
+
+        param start: tuple - the starting position, format: (x, y, height)
+        param end: tuple - the ending position, format: (x, y, height)
+
+        returns: int - the length of the shortest path in feet on an empty map
+        """
+        low, mid, high = sorted((abs(start[0] - end[0]), abs(start[1] - end[1]), abs(start[2] - end[2])))
+        return low * NavigationHandler.TILE_VERT_DIAGONAL + (mid - low) * NavigationHandler.TILE_DIAGONAL + (high - mid) * NavigationHandler.TILE_SIZE
+
+    def _search(self, context, start_id, budget = None, cut_edges: list = None, goal_id = None, corridor: tuple = None):
+        """
+        Runs Dijkstra's algorithm over the navigation graph from the start node.
+        If a goal is given, runs A* instead and stops once the goal is reached.
+        If the context prices leaving the reach of tokens, paths are chosen by that price, but the distances returned are the movement spent.
+
+        param context: TraversalContext - the movement profile and tile data of the query
+        param start_id: int - the id of the starting node
+        param budget (optional): int - the maximum distance to expand to, unbounded if not given
+        param cut_edges (optional): list - filled with the (node id, neighbor id) edges that were not taken because they exceeded the budget
+        param goal_id (optional): int - the id of the node to search toward
+        param corridor (optional): tuple - only search inside the given clusters, format: (cluster size, set of (cluster x, cluster y))
+
+        returns: tuple[list, list, list] - the distance and predecessor of every node (None if unreached, -1 for the start), and the ids of the reached nodes in the order they were reached
+        """
+        positions, offsets, targets, lengths, blocked, node_layers = self._graph.search_lists()
+        distances = [float('inf')] * self._graph.node_count
+        previous = [None] * self._graph.node_count
+        distances[start_id] = 0
+        previous[start_id] = -1
+        reached = [start_id]
+        goal = positions[goal_id] if goal_id is not None else None
+        estimate_distance = NavigationHandler.estimate_distance
+        cluster_size, clusters = corridor if corridor is not None else (None, None)
+        layers = context.layers
+        threat_cost = context.threat_cost
+        # Distance actually moved to each node, which differs from its cost when leaving reach is priced
+        moved = distances
+        if threat_cost:
+            moved = [float('inf')] * self._graph.node_count
+            moved[start_id] = 0
+
+        queue = [(0, 0, start_id)]
         while queue:
-            current_distance, current_node = heapq.heappop(queue)
+            _, current_distance, current_id = heapq.heappop(queue)
 
-            if current_distance > distances[current_node._position3D]:
+            if current_distance > distances[current_id]:
                 continue
+            if current_id == goal_id:
+                break
 
-            for neighbor in current_node.neighbors:
-                base_distance = distances[current_node._position3D]
+            current_position = positions[current_id]
+            current_moved = moved[current_id]
+            for edge in range(offsets[current_id], offsets[current_id + 1]):
+                if blocked[edge]:
+                    continue
+                neighbor_id = targets[edge]
+                # Skip nodes in layers the movement profile can never enter, such as air without a fly speed
+                if not node_layers[neighbor_id] & layers:
+                    continue
+                if clusters is not None:
+                    neighbor_position = positions[neighbor_id]
+                    if (neighbor_position[0] // cluster_size, neighbor_position[1] // cluster_size) not in clusters:
+                        continue
 
                 # Extracted finding traversal cost into function to allow for more direct and easier testing
-                traversal_cost = self._get_traversal_distance(base_distance, statblock, current_node, neighbor)
+                traversal_cost = self._get_traversal_distance(current_moved, context, current_position, positions[neighbor_id], lengths[edge])
                 if traversal_cost is None:
                     continue
 
-                distance = base_distance + traversal_cost
-                if distance < distances[neighbor.node._position3D]:
-                    distances[neighbor.node._position3D] = distance
-                    previous[neighbor.node] = current_node
-                    heapq.heappush(queue, (distance, neighbor.node))
-                    paths[neighbor.node._position3D] = NavigationHandler.Path(paths[current_node._position3D].path + [neighbor.node._position3D], distance)
-
-        # TODO: Remove paths with endpoints on positions which have a token on them
+                distance = current_distance + traversal_cost
+                if threat_cost:
+                    distance += context.threat_penalty(current_position, positions[neighbor_id])
+                if budget is not None and distance > budget:
+                    if cut_edges is not None:
+                        cut_edges.append((current_id, neighbor_id))
+                    continue
+                if distance < distances[neighbor_id]:
+                    if previous[neighbor_id] is None:
+                        reached.append(neighbor_id)
+                    distances[neighbor_id] = distance
+                    previous[neighbor_id] = current_id
+                    if threat_cost:
+                        moved[neighbor_id] = current_moved + traversal_cost
+                    priority = distance if goal is None else distance + estimate_distance(positions[neighbor_id], goal)
+                    heapq.heappush(queue, (priority, distance, neighbor_id))
 
-        return paths
+        return moved, previous, reached
 
-    def _get_traversal_distance(self, base_distance, statblock, current, destination):
+    def _get_traversal_distance(self, base_distance, context, current, destination, edge_length):
         """
-        Returns the amount of feet of movement it takes to move from the current node to the destination node, given a base distance already moved as a statblock.
+        Returns the amount of feet of movement it takes to move from the current node to the destination node, given a base distance already moved.
 
         param base_distance: int - the distance already moved
-        param statblock: Statblock - the statblock of the entity
-        param current: NavNode - the current node
-        param destination: NavNode - the destination node
+        param context: TraversalContext - the movement profile and tile data of the query
+        param current: tuple - the current position, format: (x, y, height)
+        param destination: tuple - the destination position, format: (x, y, height)
+        param edge_length: int - the length of the edge between the positions in feet
 
         returns:
             int - the distance of movement to the destination node
             None - if the destination is unreachable
         """
-        speed = statblock.get_speed()
+        speed = context.profile
         base_distance += speed.distance_moved
-        tile = self._map.get_tile(*destination.node.position)
-        ft_mult = max(1 + tile.terrain_difficulty, 2 if len(self._map.get_tokens(*destination.node.position)) else 1, 1) # TODO: Get any increases terrain difficulty from map props
+        tile_height, tile_swimmable, tile_max_depth, ft_mult = context.tile(destination[0], destination[1])
         traversal_distance = 0
 
-        if destination.node.height > tile.height:
+        if destination[2] > tile_height:
             # Destination position is above tile ground level, movement will use flight or climb/walk speed.
-            neighbor_distance = destination.distance
+            neighbor_distance = edge_length
             distance_fly = min(max(0, speed.fly - base_distance), neighbor_distance)
             neighbor_distance -= distance_fly
             traversal_distance += distance_fly
@@ -114,10 +663,10 @@ class NavigationHandler:
                 return traversal_distance
 
             # Only allow climbing if the current position is climbable or at floor height and the destination is climbable or at floor height.
-            current_tile = self._map.get_tile(*current.position)
-            cur_climb_dc = self._map.get_climb_dc((*current.position, current.height))
-            des_climb_dc = self._map.get_climb_dc((*destination.node.position, destination.node.height))
-            if (cur_climb_dc is not None or current.height == current_tile.height) and (des_climb_dc is not None or destination.node.height == tile.height):
+            current_tile_height = context.tile(current[0], current[1])[0]
+            cur_climb_dc = context.climb_dc(current)
+            des_climb_dc = context.climb_dc(destination)
+            if (cur_climb_dc is not None or current[2] == current_tile_height) and (des_climb_dc is not None or destination[2] == tile_height):
                 distance_climb = min(max(0, speed.climb - base_distance), neighbor_distance)
                 neighbor_distance -= distance_climb
                 traversal_distance += distance_climb
@@ -129,14 +678,14 @@ class NavigationHandler:
                 traversal_distance += distance_walk * (1 + ft_mult)
                 if neighbor_distance <= 0:
                     return traversal_distance
-        elif tile.swimmable:
+        elif tile_swimmable:
             # Destination is at or below ground level, and swimmable, movement will use flight or swim/walk speed.
-            if destination.node.height >= tile._max_depth:
+            if destination[2] >= tile_max_depth:
                 return None
             
-            neighbor_distance = destination.distance
+            neighbor_distance = edge_length
 
-            if destination.node.height == tile.height:
+            if destination[2] == tile_height:
                 distance_fly = min(max(0, speed.fly - base_distance), neighbor_distance)
                 neighbor_distance -= distance_fly
                 traversal_distance += distance_fly
@@ -154,13 +703,13 @@ class NavigationHandler:
             traversal_distance += distance_walk * (1 + ft_mult)
             if neighbor_distance <= 0:
                 return traversal_distance
-        elif destination.node.height < tile.height:
+        elif destination[2] < tile_height:
             # Destination is not swimmable, and below ground level, movement must use burrow speed.
-            if destination.node.height >= tile._max_depth and max(0, speed.burrow - base_distance) >= destination.distance:
-                return destination.distance
+            if destination[2] >= tile_max_depth and max(0, speed.burrow - base_distance) >= edge_length:
+                return edge_length
         else:
             # Movement is at ground level, movement will use flight or walk speed.
-            neighbor_distance = destination.distance
+            neighbor_distance = edge_length
             distance_fly = min(max(0, speed.fly - base_distance), neighbor_distance)
             neighbor_distance -= distance_fly
             traversal_distance += distance_fly
@@ -174,55 +723,88 @@ class NavigationHandler:
                 return traversal_distance
         return None
 
-    def get_path(self, statblock, start, end):
+    def get_path(self, statblock, start, end, profile: MovementProfile = None, hierarchical: bool = False, threat_cost = 0):
         """
         Returns a list of positions that represent the shortest path from start to end, given the statblock of the entity.
         If no path is possible with the given statblock, returns None.
+        Uses an A* search toward the end position, so only the part of the map between the positions is usually searched.
+        Hierarchical searches route moves between clusters that aren't next to each other over the ClusterLayer first and only
+        search inside the clusters along the route. This is faster on large maps but may give a longer path than the shortest one,
+        so its paths are only suited to previews and must not be used to check or charge movement.
 
         param speed: statblock - the statblock of the entity
         param start: tuple - the starting position, format: (x, y, height)
         param end: tuple - the ending position, format: (x, y, height)
+        param profile (optional): MovementProfile - the movement profile to use, resolved from the statblock if not given
+        param hierarchical (optional): bool - whether to route over clusters, giving an approximate path. Defaults to False
+        param threat_cost (optional): int - the extra cost of leaving the reach of each other token, to prefer paths provoking fewer opportunity attacks.
+            Only used to choose the path, its distance is still the movement it takes. Falls back to the shortest path if no priced path is found.
 
         returns:
             Path - if path exists, the list of positions from start to end
             None - if no path exists
         """
-        return self.get_all_paths(statblock, start).get(end, None)
+        if self._graph.node_id(tuple(end)) is None:
+            return None
+        if hierarchical:
+            path = self._get_hierarchical_path(statblock, start, end, profile, threat_cost)
+            if path is not None:
+                return path
+        distances, previous, reached, _ = self._query(statblock, start, profile, goal = end, threat_cost = threat_cost)
+        path = NavigationHandler.PathMap(self._graph, distances, previous, reached).get(end, None)
+        if path is None and threat_cost:
+            # The cheapest priced route to a position may leave too little speed to go on, so fall back to the shortest path
+            return self.get_path(statblock, start, end, profile, hierarchical)
+        return path
 
+    def get_cluster_layer(self, profile: MovementProfile):
+        """
+        Returns the ClusterLayer for the given movement profile, building it on first use.
+        Layers are kept for the most recently used profiles, and only recompute the clusters that changed since they were last used.
 
-class NavNode:
-    def __init__(self, position3D):
-        self._position3D = position3D
-        self.neighbors = set()
+        param profile: MovementProfile - the movement profile of the entity
 
-    class Neighbor:
-        def __init__(self, neighbor, distance):
-            self.node = neighbor
-            self.distance = distance
-        
-        def __eq__(self, other):
-            return self.node == other.node and self.distance == other.distance
-        
-        def __hash__(self):
-            return hash((self.node, self.distance))
-    
-    @property
-    def position(self):
-        return self._position3D[:2]
-    
-    @property
-    def height(self):
-        return self._position3D[2]
-
-    def add_neighbor(self, neighbor: NavNode, distance):
-        self.neighbors.add(NavNode.Neighbor(neighbor, distance))
-        neighbor.neighbors.add(NavNode.Neighbor(self, distance))
-    
-    def __hash__(self):
-        return hash(self._position3D)
-    
-    def __lt__(self, other):
-        return self._position3D < other._position3D
-
-    def __repr__(self):
-        return f"<NavNode {self._position3D} {len(self.neighbors)}*>"
\ No newline at end of file
+        returns: ClusterLayer - the cluster layer of the profile
+        """
+        key = profile.with_distance_moved(0)
+        layer = self._cluster_layers.get(key)
+        if layer is None:
+            layer = ClusterLayer(self, key)
+            self._cluster_layers[key] = layer
+            while len(self._cluster_layers) > NavigationHandler.MAX_CLUSTER_LAYERS:
+                self._cluster_layers.popitem(last = False)
+        self._cluster_layers.move_to_end(key)
+        return layer
+
+    def _get_hierarchical_path(self, statblock, start, end, profile: MovementProfile = None, threat_cost = 0):
+        """
+        Returns the path from start to end found inside the clusters the ClusterLayer routes the move through.
+        Returns None if the positions are in the same or adjacent clusters, or no path is found along the route,
+        in which case the whole map should be searched instead.
+        """
+        self.sync()
+        if profile is None:
+            profile = MovementProfile.from_statblock(statblock)
+        start_id, end_id = self._graph.node_id(tuple(start)), self._graph.node_id(tuple(end))
+        if start_id is None:
+            raise KeyError(start)
+
+        layer = self.get_cluster_layer(profile)
+        positions = self._graph.search_lists()[0]
+        (start_x, start_y), (end_x, end_y) = layer.cluster_of(positions[start_id]), layer.cluster_of(positions[end_id])
+        if abs(start_x - end_x) <= 1 and abs(start_y - end_y) <= 1:
+            return None
+
+        versions = self._versions(threat_cost)
+        key = ("hierarchical", start_id, end_id, profile, id(statblock) if statblock is not None else None, threat_cost)
+        result = self.cache.get(key, versions)
+        if result is None:
+            corridor = layer.find_corridor(start_id, end_id)
+            if corridor is None:
+                return None
+            context = NavigationHandler.TraversalContext(self._map, profile, statblock, threat_cost = threat_cost)
+            distances, previous, reached = self._search(context, start_id, goal_id = end_id, corridor = (layer.cluster_size, corridor))
+            result = (distances, previous, reached, None)
+            self.cache.put(key, versions, result)
+        distances, previous, reached, _ = result
+        return NavigationHandler.PathMap(self._graph, distances, previous, reached).get(end, None)
@@ -15,7 +15,8 @@ class MapObject(Observer, ABC, DataStorer):
             lua = LuaManager()
             lua.execute(self._script)
             self._script_functions = lua.get_defined_functions()
-            self._globals = {key: lua.get(key) for key in lua.get_defined_variables()}
+            self._globals = {key: LuaManager.to_python_type(lua.get(key)) for key in lua.get_defined_variables()}
+            lua.release()
         else:
             self._script_functions = []
             self._globals = {}
@@ -34,17 +35,24 @@ class MapObject(Observer, ABC, DataStorer):
         return function_name in self._script_functions
 
     def _get_object_function(self, function_name):
-        lua = LuaManager()
         script = self._script
         for obj in self._applied_objects:
             if function_name in obj._script_functions:
                 script = obj._script
                 break
-        lua.execute(script)
-        lua.merge_globals(self._globals)
-        lua.merge_globals({"object": self})
-        lua.connect(self)
-        return lua._get_function(function_name)
+
+        def object_function(*args):
+            # Each call gets its own runtime, returned to the pool once the call is done
+            lua = LuaManager()
+            try:
+                lua.execute(script)
+                lua.merge_globals(self._globals)
+                lua.merge_globals({"object": self})
+                lua.connect(self)
+                return lua._get_function(function_name)(*args)
+            finally:
+                lua.release()
+        return object_function
 
     def apply(self, other):
         if any(func in self._script_functions for func in other._script_functions):
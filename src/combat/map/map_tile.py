@@ -2,11 +2,14 @@
 from src.util.modifier_values import ModifierSpeed
 from src.stats.movement.movement_cost import MovementCost
 from src.combat.map.map_tile_wall import MapTileWall
+from src.events.observer import Emitter
+from src.util.constants import EventType
 from server.backend.database.util.data_storer import DataStorer
 
-class MapTile(DataStorer):
+class MapTile(DataStorer, Emitter):
     def __init__(self, x: int, y: int, height: int = 0):
-        super().__init__()
+        DataStorer.__init__(self)
+        Emitter.__init__(self)
         self._x = x
         self._y = y
 
@@ -49,6 +52,11 @@ class MapTile(DataStorer):
     def height(self):
         return self._height
 
+    @height.setter
+    def height(self, value):
+        self._height = value
+        self.emit(EventType.MAP_TILE_CHANGED, self)
+
     @property
     def position(self):
         return (self._x, self._y)
@@ -57,9 +65,36 @@ class MapTile(DataStorer):
     def swimmable(self):
         return self._swimmable
 
+    @swimmable.setter
+    def swimmable(self, value):
+        self._swimmable = value
+        self.emit(EventType.MAP_TILE_CHANGED, self)
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    @max_depth.setter
+    def max_depth(self, value):
+        self._max_depth = value
+        self.emit(EventType.MAP_TILE_CHANGED, self)
+
     @property
     def terrain_difficulty(self):
-        return self._terrain_difficulty + sum([prop._additional_movement_cost for prop in self._props])
+        return self._terrain_difficulty + sum([getattr(prop, "_additional_movement_cost", 0) for prop in self._props])
+
+    @terrain_difficulty.setter
+    def terrain_difficulty(self, value):
+        self._terrain_difficulty = value
+        self.emit(EventType.MAP_TILE_CHANGED, self)
+
+    def add_prop(self, prop):
+        self._props.append(prop)
+        self.emit(EventType.MAP_TILE_CHANGED, self)
+
+    def remove_prop(self, prop):
+        self._props.remove(prop)
+        self.emit(EventType.MAP_TILE_CHANGED, self)
 
     def get_wall(self, direction):
         if direction == MapTileWall.WallDirection.TOP:
@@ -1,8 +1,10 @@
 from enum import Enum
 from src.combat.map.map_object import MapObject
+from src.events.observer import Emitter
+from src.util.constants import EventType
 from server.backend.database.util.data_storer import DataStorer
 
-class MapTileWall(MapObject):
+class MapTileWall(MapObject, Emitter):
     class WallDirection(Enum):
         TOP = 1
         LEFT = 2
@@ -24,6 +26,7 @@ class MapTileWall(MapObject):
 
     def __init__(self, cover = 0, passable = True, movement_penalty = 0, height = 1, name = "MapTileWall", script = None):
         MapObject.__init__(self, name, script)
+        Emitter.__init__(self)
         self._wall_stats = []
         for i in range(height):
             self._wall_stats.append(MapTileWall.WallStats(cover, passable, movement_penalty, 25))
@@ -79,6 +82,7 @@ class MapTileWall(MapObject):
                 wall_stat.cover = cover
         else:
             self._wall_stats[height].cover = cover
+        self.emit(EventType.MAP_WALL_CHANGED, self)
     
     def set_passable(self, passable, height = None):
         if height is None:
@@ -86,6 +90,7 @@ class MapTileWall(MapObject):
                 wall_stat.passable = passable
         else:
             self._wall_stats[height].passable = passable
+        self.emit(EventType.MAP_WALL_CHANGED, self)
     
     def set_movement_penalty(self, movement_penalty, height = None):
         if height is None:
@@ -93,6 +98,7 @@ class MapTileWall(MapObject):
                 wall_stat.movement_penalty = movement_penalty
         else:
             self._wall_stats[height].movement_penalty = movement_penalty
+        self.emit(EventType.MAP_WALL_CHANGED, self)
 
     def set_climb_dc(self, dc, height = None):
         if height is None:
@@ -100,6 +106,7 @@ class MapTileWall(MapObject):
                 wall_stat.climb_dc = dc
         else:
             self._wall_stats[height].climb_dc = dc
+        self.emit(EventType.MAP_WALL_CHANGED, self)
 
     def __getattr__(self, name):
         return super().__getattr__(name)
\ No newline at end of file
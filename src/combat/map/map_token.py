@@ -49,6 +49,8 @@ class Token(Statblock, Positioned, DataStorer):
         for offset, extension in self._extensions.items():
             # Currently ignoring height for tokens, assuming all tokens are 1 tile (5 feet) tall
             extension._position3D = (position[0] + offset[0], position[1] + offset[1], position[2])
+        if self._map is not None:
+            self._map.update_token_position(self)
 
     def get_name(self):
         return self._statblock.get_name()
@@ -0,0 +1,68 @@
+class MovementProfile:
+    """
+    Immutable snapshot of the movement a statblock has available for a single navigation query.
+    Resolving the profile once per query keeps effect scripts from running for every edge that is searched.
+    """
+    __slots__ = ("_walk", "_fly", "_swim", "_climb", "_burrow", "_hover", "_distance_moved")
+
+    def __init__(self, walk = 0, fly = 0, swim = 0, climb = 0, burrow = 0, hover = False, distance_moved = 0):
+        object.__setattr__(self, "_walk", walk)
+        object.__setattr__(self, "_fly", fly)
+        object.__setattr__(self, "_swim", swim)
+        object.__setattr__(self, "_climb", climb)
+        object.__setattr__(self, "_burrow", burrow)
+        object.__setattr__(self, "_hover", bool(hover))
+        object.__setattr__(self, "_distance_moved", distance_moved)
+
+    @staticmethod
+    def from_statblock(statblock):
+        """Returns the movement profile of the given statblock, using its speed after all effects are applied."""
+        speed = statblock.get_speed()
+        return MovementProfile(speed.walk, speed.fly, speed.swim, speed.climb, speed.burrow, speed.hover, speed.distance_moved)
+
+    @property
+    def walk(self):
+        return self._walk
+
+    @property
+    def fly(self):
+        return self._fly
+
+    @property
+    def swim(self):
+        return self._swim
+
+    @property
+    def climb(self):
+        return self._climb
+
+    @property
+    def burrow(self):
+        return self._burrow
+
+    @property
+    def hover(self):
+        return self._hover
+
+    @property
+    def distance_moved(self):
+        return self._distance_moved
+
+    def with_distance_moved(self, distance_moved):
+        """Returns a copy of the profile with a different amount of distance already moved."""
+        return MovementProfile(self._walk, self._fly, self._swim, self._climb, self._burrow, self._hover, distance_moved)
+
+    def _key(self):
+        return (self._walk, self._fly, self._swim, self._climb, self._burrow, self._hover, self._distance_moved)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MovementProfile is immutable.")
+
+    def __eq__(self, other):
+        return isinstance(other, MovementProfile) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"<MovementProfile walk={self._walk} fly={self._fly} swim={self._swim} climb={self._climb} burrow={self._burrow} hover={self._hover} moved={self._distance_moved}>"
@@ -0,0 +1,210 @@
+import numpy as np
+
+class NavigationGraph:
+    """
+    Compact navigation graph of every (x, y, height) position on a map, stored as CSR arrays.
+    Node ids are assigned in (x, y, height) order, so comparing ids compares positions.
+    The edges of node i are targets[offsets[i]:offsets[i + 1]], with matching lengths in feet,
+    and blocked flags for edges that cross an impassable wall.
+    Each node is also tagged with the layers it belongs to, so a search can skip the nodes its movement profile can never enter.
+    """
+    # Node layer flags
+    GROUND = 1
+    CLIMB = 2
+    AIR = 4
+    WATER = 8
+    BURROW = 16
+    def __init__(self, width: int, height: int, max_height: int, straight: int, diagonal: int, vert_diagonal: int):
+        """
+        Builds the graph connecting each node to its (up to) 26 surrounding nodes.
+
+        param width: int - the width of the map
+        param height: int - the height of the map
+        param max_height: int - the amount of height levels of the map
+        param straight: int - the length of an edge along a single axis
+        param diagonal: int - the length of an edge along two axes
+        param vert_diagonal: int - the length of an edge along all three axes
+        """
+        self._width = width
+        self._height = height
+        self._max_height = max_height
+        self._node_count = width * height * max_height
+
+        xs, ys, hs = np.meshgrid(np.arange(width), np.arange(height), np.arange(max_height), indexing = "ij")
+        xs, ys, hs = xs.ravel(), ys.ravel(), hs.ravel()
+        self.positions = np.stack((xs, ys, hs), axis = 1).astype(np.int32)
+
+        lengths_by_axes = np.array([0, straight, diagonal, vert_diagonal], dtype = np.int32)
+        sources, targets, lengths = [], [], []
+        for dx in range(-1, 2):
+            for dy in range(-1, 2):
+                for dh in range(-1, 2):
+                    if dx == 0 and dy == 0 and dh == 0:
+                        continue
+                    nx, ny, nh = xs + dx, ys + dy, hs + dh
+                    valid = (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height) & (nh >= 0) & (nh < max_height)
+                    source = np.flatnonzero(valid)
+                    sources.append(source)
+                    targets.append(self._ids(nx[valid], ny[valid], nh[valid]))
+                    lengths.append(np.full(len(source), lengths_by_axes[abs(dx) + abs(dy) + abs(dh)], dtype = np.int32))
+
+        sources = np.concatenate(sources) if sources else np.empty(0, dtype = np.int64)
+        order = np.argsort(sources, kind = "stable")
+        self.targets = np.concatenate(targets)[order].astype(np.int32) if targets else np.empty(0, dtype = np.int32)
+        self.lengths = np.concatenate(lengths)[order] if lengths else np.empty(0, dtype = np.int32)
+        self.offsets = np.zeros(self._node_count + 1, dtype = np.int32)
+        np.cumsum(np.bincount(sources, minlength = self._node_count), out = self.offsets[1:])
+        self.blocked = np.zeros(len(self.targets), dtype = bool)
+        self.node_layers = np.full(self._node_count, NavigationGraph.GROUND, dtype = np.int8)
+
+        self._search_lists = None
+
+    def _ids(self, x, y, h):
+        return (x * self._height + y) * self._max_height + h
+
+    @property
+    def node_count(self):
+        return self._node_count
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def update_blocked(self, layer, region: tuple = None):
+        """
+        Recomputes which edges cross an impassable wall.
+        A wall blocks an edge at the heights the edge crosses it which are at or above the ground on both sides of the wall.
+        Diagonal edges are blocked by any wall at the corner they pass, so walls can't be cut around.
+
+        param layer: TraversalLayer - the traversal layer of the map
+        param region (optional): tuple - only update edges touching the given tiles, format: (x0, y0, x1, y1) inclusive
+        """
+        if region is None:
+            x0, y0, x1, y1 = 0, 0, self._width - 1, self._height - 1
+        else:
+            # Edges crossing a wall of the region start one tile outside of it
+            x0, y0 = max(0, region[0] - 1), max(0, region[1] - 1)
+            x1, y1 = min(self._width - 1, region[2] + 1), min(self._height - 1, region[3] + 1)
+        if x0 > x1 or y0 > y1:
+            return
+
+        # The nodes of a column of tiles have consecutive ids, so their edges are a single slice
+        edges, sources = [], []
+        for x in range(x0, x1 + 1):
+            first, last = self._ids(x, y0, 0), self._ids(x, y1, self._max_height - 1)
+            start, end = self.offsets[first], self.offsets[last + 1]
+            edges.append(np.arange(start, end))
+            sources.append(np.repeat(np.arange(first, last + 1), np.diff(self.offsets[first:last + 2])))
+        edges, sources = np.concatenate(edges), np.concatenate(sources)
+
+        source, target = self.positions[sources], self.positions[self.targets[edges]]
+        sx, sy, sh = source[:, 0], source[:, 1], source[:, 2]
+        tx, ty, th = target[:, 0], target[:, 1], target[:, 2]
+        left, top = np.minimum(sx, tx), np.minimum(sy, ty)
+        crosses_x, crosses_y = sx != tx, sy != ty
+
+        def crossing_blocked(walls, wx, wy, ax, ay, bx, by, crosses):
+            ground = np.maximum(layer.ground[ax, ay], layer.ground[bx, by])
+            return crosses & ((walls[wx, wy, sh] & (sh >= ground)) | (walls[wx, wy, th] & (th >= ground)))
+
+        blocked = np.zeros(len(edges), dtype = bool)
+        # Walls between the columns, on the source row and on the target row
+        blocked |= crossing_blocked(layer.wall_x, left, sy, sx, sy, tx, sy, crosses_x)
+        blocked |= crossing_blocked(layer.wall_x, left, ty, sx, ty, tx, ty, crosses_x & crosses_y)
+        # Walls between the rows, on the source column and on the target column
+        blocked |= crossing_blocked(layer.wall_y, sx, top, sx, sy, sx, ty, crosses_y)
+        blocked |= crossing_blocked(layer.wall_y, tx, top, tx, sy, tx, ty, crosses_x & crosses_y)
+
+        self.blocked[edges] = blocked
+        if self._search_lists is not None:
+            blocked_list = self._search_lists[4]
+            for edge, value in zip(edges.tolist(), blocked.tolist()):
+                blocked_list[edge] = value
+
+    @staticmethod
+    def layers_for(profile):
+        """
+        Returns the node layer flags the given movement profile can enter.
+        Ground, water and climbable nodes can be walked into, air needs a fly speed and solid ground a burrow speed.
+
+        param profile: MovementProfile - the movement profile of the entity
+
+        returns: int - the combined layer flags
+        """
+        layers = NavigationGraph.GROUND | NavigationGraph.CLIMB | NavigationGraph.WATER
+        if profile.fly > 0:
+            layers |= NavigationGraph.AIR
+        if profile.burrow > 0:
+            layers |= NavigationGraph.BURROW
+        return layers
+
+    def update_node_layers(self, layer, region: tuple = None):
+        """
+        Recomputes the layers of the nodes of the given tiles.
+        Nodes at ground height are ground, nodes above it are air (and climb, if the position can be climbed),
+        and nodes below it are water if the tile is swimmable and burrow if not.
+
+        param layer: TraversalLayer - the traversal layer of the map
+        param region (optional): tuple - only update the nodes of the given tiles, format: (x0, y0, x1, y1) inclusive
+        """
+        x0, y0, x1, y1 = region if region is not None else (0, 0, self._width - 1, self._height - 1)
+        x0, y0, x1, y1 = max(0, x0), max(0, y0), min(self._width - 1, x1), min(self._height - 1, y1)
+        if x0 > x1 or y0 > y1:
+            return
+
+        heights = np.arange(self._max_height)[None, None, :]
+        ground = layer.ground[x0:x1 + 1, y0:y1 + 1, None]
+        swimmable = layer.swimmable[x0:x1 + 1, y0:y1 + 1, None]
+        climbable = layer.climbable[x0:x1 + 1, y0:y1 + 1, :]
+        layers = np.where(heights > ground, NavigationGraph.AIR, 0)
+        layers |= np.where((heights > ground) & climbable, NavigationGraph.CLIMB, 0)
+        layers |= np.where((heights == ground) & ~swimmable, NavigationGraph.GROUND, 0)
+        layers |= np.where((heights <= ground) & swimmable, NavigationGraph.WATER, 0)
+        layers |= np.where((heights < ground) & ~swimmable, NavigationGraph.BURROW, 0)
+        layers = layers.astype(np.int8)
+
+        for x in range(x0, x1 + 1):
+            first, last = self._ids(x, y0, 0), self._ids(x, y1, self._max_height - 1)
+            self.node_layers[first:last + 1] = layers[x - x0].ravel()
+            if self._search_lists is not None:
+                self._search_lists[5][first:last + 1] = layers[x - x0].ravel().tolist()
+
+    def node_id(self, position3D):
+        """
+        Returns the id of the node at the given position.
+
+        param position3D: tuple - the position, format: (x, y, height)
+
+        returns:
+            int - the id of the node
+            None - if the position is outside of the graph
+        """
+        x, y, h = position3D
+        if not (0 <= x < self._width and 0 <= y < self._height and 0 <= h < self._max_height):
+            return None
+        return int(self._ids(x, y, h))
+
+    def position(self, node_id: int):
+        """Returns the (x, y, height) position of the node with the given id."""
+        return self.search_lists()[0][node_id]
+
+    def neighbors(self, node_id: int):
+        """Returns a list of (neighbor id, edge length) tuples of the node with the given id."""
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        return list(zip(self.targets[start:end].tolist(), self.lengths[start:end].tolist()))
+
+    def search_lists(self):
+        """
+        Returns (positions, offsets, targets, lengths, blocked, node layers) as plain Python lists.
+        Indexing lists is much faster than indexing NumPy arrays one element at a time, which is what a search loop does.
+        The lists are built on first use and shared by every search over the graph.
+        """
+        if self._search_lists is None:
+            positions = [tuple(position) for position in self.positions.tolist()]
+            self._search_lists = (positions, self.offsets.tolist(), self.targets.tolist(), self.lengths.tolist(), self.blocked.tolist(), self.node_layers.tolist())
+        return self._search_lists
+
+    @property
+    def nbytes(self):
+        """Returns the amount of bytes used by the graph arrays."""
+        return self.positions.nbytes + self.offsets.nbytes + self.targets.nbytes + self.lengths.nbytes + self.blocked.nbytes + self.node_layers.nbytes
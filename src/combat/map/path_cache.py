@@ -0,0 +1,7 @@
+from src.combat.map.versioned_cache import VersionedCache
+
+class PathCache(VersionedCache):
+    """
+    LRU cache of navigation search results, keyed by the query and the map and occupancy versions it was made against.
+    Entries made against an older version of the map are dropped as soon as a newer version is seen.
+    """
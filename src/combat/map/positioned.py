@@ -36,7 +36,11 @@ class Positioned:
         return self.pushed_toward(other, -distance)
     
     def can_see(self, position):
-        return self._get_tile_toward(position) == position
+        return self._map.field_of_view.can_see(self._position3D, position)
+
+    def get_visibility(self):
+        """Returns the bool mask of the positions that can be seen from this position, indexed by [x, y, height]."""
+        return self._map.field_of_view.get_visibility(self._position3D)
     
     def _get_tile_toward(self, position):
         utils = MapUtils(self._map)
@@ -0,0 +1,175 @@
+import heapq
+
+class SpatialHash:
+    """
+    Uniform grid over the tokens of a map, for range queries that only look at the tokens near the queried position.
+    Each bucket covers a square of tiles and lists the tokens with any part of their footprint in it. Tokens are moved
+    between buckets as they move, so queries cost time in the amount of buckets and tokens in range, not in the amount of tokens on the map.
+
+    Distances are measured like Positioned.distance_to, in whole tiles converted to feet, to the closest tile of a token's footprint.
+    """
+    # Width and height of a bucket in tiles
+    DEFAULT_CELL_SIZE = 4
+
+    def __init__(self, tile_size: int, cell_size: int = DEFAULT_CELL_SIZE):
+        """
+        param tile_size: int - the size of a tile in feet
+        param cell_size: int - the width and height of a bucket in tiles
+        """
+        self._tile_size = tile_size
+        self._cell_size = cell_size
+        # Maps (bucket x, bucket y) to the tokens in it, and token ids to (order added, token, footprint tiles, buckets)
+        self._buckets = {}
+        self._entries = {}
+        self._added = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._buckets = {}
+        self._entries = {}
+        self._added = 0
+
+    def _bucket_of(self, x, y):
+        return (int(x) // self._cell_size, int(y) // self._cell_size)
+
+    def update(self, token, cells: list):
+        """
+        Adds a token, or moves it to the buckets of its new footprint.
+
+        param token: Token - the token
+        param cells: list[tuple] - the (x, y) tiles of the token's footprint
+        """
+        entry = self._entries.get(id(token))
+        order = self._added if entry is None else entry[0]
+        if entry is None:
+            self._added += 1
+        else:
+            self.remove(token)
+        buckets = {self._bucket_of(x, y) for x, y in cells}
+        for bucket in buckets:
+            self._buckets.setdefault(bucket, []).append(token)
+        self._entries[id(token)] = (order, token, list(cells), buckets)
+
+    def remove(self, token):
+        entry = self._entries.pop(id(token), None)
+        if entry is None:
+            return
+        for bucket in entry[3]:
+            tokens = self._buckets[bucket]
+            tokens.remove(token)
+            if not tokens:
+                del self._buckets[bucket]
+
+    def _is_ignored(self, token, ignore):
+        return ignore is not None and (token is ignore or token._statblock is ignore)
+
+    def _distance(self, token, position3D):
+        _, _, cells, _ = self._entries[id(token)]
+        dh = token.get_position()[2] - position3D[2]
+        closest = min((x - position3D[0]) ** 2 + (y - position3D[1]) ** 2 for x, y in cells)
+        return int((closest + dh * dh) ** 0.5) * self._tile_size
+
+    def _tokens_in_buckets(self, bx0, by0, bx1, by1):
+        """Yields each token in the given range of buckets once."""
+        seen = set()
+        for bx in range(bx0, bx1 + 1):
+            for by in range(by0, by1 + 1):
+                for token in self._buckets.get((bx, by), ()):
+                    if id(token) not in seen:
+                        seen.add(id(token))
+                        yield token
+
+    @staticmethod
+    def _ring(center, ring):
+        """Yields the buckets exactly the given amount of buckets away from the center bucket."""
+        cx, cy = center
+        if ring == 0:
+            yield center
+            return
+        for bx in range(cx - ring, cx + ring + 1):
+            yield (bx, cy - ring)
+            yield (bx, cy + ring)
+        for by in range(cy - ring + 1, cy + ring):
+            yield (cx - ring, by)
+            yield (cx + ring, by)
+
+    def get_in_bounds(self, x0: int, y0: int, x1: int, y1: int, ignore = None):
+        """
+        Returns the tokens with any part of their footprint inside the given tiles.
+
+        param x0, y0, x1, y1: int - the bounds of the tiles, inclusive
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include
+
+        returns: list[Token] - the tokens in the bounds, in the order they were added
+        """
+        (bx0, by0), (bx1, by1) = self._bucket_of(x0, y0), self._bucket_of(x1, y1)
+        tokens = [token for token in self._tokens_in_buckets(bx0, by0, bx1, by1) if not self._is_ignored(token, ignore)
+                  and any(x0 <= x <= x1 and y0 <= y <= y1 for x, y in self._entries[id(token)][2])]
+        return sorted(tokens, key = lambda token: self._entries[id(token)][0])
+
+    def get_in_radius(self, position3D, distance: int, ignore = None):
+        """
+        Returns the tokens within the given distance of a position, closest first.
+
+        param position3D: tuple - the position to measure from, format: (x, y, height)
+        param distance: int - the distance in feet
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include, such as the one measuring from its own position
+
+        returns: list[tuple] - the (distance in feet, token) of each token in range
+        """
+        reach = int(distance // self._tile_size) + 1
+        x, y = position3D[0], position3D[1]
+        (bx0, by0), (bx1, by1) = self._bucket_of(x - reach, y - reach), self._bucket_of(x + reach, y + reach)
+        found = []
+        for token in self._tokens_in_buckets(bx0, by0, bx1, by1):
+            if self._is_ignored(token, ignore):
+                continue
+            token_distance = self._distance(token, position3D)
+            if token_distance <= distance:
+                found.append((token_distance, self._entries[id(token)][0], token))
+        return [(token_distance, token) for token_distance, _, token in sorted(found, key = lambda item: item[:2])]
+
+    def get_nearest(self, position3D, count: int, max_distance: int = None, ignore = None):
+        """
+        Returns the closest tokens to a position, searching rings of buckets outward until no unseen token could be closer.
+
+        param position3D: tuple - the position to measure from, format: (x, y, height)
+        param count: int - the most tokens to return
+        param max_distance (optional): int - the furthest distance in feet a token may be at
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not include
+
+        returns: list[tuple] - the (distance in feet, token) of up to count tokens, closest first
+        """
+        if count <= 0 or not self._entries:
+            return []
+        center = self._bucket_of(position3D[0], position3D[1])
+        seen = set()
+        # Max heap of the closest (distance, order, token) found so far, stored negated
+        closest = []
+        ring = 0
+        while len(seen) < len(self._entries):
+            for bucket in self._ring(center, ring):
+                for token in self._buckets.get(bucket, ()):
+                    if id(token) in seen:
+                        continue
+                    seen.add(id(token))
+                    if self._is_ignored(token, ignore):
+                        continue
+                    token_distance = self._distance(token, position3D)
+                    if max_distance is not None and token_distance > max_distance:
+                        continue
+                    item = (-token_distance, -self._entries[id(token)][0], token)
+                    if len(closest) < count:
+                        heapq.heappush(closest, item)
+                    elif item[:2] > closest[0][:2]:
+                        heapq.heapreplace(closest, item)
+            # Tokens in further rings are further than this from the position
+            unseen_distance = ring * self._cell_size * self._tile_size
+            if len(closest) == count and -closest[0][0] <= unseen_distance:
+                break
+            if max_distance is not None and unseen_distance >= max_distance:
+                break
+            ring += 1
+        return [(-token_distance, token) for token_distance, _, token in sorted(closest, reverse = True)]
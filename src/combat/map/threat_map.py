@@ -0,0 +1,121 @@
+from src.stats.items.tags import ItemTag
+
+class ThreatMap:
+    """
+    Maps each (x, y) tile to the tokens that can reach it with a melee attack, built from the position, size and reach of every token.
+    Rebuilt on first use after any token is added or moves, so checking a move for opportunity attacks doesn't need to look at
+    every token on every step, only at the tokens threatening the tiles along the path.
+
+    Reach is simplified to the square of tiles within reach of a token's footprint, at any height and through walls,
+    so a token also threatens tiles behind walls or on other levels that it couldn't attack in play.
+    """
+    # Reach of a melee attack in feet, with and without a reach weapon
+    DEFAULT_REACH = 5
+    WEAPON_REACH = 10
+
+    def __init__(self, map):
+        self._map = map
+        self._threats = {}
+        # Maps the id of an ignored token or statblock to (the ignored object, its threat sets), until the map is rebuilt
+        self._threat_sets = {}
+        self._occupancy_version = None
+        # Counts the changes made without moving tokens, for caches of results depending on the threats
+        self.version = 0
+        self.rebuilds = 0
+
+    @staticmethod
+    def get_reach(token):
+        """Returns the reach of the given token's melee attacks in feet, which is longer when wielding a reach weapon."""
+        weapon = token._statblock._inventory.main_hand
+        if weapon is not None and weapon.has_tag(ItemTag.WEAPON_REACH):
+            return ThreatMap.WEAPON_REACH
+        return ThreatMap.DEFAULT_REACH
+
+    def invalidate(self):
+        """Forces a rebuild on next use, for changes that don't move tokens, such as equipping a reach weapon."""
+        self._occupancy_version = None
+        self._threat_sets = {}
+        self.version += 1
+
+    def sync(self):
+        """Rebuilds the map if any token was added or moved since it was last built."""
+        if self._occupancy_version == self._map.occupancy_version:
+            return
+        self._occupancy_version = self._map.occupancy_version
+        self.rebuilds += 1
+        self._threats = {}
+        self._threat_sets = {}
+        width, height = self._map.width, self._map.height
+        for token in self._map.get_tokens():
+            cells = self._map._occupied_cells.get(id(token))
+            if not cells:
+                continue
+            reach = max(1, self.get_reach(token) // self._map.TILE_SIZE)
+            x0, y0 = max(0, min(x for x, _ in cells) - reach), max(0, min(y for _, y in cells) - reach)
+            x1, y1 = min(width - 1, max(x for x, _ in cells) + reach), min(height - 1, max(y for _, y in cells) + reach)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self._threats.setdefault((x, y), []).append(token)
+
+    def _is_ignored(self, token, ignore):
+        return ignore is not None and (token is ignore or token._statblock is ignore)
+
+    def get_threatening(self, x: int, y: int, ignore = None):
+        """
+        Returns the tokens that can reach the given tile with a melee attack.
+
+        param x: int - the x position of the tile
+        param y: int - the y position of the tile
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not count, such as the one that is moving
+
+        returns: list[Token] - the threatening tokens
+        """
+        self.sync()
+        return [token for token in self._threats.get((x, y), ()) if not self._is_ignored(token, ignore)]
+
+    def is_threatened(self, x: int, y: int, ignore = None):
+        """Returns whether any token, other than the ignored one, can reach the given tile with a melee attack."""
+        return len(self.get_threatening(x, y, ignore)) > 0
+
+    def get_threat_sets(self, ignore = None):
+        """
+        Returns {(x, y): frozenset of token ids} of every threatened tile, for searches comparing the threats of adjacent tiles.
+        Results are kept per ignored token until the map is rebuilt or invalidated, and shared between callers, so they must not be changed.
+
+        param ignore (optional): Token | Statblock - a token or the statblock of a token to not count, such as the one that is moving
+
+        returns: dict - the ids of the threatening tokens of each threatened tile
+        """
+        self.sync()
+        cached = self._threat_sets.get(id(ignore))
+        if cached is not None and cached[0] is ignore:
+            return cached[1]
+        threat_sets = {}
+        for cell, tokens in self._threats.items():
+            threatening = frozenset(id(token) for token in tokens if not self._is_ignored(token, ignore))
+            if threatening:
+                threat_sets[cell] = threatening
+        self._threat_sets[id(ignore)] = (ignore, threat_sets)
+        return threat_sets
+
+    def get_reach_exits(self, path: list, mover = None):
+        """
+        Returns every step of a path that leaves the reach of a token, which would provoke an opportunity attack from it.
+        Only the tokens threatening the tiles along the path are looked at.
+
+        param path: list[tuple] - the positions of the path in order, format: (x, y, height)
+        param mover (optional): Token | Statblock - the token moving along the path, which can't threaten itself
+
+        returns: list[tuple] - the (index of the position being left, token) of each exit, in path order
+        """
+        self.sync()
+        exits = []
+        for index in range(len(path) - 1):
+            current = self._threats.get(tuple(path[index][:2]))
+            if not current:
+                continue
+            following = {id(token) for token in self._threats.get(tuple(path[index + 1][:2]), ())}
+            for token in current:
+                if id(token) not in following and not self._is_ignored(token, mover):
+                    exits.append((index, token))
+        return exits
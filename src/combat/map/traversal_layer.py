@@ -0,0 +1,98 @@
+import numpy as np
+
+class TraversalLayer:
+    """
+    Dense arrays of the tile data navigation reads, indexed by [x, y] or [x, y, height].
+    Kept up to date by the Map as tiles, walls and props change, so a search never has to query tile objects.
+    """
+    # Value of climb_dc where the position can not be climbed
+    NO_CLIMB = -1
+
+    def __init__(self, map):
+        self._map = map
+        self._width = map.width
+        self._height = map.height
+        self._max_height = map._max_height
+
+        self.ground = np.zeros((self._width, self._height), dtype = np.int32)
+        self.swimmable = np.zeros((self._width, self._height), dtype = bool)
+        self.max_depth = np.zeros((self._width, self._height), dtype = np.int32)
+        self.multiplier = np.ones((self._width, self._height), dtype = np.int32)
+        self.climb_dc = np.full((self._width, self._height, self._max_height), TraversalLayer.NO_CLIMB, dtype = np.int32)
+        # Whether the right (wall_x) and bottom (wall_y) walls of each tile are impassable at each height
+        self.wall_x = np.zeros((self._width, self._height, self._max_height), dtype = bool)
+        self.wall_y = np.zeros((self._width, self._height, self._max_height), dtype = bool)
+        # Cover given by the right (cover_x) and bottom (cover_y) walls of each tile at each height
+        self.cover_x = np.zeros((self._width, self._height, self._max_height), dtype = np.int8)
+        self.cover_y = np.zeros((self._width, self._height, self._max_height), dtype = np.int8)
+
+        self._lists = None
+        self.rebuild()
+
+    @property
+    def climbable(self):
+        return self.climb_dc != TraversalLayer.NO_CLIMB
+
+    def rebuild(self):
+        """Recomputes the layer for the whole map."""
+        self.update_region(0, 0, self._width - 1, self._height - 1)
+
+    def update_tile(self, x: int, y: int):
+        """
+        Recomputes the layer after the tile at the given position changed.
+        Climb DCs depend on the ground height of adjacent tiles, so those are recomputed as well.
+        """
+        self._update_tiles(x, y, x, y)
+        self._update_climb_dcs(x - 1, y - 1, x + 1, y + 1)
+        self._lists = None
+
+    def update_region(self, x0: int, y0: int, x1: int, y1: int):
+        """Recomputes the layer for every tile in the given inclusive rectangle."""
+        self._update_tiles(x0, y0, x1, y1)
+        self._update_walls(x0, y0, x1, y1)
+        self._update_climb_dcs(x0, y0, x1, y1)
+        self._lists = None
+
+    def update_walls(self, cells: list):
+        """Recomputes the walls and climb DCs of the given (x, y) tiles, such as the two sides of a changed wall."""
+        for x, y in cells:
+            self._update_walls(x - 1, y - 1, x, y)
+            self._update_climb_dcs(x, y, x, y)
+        self._lists = None
+
+    def _update_tiles(self, x0, y0, x1, y1):
+        for x in range(max(0, x0), min(self._width - 1, x1) + 1):
+            for y in range(max(0, y0), min(self._height - 1, y1) + 1):
+                tile = self._map.get_tile(x, y)
+                self.ground[x, y] = tile.height
+                self.swimmable[x, y] = tile.swimmable
+                self.max_depth[x, y] = tile._max_depth
+                self.multiplier[x, y] = max(1 + tile.terrain_difficulty, 1)
+
+    def _update_walls(self, x0, y0, x1, y1):
+        for x in range(max(0, x0), min(self._width - 1, x1) + 1):
+            for y in range(max(0, y0), min(self._height - 1, y1) + 1):
+                tile = self._map.get_tile(x, y)
+                for h in range(min(self._max_height, len(tile._wall_right._wall_stats))):
+                    self.wall_x[x, y, h] = not tile._wall_right.get_passable(h)
+                    self.cover_x[x, y, h] = tile._wall_right.get_cover(h)
+                for h in range(min(self._max_height, len(tile._wall_bottom._wall_stats))):
+                    self.wall_y[x, y, h] = not tile._wall_bottom.get_passable(h)
+                    self.cover_y[x, y, h] = tile._wall_bottom.get_cover(h)
+
+    def _update_climb_dcs(self, x0, y0, x1, y1):
+        for x in range(max(0, x0), min(self._width - 1, x1) + 1):
+            for y in range(max(0, y0), min(self._height - 1, y1) + 1):
+                for h in range(self._max_height):
+                    dc = self._map._compute_climb_dc((x, y, h))
+                    self.climb_dc[x, y, h] = TraversalLayer.NO_CLIMB if dc is None else dc
+
+    def lists(self):
+        """
+        Returns (ground, swimmable, max depth, multiplier, climb DC) as nested Python lists indexed by [x][y] and [x][y][height].
+        Indexing lists is much faster than indexing NumPy arrays one element at a time, which is what a search loop does.
+        The lists are rebuilt on first use after the layer changes.
+        """
+        if self._lists is None:
+            self._lists = (self.ground.tolist(), self.swimmable.tolist(), self.max_depth.tolist(), self.multiplier.tolist(), self.climb_dc.tolist())
+        return self._lists
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+
+class VersionedCache:
+    """
+    LRU cache of computed results, keyed by the query and the versions of the data it was computed from, such as the map and occupancy versions.
+    Entries computed from older versions are dropped as soon as newer versions are seen.
+    """
+    DEFAULT_MAX_SIZE = 64
+
+    def __init__(self, max_size = DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._results = OrderedDict()
+        self._versions = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __len__(self):
+        return len(self._results)
+
+    def set_max_size(self, max_size):
+        """Sets the maximum amount of results kept by the cache, evicting the least recently used extras."""
+        if max_size < 0:
+            raise ValueError("Cache size cannot be negative.")
+        self._max_size = max_size
+        while len(self._results) > max_size:
+            self._results.popitem(last = False)
+
+    def _check_versions(self, versions):
+        if versions != self._versions:
+            if self._results:
+                self.invalidations += 1
+            self._results.clear()
+            self._versions = versions
+
+    def get(self, key, versions: tuple):
+        """
+        Returns the cached result of the given query.
+
+        param key: tuple - the query, such as the positions it is made between
+        param versions: tuple - the versions of the data the query is made against
+
+        returns:
+            object - the cached result
+            None - if the query has no cached result for these versions
+        """
+        self._check_versions(versions)
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def peek(self, key, versions: tuple):
+        """Returns the cached result of the given query like get, without counting a hit or miss."""
+        self._check_versions(versions)
+        return self._results.get(key)
+
+    def put(self, key, versions: tuple, result):
+        """
+        Caches the result of the given query.
+
+        param key: tuple - the query, such as the positions it is made between
+        param versions: tuple - the versions of the data the query was made against
+        param result: object - the result of the query
+        """
+        self._check_versions(versions)
+        if self._max_size <= 0:
+            return
+        self._results[key] = result
+        self._results.move_to_end(key)
+        while len(self._results) > self._max_size:
+            self._results.popitem(last = False)
+
+    def clear(self):
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
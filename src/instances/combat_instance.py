@@ -33,6 +33,8 @@ class CombatInstance(TurnInstance):
         super().advance_turn_order()
         statblock = self.get_statblock(self._turn_order[self._current])
         statblock._speed.reset()
+        # Reach can change between turns without tokens moving, such as by equipping a reach weapon
+        self._map.threats.invalidate()
 
     def issue_command(self, statblock_id, command):
         try:
@@ -58,7 +60,8 @@ class CombatInstance(TurnInstance):
             if path is None:
                 return ReturnStatus(False, "No path to target.")
             
-            # TODO: Move statblock along path one space at a time to allow for movement reactions
+            # TODO: Move statblock along path one space at a time to allow for movement reactions,
+            # stopping at the steps returned by self._map.threats.get_reach_exits(path.path, token)
 
             token.set_position(command.to_position)
             statblock._speed.distance_moved += path.distance
@@ -15,6 +15,7 @@ class Ability(Observer):
         self._function_name = None
         self._globals = {}
         self._lua = None
+        self._owns_lua = False
         self._uuid = None
         self.regenerate_uuid()
 
@@ -24,6 +25,7 @@ class Ability(Observer):
         lua.execute(SCRIPT_HEADERS)
         lua.connect(self)
         lua.execute(script)
+        lua.release()
 
         self._script = SCRIPT_HEADERS + script
 
@@ -58,7 +60,9 @@ class Ability(Observer):
     def header(self):
         lua = LuaManager()
         lua.execute(self._script)
-        return (self._name, lua.get_function_header(self._function_name)[1])
+        header = lua.get_function_header(self._function_name)[1]
+        lua.release()
+        return (self._name, header)
 
     @property
     def is_modifier(self):
@@ -79,8 +83,7 @@ class Ability(Observer):
 
     @property
     def is_attacking(self):
-        lua = LuaManager()
-        return lua.analyze_for_call(self._script, "target", "take_damage")
+        return LuaManager.analyze_for_call(self._script, "target", "take_damage")
 
     def reset_use_delay(self):
         if self._use_time.is_special:
@@ -96,19 +99,30 @@ class Ability(Observer):
         return True
 
     def set_lua(self, lua):
+        self.release()
         self._lua = lua
+        self._owns_lua = False
         self._lua.execute(self._script)
 
     def set_function_name(self, function_name):
         self._function_name = function_name
 
     def initialize(self, globals):
+        self.release()
         self._lua = LuaManager()
+        self._owns_lua = True
         self._lua.execute(self._script)
         self._lua.merge_globals(self._globals)
         self._lua.merge_globals(globals)
         return self._lua
 
+    def release(self):
+        # Only return the runtime to the pool if this ability created it, runtimes shared through set_lua() are released by their owner
+        if self._lua is not None and self._owns_lua:
+            self._lua.release()
+        self._lua = None
+        self._owns_lua = False
+
     def validate(self, *args):
         if self._lua is None:
             raise RuntimeError("LuaManager not initialized.")
@@ -130,4 +144,5 @@ class ReactionAbility(Ability):
         lua.execute(self._script)
         if "reaction_trigger" not in lua.get_defined_variables():
             raise ValueError("Reaction ability must define a reaction_trigger variable.")
-        self._reaction_trigger = lua.get("reaction_trigger")
\ No newline at end of file
+        self._reaction_trigger = LuaManager.to_python_type(lua.get("reaction_trigger"))
+        lua.release()
\ No newline at end of file
@@ -61,7 +61,9 @@ class CompositeAbility(Ability):
         return tuple(sub_ability_headers)
     
     def initialize(self, sub_ability_name, globals):
+        self.release()
         self._lua = LuaManager(self._globals)
+        self._owns_lua = True
         self._lua.merge_globals(globals)
         self._sub_abilities[sub_ability_name].set_lua(self._lua)
 
@@ -4,6 +4,40 @@ from src.util.lua_manager import LuaManager
 from server.backend.database.util.data_storer import DataStorer
 
 class Effect(Observer, DataStorer):
+    # Returns functions to save the globals of an effect's environment and to reset them to the saved values, see refresh
+    GLOBALS_SCRIPT = '''
+    local next, pairs, rawequal = next, pairs, rawequal
+    local env = _ENV
+    local saved = {}
+
+    local function save()
+        saved = {}
+        for k, v in pairs(env) do
+            saved[k] = v
+        end
+    end
+
+    local function reset()
+        local changed = {}
+        for k, v in pairs(env) do
+            if not rawequal(saved[k], v) then
+                changed[k] = true
+            end
+        end
+        for k in next, saved do
+            if rawequal(env[k], nil) then
+                changed[k] = true
+            end
+        end
+        for k in next, changed do
+            env[k] = saved[k]
+        end
+    end
+
+    save()
+    return save, reset
+    '''
+
     def __init__(self, name, script, duration = -1):
         super().__init__()
 
@@ -11,6 +45,14 @@ class Effect(Observer, DataStorer):
         self._globals = {}
         self._effect_functions = []
         self._lua = None
+        self._synced_globals = {}
+        self._bound_statblock = None
+        self._save_globals = None
+        self._reset_globals = None
+        self._save_globals = None
+        self._reset_globals = None
+        # Amount of calls into the live environment still running
+        self._running = 0
         self.duration = duration
 
         SCRIPT_HEADERS = ScriptData.REMOVE_EFFECT + ScriptData.ROLL_RESULT + ScriptData.ADD_VALUE + ScriptData.SET_VALUE + ScriptData.MULTIPLY_VALUE + ScriptData.DURATION + ScriptData.SPEED
@@ -19,6 +61,7 @@ class Effect(Observer, DataStorer):
         lua.execute(SCRIPT_HEADERS)
         lua.connect(self)
         lua.execute(script)
+        lua.release()
 
         self._script = SCRIPT_HEADERS + script
 
@@ -41,15 +84,95 @@ class Effect(Observer, DataStorer):
             self._effect_functions.append(key)
 
     def initialize(self, globals = {}):
+        self.release()
         self._lua = LuaManager()
         self._lua.execute(self._script)
         self._lua.merge_globals(self._globals)
         self._lua.merge_globals(globals)
+        self._synced_globals = Effect._snapshot(self._globals)
+        self._save_globals, self._reset_globals = self._lua.execute(Effect.GLOBALS_SCRIPT)
+        return self._lua
+
+    @property
+    def is_live(self):
+        return self._lua is not None and not self._lua.released
+
+    def refresh(self, globals = {}):
+        """
+        Returns the effect's live Lua environment, creating it if it does not exist yet.
+        Every call starts from the same globals, so any globals the script set during earlier calls are reset first.
+        Then only the given globals and any effect globals changed since the last sync are pushed into Lua.
+        Globals are compared by contents, so tables changed in place are pushed too.
+        """
+        if not self.is_live:
+            return self.initialize(globals)
+        self._reset_globals()
+        changed_globals = {key: value for key, value in self._globals.items() if key not in self._synced_globals or self._synced_globals[key] != value}
+        if changed_globals:
+            self._lua.merge_globals(changed_globals)
+            self._synced_globals.update(Effect._snapshot(changed_globals))
+        if changed_globals or globals:
+            self._lua.merge_globals(globals)
+            self._save_globals()
         return self._lua
 
+    @property
+    def has_unsynced_globals(self):
+        """Whether the effect's globals changed since they were last pushed into its live environment."""
+        return self.is_live and self._globals != self._synced_globals
+
+    def run_detached(self, function_name, globals, *args):
+        """
+        Runs a function in a new environment set up like the live one, leaving the live one as it is.
+        Used for calls made while the effect is already running, which would otherwise change the globals of the running call.
+        """
+        live = self._lua
+        lua = LuaManager()
+        self._lua = lua
+        try:
+            lua.execute(self._script)
+            lua.merge_globals(self._globals)
+            lua.merge_globals(globals)
+            return self.run(function_name, *args)
+        finally:
+            # The effect may have been removed during the call, in which case the live environment is released too
+            released = self._lua is None
+            lua.release()
+            self._lua = live
+            if released:
+                self.release()
+
+    @staticmethod
+    def _snapshot(value):
+        # Copies the dicts and lists of converted Lua tables, so later changes to them can be told apart from the synced values
+        if isinstance(value, dict):
+            return {key: Effect._snapshot(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [Effect._snapshot(item) for item in value]
+        return value
+
+    def release(self):
+        if self._lua is not None:
+            self._lua.release()
+            self._lua = None
+        self._synced_globals = {}
+        self._bound_statblock = None
+        self._save_globals = None
+        self._reset_globals = None
+
     def has_function(self, function_name):
         return function_name in self._effect_functions
 
+    def is_nondeterministic(self, function_name):
+        """
+        Returns true if the effect script declares the given function as nondeterministic, so its results cannot be memoized.
+        Scripts declare this with either 'nondeterministic = true' for all functions, or a list of function names.
+        """
+        nondeterministic = self._globals.get("nondeterministic", False)
+        if isinstance(nondeterministic, bool):
+            return nondeterministic
+        return function_name in nondeterministic
+
     def run(self, function_name, *args):
         if self._lua is None:
             raise RuntimeError("LuaManager not initialized.")
@@ -8,12 +8,21 @@ from src.util.constants import EventType
 from server.backend.database.util.data_storer import DataStorer
 
 class EffectIndex(Observer, Emitter, DataStorer):
+    # Hooks that only derive statblock values, their results are memoized until the index epoch changes
+    MEMOIZED_HOOKS = {"modify_armor_class", "modify_speed", "modify_size_class", "modify_stat", "get_proficiencies"}
+
     def __init__(self):
         Observer.__init__(self)
         Emitter.__init__(self)
         DataStorer.__init__(self)
         
         self._effects = {}
+        # Maps each hook function name to the names of the effects implementing it, in the same order as _effects
+        self._hooks = {}
+        # Counts of effects that declare each hook as nondeterministic, which disables memoization for that hook
+        self._nondeterministic_hooks = {}
+        self._epoch = 0
+        self._memoized_results = {}
         self._condition_manager = ConditionManager()
 
         self.map_data_property("_effects", "effects")
@@ -42,6 +51,9 @@ class EffectIndex(Observer, Emitter, DataStorer):
             # [data] = [item_name, item_effects, statblock]
             for effect_name in data[1].keys():
                 self.remove(f"{data[0]}%{effect_name}")
+        elif event == EventType.STATBLOCK_STATS_CHANGED:
+            # [data] = []
+            self.invalidate()
 
     @property
     def effect_names(self):
@@ -50,23 +62,35 @@ class EffectIndex(Observer, Emitter, DataStorer):
     def has_effect(self, name):
         return name in self.effect_names
 
+    @property
+    def epoch(self):
+        return self._epoch
+
+    def invalidate(self):
+        """Advances the epoch, discarding all memoized hook results."""
+        self._epoch += 1
+        self._memoized_results.clear()
+
     def add(self, effect, duration, statblock = None):
         if isinstance(effect, Effect):
             if effect._name in self._effects:
                 raise ValueError(f"Effect {effect._name} already exists in index.")
             effect.duration = duration
             self._effects[effect._name] = effect
+            for function_name in effect._effect_functions:
+                self._hooks.setdefault(function_name, []).append(effect._name)
+                if effect.is_nondeterministic(function_name):
+                    self._nondeterministic_hooks[function_name] = self._nondeterministic_hooks.get(function_name, 0) + 1
+            self.invalidate()
             if effect.has_function("get_abilities"):
-                effect.initialize({"statblock": StatblockEffectWrapper(statblock, effect)})
-                for effect_ability in effect.run("get_abilities"):
+                for effect_ability in self._run_effect(effect, statblock, "get_abilities"):
                     self.emit(EventType.EFFECT_GRANTED_ABILITY, effect_ability, effect._script, "run")
             for condition in effect._conditions:
                 derived_condition = self._condition_manager.new_condition(condition, effect._name)
                 derived_condition._derived = True
                 self.add(derived_condition, -1)
             if effect.has_function("on_apply"):
-                effect.initialize({"statblock": StatblockEffectWrapper(statblock, effect)})
-                effect.run("on_apply")
+                self._run_effect(effect, statblock, "on_apply")
         elif type(effect) is str:
             self.add(Effect("temp_name", effect), duration)
         
@@ -86,31 +110,100 @@ class EffectIndex(Observer, Emitter, DataStorer):
         # Remove effect, along with any derived conditions
         for remove_name in to_remove:
             removed_effect = self._effects.pop(remove_name)
-            removed_effect.initialize({"statblock": StatblockEffectWrapper(statblock, removed_effect)})
+            for function_name in removed_effect._effect_functions:
+                hook_effects = self._hooks[function_name]
+                hook_effects.remove(remove_name)
+                if not hook_effects:
+                    del self._hooks[function_name]
+                if removed_effect.is_nondeterministic(function_name):
+                    self._nondeterministic_hooks[function_name] -= 1
+                    if self._nondeterministic_hooks[function_name] == 0:
+                        del self._nondeterministic_hooks[function_name]
+            self.invalidate()
             if removed_effect.has_function("on_removal"):
-                removed_effect.run("on_removal")
+                self._run_effect(removed_effect, statblock, "on_removal")
             if removed_effect.has_function("get_abilities"):
-                for effect_ability in removed_effect.run("get_abilities"):
+                for effect_ability in self._run_effect(removed_effect, statblock, "get_abilities"):
                     self.emit(EventType.EFFECT_REMOVED_ABILITY, effect_ability)
+            # Tear down the effect's Lua environment now that it is no longer in the index
+            removed_effect.release()
+
+    def _activate(self, effect, statblock):
+        """
+        Prepares the effect's persistent Lua environment for a call, only rebuilding the statblock binding when the statblock changes.
+        If no statblock is given and the effect is already bound, the existing binding is kept.
+        """
+        if effect.is_live and (statblock is None or statblock is effect._bound_statblock):
+            return effect.refresh()
+        lua = effect.refresh({"statblock": StatblockEffectWrapper(statblock, effect)})
+        effect._bound_statblock = statblock
+        return lua
+
+    def _run_effect(self, effect, statblock, function_name, *args):
+        """
+        Runs a function of the effect with the given statblock bound.
+        Hooks can be called again from inside an effect's own call, so calls made while the effect is running use a separate environment,
+        keeping the running call's statblock and globals as they are.
+        """
+        if effect.has_unsynced_globals:
+            # Hooks of the effect may return other results once its changed globals are pushed
+            self.invalidate()
+        if effect._running:
+            bound_statblock = statblock if statblock is not None else effect._bound_statblock
+            return effect.run_detached(function_name, {"statblock": StatblockEffectWrapper(bound_statblock, effect)}, *args)
+        self._activate(effect, statblock)
+        effect._running += 1
+        try:
+            return effect.run(function_name, *args)
+        finally:
+            effect._running -= 1
 
     def _wrap_args(self, *args):
         args = [arg.wrap(StatblockEffectWrapper) if hasattr(arg, "wrap") else arg for arg in args]
         return args
 
+    def has_hook(self, function_name):
+        return function_name in self._hooks
+
+    def _is_memoizable(self, function_name, args):
+        if function_name not in self.MEMOIZED_HOOKS or function_name in self._nondeterministic_hooks:
+            return False
+        return all(arg is None or isinstance(arg, (str, int, float, bool)) for arg in args)
+
     def get_function_results(self, function_name, statblock, *args):
+        hook_effects = self._hooks.get(function_name)
+        if not hook_effects:
+            return []
+        if self._is_memoizable(function_name, args):
+            if any(self._effects[effect_name].has_unsynced_globals for effect_name in hook_effects):
+                self.invalidate()
+            key = (function_name, args)
+            if key not in self._memoized_results:
+                epoch = self._epoch
+                results = self._run_function(hook_effects, function_name, statblock, *args)
+                # Results are only stored if the index did not change while they were being computed
+                if epoch != self._epoch:
+                    return results
+                self._memoized_results[key] = results
+            return list(self._memoized_results[key])
+        return self._run_function(hook_effects, function_name, statblock, *args)
+
+    def _run_function(self, hook_effects, function_name, statblock, *args):
         results = []
-        # Creating a copy list so that mid-execution dictionary editing does not throw an error
-        keys = list(self.effect_names)
-        for effect_name in keys:
-            effect = self._effects[effect_name]
-            if effect.has_function(function_name):
-                effect.initialize({"statblock": StatblockEffectWrapper(statblock, effect)})
-                result = effect.run(function_name, *self._wrap_args(*args))
-                if result is not None:
-                    results.append(result)
+        wrapped_args = self._wrap_args(*args)
+        # Creating a copy list so that mid-execution index editing does not throw an error
+        for effect_name in list(hook_effects):
+            effect = self._effects.get(effect_name)
+            # Skip effects removed by an earlier effect's hook during this call
+            if effect is None:
+                continue
+            result = self._run_effect(effect, statblock, function_name, *wrapped_args)
+            if result is not None:
+                results.append(result)
         return results
 
     def tick_timers(self, statblock):
+        self.invalidate()
         # Creating a copy list so that mid-execution dictionary editing does not throw an error
         keys = list(self.effect_names)
         for effect_name in keys:
@@ -118,6 +211,5 @@ class EffectIndex(Observer, Emitter, DataStorer):
             effect.tick_timer()
             if effect.duration == 0:
                 if effect.has_function("on_expire"):
-                    effect.initialize({"statblock": StatblockEffectWrapper(statblock, effect)})
-                    effect.run("on_expire")
+                    self._run_effect(effect, statblock, "on_expire")
                 self.remove(effect_name, statblock)
\ No newline at end of file
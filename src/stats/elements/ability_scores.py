@@ -1,9 +1,12 @@
 import math
+from src.events.observer import Observer, Emitter
+from src.util.constants import EventType
 from server.backend.database.util.data_storer import DataStorer
 
-class AbilityScores(DataStorer):
+class AbilityScores(Observer, Emitter, DataStorer):
     def __init__(self, str, dex, con, int, wis, cha):
-        super().__init__()
+        Emitter.__init__(self)
+        DataStorer.__init__(self)
         self.strength = AbilityScore("strength", str)
         self.dexterity = AbilityScore("dexterity", dex)
         self.constitution = AbilityScore("constitution", con)
@@ -11,6 +14,9 @@ class AbilityScores(DataStorer):
         self.wisdom = AbilityScore("wisdom", wis)
         self.charisma = AbilityScore("charisma", cha)
 
+        for ability_score in [self.strength, self.dexterity, self.constitution, self.intelligence, self.wisdom, self.charisma]:
+            ability_score.connect(self)
+
         self.map_data_property("strength", "strength")
         self.map_data_property("dexterity", "dexterity")
         self.map_data_property("constitution", "constitution")
@@ -18,6 +24,10 @@ class AbilityScores(DataStorer):
         self.map_data_property("wisdom", "wisdom")
         self.map_data_property("charisma", "charisma")
     
+    def signal(self, event: str, *data):
+        if event == EventType.STATBLOCK_STATS_CHANGED:
+            self.emit(event, *data)
+
     def get_ability(self, ability_name):
         """
         Returns the AbilityScore property for the given ability.
@@ -48,8 +58,9 @@ class AbilityScores(DataStorer):
         }
         return ABILITIES[shortened_ability_name.lower()]
 
-class AbilityScore:
+class AbilityScore(Emitter):
     def __init__(self, name, value):
+        super().__init__()
         self._name = name
         self._value = value
     
@@ -67,6 +78,7 @@ class AbilityScore:
     def value(self, new_value):
         """Sets the value of the ability score."""
         self._value = new_value
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
 
     @property
     def modifier(self):
@@ -1,8 +1,11 @@
+from src.events.observer import Emitter
+from src.util.constants import EventType
 from server.backend.database.util.data_storer import DataStorer
 
-class Level(DataStorer):
+class Level(Emitter, DataStorer):
     def __init__(self):
-        super().__init__()
+        Emitter.__init__(self)
+        DataStorer.__init__(self)
         self._levels = {}
         self.map_data_property("_levels", "levels")
     
@@ -30,4 +33,5 @@ class Level(DataStorer):
         if class_name not in self._levels:
             self._levels[class_name] = level
         else:
-            self._levels[class_name] += level
\ No newline at end of file
+            self._levels[class_name] += level
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
\ No newline at end of file
@@ -5,6 +5,8 @@ from src.util.constants import EventType
 from src.stats.handlers.ability_score_handler import AbilityScoreHandler
 from src.stats.handlers.hit_point_handler import HitPointHandler
 from src.util.modifier_values import ModifierRolls
+from src.combat.map.cover import CoverEngine
+from src.combat.map.positioned import Positioned
 
 class AttackRollHandler:
     def __init__(self, statblock, dice_roller = None):
@@ -22,7 +24,20 @@ class AttackRollHandler:
     def ability_attack_roll(self, target, attack_stat, damage_string):
         return self._handle_attack_roll(target, attack_stat, damage_string, EventType.TRIGGER_ATTACK_ROLL_RANGED)
 
+    def _get_cover(self, target):
+        """Returns the cover the target has against this attack, or no cover if the attacker and target aren't on the same map."""
+        if not isinstance(self._statblock, Positioned) or not isinstance(target, Positioned):
+            return CoverEngine.NONE
+        map = self._statblock._map
+        if map is None or map is not target._map:
+            return CoverEngine.NONE
+        return map.cover.get_cover(self._statblock, target)
+
     def _handle_attack_roll(self, target, attack_stat, damage_string, attack_type_event):
+        cover = self._get_cover(target)
+        if cover == CoverEngine.TOTAL:
+            return ReturnStatus(False, "Target has total cover.")
+
         attack_modifiers = ModifierRolls(self._statblock._effects.get_function_results("make_attack_roll", self._statblock, target))
         attack_modifiers.merge(ModifierRolls(target._effects.get_function_results("receive_attack_roll", target, self._statblock)))
 
@@ -42,7 +57,7 @@ class AttackRollHandler:
         attack_ability_modifier = AbilityScoreHandler(self._statblock).get_ability_modifier(attack_stat)
         roll_result = self._dice_roller.roll_d20(attack_roll_context.advantage, attack_roll_context.disadvantage)
         success = roll_result >= critical_threshold or attack_roll_context.auto_succeed or \
-            (roll_result != 1 and roll_result + attack_ability_modifier + attack_roll_context.bonus >= target.get_armor_class())
+            (roll_result != 1 and roll_result + attack_ability_modifier + attack_roll_context.bonus >= target.get_armor_class() + CoverEngine.AC_BONUS[cover])
         result_context = TargetedRollResultEventContext(self._statblock, target, roll_result, success, roll_result >= critical_threshold)
 
         if roll_result == 1 or not (attack_roll_context.auto_succeed or result_context.success):
@@ -35,7 +35,7 @@ class InventoryHandler:
         self._statblock._inventory.remove_item(item)
         if isinstance(self._statblock, Positioned):
             x, y, _ = position
-            self._statblock._map.get_tile(x, y)._props.append(item)
+            self._statblock._map.get_tile(x, y).add_prop(item)
     
     def drop_offhand_item(self, position = (-1, -1, 0)):
         item = self._statblock._inventory.offhand
@@ -44,4 +44,4 @@ class InventoryHandler:
         self._statblock._inventory.remove_item(item)
         if isinstance(self._statblock, Positioned):
             x, y, _ = position
-            self._statblock._map.get_tile(x, y)._props.append(item)
\ No newline at end of file
+            self._statblock._map.get_tile(x, y).add_prop(item)
\ No newline at end of file
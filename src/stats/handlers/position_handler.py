@@ -1,4 +1,6 @@
+from src.combat.map.area_of_effect import AreaOfEffect
 from src.combat.map.positioned import Positioned
+from src.util.lua_manager import LuaManager
 
 class PositionHandler:
     def __init__(self, statblock):
@@ -7,4 +9,39 @@ class PositionHandler:
     def distance_to(self, target):
         if not isinstance(self._statblock, Positioned) or not isinstance(target, Positioned):
             return 5
-        return self._statblock.distance_to(target)
\ No newline at end of file
+        return self._statblock.distance_to(target)
+
+    @staticmethod
+    def _to_position(value):
+        if isinstance(value, Positioned):
+            return tuple(value.get_position())
+        return tuple(LuaManager.to_python_type(value))
+
+    def get_targets_in_area(self, shape, size, origin = None, target = None, line_of_effect = True):
+        """
+        Returns every token inside an area of effect, in a single query over the map.
+
+        param shape: str - the shape of the area, one of "sphere", "cube", "cone", "line" or "cylinder"
+        param size: int - the radius of a sphere or cylinder, length of a cone or line, or width of a cube, in feet
+        param origin (optional): Positioned | tuple - the point of origin, by default the position of this statblock
+        param target (optional): Positioned | tuple - the position a cone, line or cube is aimed toward
+        param line_of_effect (optional): bool - whether to leave out tokens that walls or raised ground block from the point of origin
+
+        returns: list[Token] - the tokens inside the area, or no tokens if this statblock is not on a map
+        """
+        if not isinstance(self._statblock, Positioned) or self._statblock._map is None:
+            return []
+        origin = self._statblock.get_position() if origin is None else self._to_position(origin)
+        target = None if target is None else self._to_position(target)
+        area = AreaOfEffect(shape, origin, size, target)
+        return self._statblock._map.get_tokens_in_area(area, line_of_effect)
+
+    def get_targets_in_range(self, distance):
+        """
+        Returns every other token within the given distance in feet of this statblock, closest first.
+
+        returns: list[Token] - the tokens in range, or no tokens if this statblock is not on a map
+        """
+        if not isinstance(self._statblock, Positioned) or self._statblock._map is None:
+            return []
+        return self._statblock._map.get_tokens_in_range(self._statblock.get_position(), distance, ignore = self._statblock)
@@ -18,6 +18,7 @@ class Inventory(Emitter):
 
     def add_item(self, item):
         self._items.append(item)
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
     
     def remove_item(self, item):
         self._items.remove(item)
@@ -27,6 +28,7 @@ class Inventory(Emitter):
             self._offhand = None
         if self._armor == item:
             self._armor = None
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
 
     def equip_item(self, item):
         if not self.has_item(item):
@@ -58,6 +60,7 @@ class Inventory(Emitter):
                 self.add_item(item)
             if item.has_tag(ItemTag.WEAPON_TWO_HANDED):
                 self.offhand = None
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
     
     @offhand.setter
     def offhand(self, item):
@@ -71,6 +74,7 @@ class Inventory(Emitter):
             self.emit(EventType.ITEM_APPLIED_EFFECT, item.name, item.item_effects, self._statblock)
             if not self.has_item(item):
                 self.add_item(item)
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
     
     @property
     def armor(self):
@@ -87,6 +91,7 @@ class Inventory(Emitter):
             self.emit(EventType.ITEM_APPLIED_EFFECT, item.name, item.item_effects, self._statblock)
             if not self.has_item(item):
                 self.add_item(item)
+        self.emit(EventType.STATBLOCK_STATS_CHANGED)
     
     @property
     def equipped(self):
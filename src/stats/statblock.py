@@ -46,6 +46,8 @@ class Statblock(DataStorer):
 
         self._abilities.connect(self._effects)
         self._inventory.connect(self._effects)
+        self._ability_scores.connect(self._effects)
+        self._level.connect(self._effects)
         self._effects.connect(self._abilities)
 
         self._controller: Controller = None
@@ -53,6 +55,11 @@ class Statblock(DataStorer):
     def get_name(self):
         return self._name
 
+    @property
+    def epoch(self):
+        """Returns the epoch of the statblock's derived values, which advances whenever effects, inventory, ability scores or levels change."""
+        return self._effects.epoch
+
     def get_size(self):
         size_modifiers = ModifierValues(self._effects.get_function_results("modify_size_class", self))
         base_size = self._size.size_class
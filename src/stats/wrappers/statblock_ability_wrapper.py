@@ -26,4 +26,7 @@ class StatblockAbilityWrapper(StatblockWrapper):
     def spell_attack_roll(self, target, damage_string):
         if "spellcasting_ability" not in self._ability._globals.keys():
             raise ValueError(f"Spellcasting ability not defined in Ability {self._ability._name}.")
-        return self.ability_attack_roll(target, self._ability._globals["spellcasting_ability"], damage_string)
\ No newline at end of file
+        return self.ability_attack_roll(target, self._ability._globals["spellcasting_ability"], damage_string)
+
+    def _get_lua(self):
+        return self._ability._lua
@@ -21,4 +21,7 @@ class StatblockEffectWrapper(StatblockWrapper):
         if effect_name is None:
             self._statblock.remove_effect(self._effect._name)
         else:
-            self._statblock.remove_effect(effect_name)
\ No newline at end of file
+            self._statblock.remove_effect(effect_name)
+
+    def _get_lua(self):
+        return self._effect._lua
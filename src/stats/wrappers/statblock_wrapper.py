@@ -154,7 +154,25 @@ class StatblockWrapper:
     def distance_to(self, target):
         return self._position_handler.distance_to(target)
 
+    def get_targets_in_area(self, shape, size, origin = None, target = None, line_of_effect = True):
+        if isinstance(origin, StatblockWrapper):
+            origin = origin._statblock
+        if isinstance(target, StatblockWrapper):
+            target = target._statblock
+        targets = self._position_handler.get_targets_in_area(shape, size, origin, target, line_of_effect)
+        lua = self._get_lua()
+        return targets if lua is None else lua.table_from(targets)
+
+    def get_targets_in_range(self, distance):
+        targets = self._position_handler.get_targets_in_range(distance)
+        lua = self._get_lua()
+        return targets if lua is None else lua.table_from(targets)
+
     # Misc
+    def _get_lua(self):
+        # LuaManager of the script using this wrapper, to return lists as Lua tables
+        return None
+
     def __eq__(self, value):
         if isinstance(value, StatblockWrapper):
             return self._statblock == value._statblock
@@ -204,6 +204,9 @@ class EventType:
     ITEM_APPLIED_EFFECT = "item_applied_effect"
     ITEM_REMOVED_EFFECT = "item_removed_effect"
     ABILITY_CONCENTRATION_ENDED = "ability_concentration_ended"
+    STATBLOCK_STATS_CHANGED = "statblock_stats_changed"
+    MAP_TILE_CHANGED = "map_tile_changed"
+    MAP_WALL_CHANGED = "map_wall_changed"
 
     TRIGGER_ABILITY_CHECK_ROLL = "trigger_roll_ability_check"
     TRIGGER_ABILITY_CHECK_SUCCEED = "trigger_ability_check_succeed"
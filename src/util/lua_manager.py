@@ -1,45 +1,316 @@
-import lupa, re
+import lupa, re, threading, hashlib
+from collections import OrderedDict, namedtuple
 from lupa import LuaRuntime, lua_type
 
 from src.events.observer import Emitter
 from src.util.constants import ScriptData
 
+class LuaScriptCache:
+    """
+    Process-wide LRU cache of compiled Lua chunks, keyed by a hash of the script source.
+    Chunks are compiled once into bytecode and loaded into runtimes directly, skipping the parse step on every execution.
+    """
+    DEFAULT_MAX_SIZE = 256
+
+    # Chunk name matches the one used by LuaRuntime.execute(), so error messages are unchanged
+    COMPILE_SCRIPT = '''
+    function(source)
+        local chunk, err = load(source, "<python>", "t")
+        if chunk == nil then
+            return nil
+        end
+        return string.dump(chunk)
+    end
+    '''
+
+    def __init__(self, max_size = DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+        self._compiler = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def script_hash(script):
+        return hashlib.blake2b(script.encode("utf-8"), digest_size = 16).digest()
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def set_max_size(self, max_size):
+        """Sets the maximum amount of compiled chunks kept by the cache, evicting the least recently used extras."""
+        if max_size < 0:
+            raise ValueError("Cache size cannot be negative.")
+        with self._lock:
+            self._max_size = max_size
+            while len(self._compiled) > max_size:
+                self._compiled.popitem(last = False)
+
+    def get(self, script):
+        """
+        Returns the compiled bytecode for the given script source, compiling and caching it on a miss.
+
+        param script: str - the Lua source to compile
+
+        returns:
+            bytes - the compiled chunk
+            None - if the script does not compile
+        """
+        key = self.script_hash(script)
+        with self._lock:
+            bytecode = self._compiled.get(key)
+            if bytecode is not None:
+                self._compiled.move_to_end(key)
+                self.hits += 1
+                return bytecode
+            self.misses += 1
+            if self._compiler is None:
+                # Runtime without string decoding, so dumped bytecode is returned to Python as bytes
+                self._compiler = LuaRuntime(encoding = None).eval(self.COMPILE_SCRIPT)
+            bytecode = self._compiler(script.encode("utf-8"))
+            if bytecode is None:
+                return None
+            if self._max_size > 0:
+                self._compiled[key] = bytecode
+                if len(self._compiled) > self._max_size:
+                    self._compiled.popitem(last = False)
+            return bytecode
+
+    def clear(self):
+        with self._lock:
+            self._compiled.clear()
+            self.hits = 0
+            self.misses = 0
+
+class LuaRuntimePool:
+    """
+    Keeps a bounded set of idle, pre-configured Lua runtimes so LuaManager instances can skip runtime construction.
+    Runtimes are handed out with checkout() and given back with release(), which resets the environment before it is reused.
+    Resetting clears the globals set by scripts and restores the standard library tables, such as string and math, that scripts changed.
+    """
+    DEFAULT_MAX_SIZE = 32
+
+    SETUP_SCRIPT = '''
+    local next, rawset, setmetatable, load = next, rawset, setmetatable, load
+    local reference_callback = nil
+
+    function SetGlobalReference(k, v)
+        if reference_callback ~= nil then
+            reference_callback(k, v)
+        end
+    end
+
+    local proxy = {}
+    local mt = {
+        __index = proxy,
+        __newindex = function(t, k, v)
+            rawset(proxy, k, v)
+            SetGlobalReference(k, v)
+        end,
+        __pairs = function(t)
+            return next, proxy, nil
+        end
+    }
+    setmetatable(_ENV, mt)
+    _G = {}
+
+    local initial = {}
+    for k, v in next, _ENV do
+        initial[k] = v
+    end
+    local env = _ENV
+
+    -- Contents and metatables of the standard library tables, which scripts can change in place
+    local type, getmetatable, setmetatable_raw = type, debug.getmetatable, debug.setmetatable
+    local libraries = {}
+    local function snapshot(t)
+        if type(t) ~= "table" or t == env or libraries[t] ~= nil then
+            return
+        end
+        local contents = {}
+        for k, v in next, t do
+            contents[k] = v
+        end
+        libraries[t] = {contents = contents, metatable = getmetatable(t)}
+    end
+    for k, v in next, initial do
+        if k ~= "_G" then
+            snapshot(v)
+        end
+    end
+    snapshot(initial.package.loaded)
+    snapshot(getmetatable(""))
+
+    local function bind(callback)
+        reference_callback = callback
+    end
+
+    local function reset()
+        reference_callback = nil
+        for k in next, proxy do
+            proxy[k] = nil
+        end
+        for k in next, env do
+            if initial[k] == nil then
+                rawset(env, k, nil)
+            end
+        end
+        for k, v in next, initial do
+            rawset(env, k, v)
+        end
+        rawset(env, "_G", {})
+        for t, saved in next, libraries do
+            setmetatable_raw(t, nil)
+            for k in next, t do
+                if saved.contents[k] == nil then
+                    rawset(t, k, nil)
+                end
+            end
+            for k, v in next, saved.contents do
+                rawset(t, k, v)
+            end
+            setmetatable_raw(t, saved.metatable)
+        end
+    end
+
+    local function run_compiled(bytecode)
+        local chunk, err = load(bytecode, nil, "b")
+        if chunk == nil then
+            error(err, 0)
+        end
+        return chunk()
+    end
+
+    return bind, reset, run_compiled
+    '''
+
+    PooledRuntime = namedtuple("PooledRuntime", ["runtime", "bind", "reset", "run_compiled"])
+
+    def __init__(self, max_size = DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def idle_count(self):
+        return len(self._idle)
+
+    def set_max_size(self, max_size):
+        """Sets the maximum amount of idle runtimes kept by the pool, discarding any extras."""
+        if max_size < 0:
+            raise ValueError("Pool size cannot be negative.")
+        with self._lock:
+            self._max_size = max_size
+            del self._idle[max_size:]
+
+    def prewarm(self, count = None):
+        """Fills the pool with up to count new runtimes, or up to the maximum size if count is not given."""
+        count = self._max_size if count is None else min(count, self._max_size)
+        while len(self._idle) < count:
+            runtime = self._create()
+            with self._lock:
+                if len(self._idle) >= self._max_size:
+                    break
+                self._idle.append(runtime)
+
+    def checkout(self):
+        """
+        Returns an idle runtime from the pool, or creates a new one if the pool is empty.
+
+        returns: PooledRuntime - the runtime, along with its bind(callback) function to set the global reference callback, reset() function to clear user globals
+                                 and run_compiled(bytecode) function to run a chunk from the LuaScriptCache
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._create()
+
+    def release(self, pooled_runtime):
+        """Resets the given PooledRuntime from checkout() and returns it to the pool, or discards it if the pool is full."""
+        pooled_runtime.reset()
+        with self._lock:
+            if len(self._idle) < self._max_size:
+                self._idle.append(pooled_runtime)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+
+    def _create(self):
+        runtime = LuaRuntime(unpack_returned_tuples=True)
+        return LuaRuntimePool.PooledRuntime(runtime, *runtime.execute(self.SETUP_SCRIPT))
+
 class LuaManager(Emitter):
+    runtime_pool = LuaRuntimePool()
+    script_cache = LuaScriptCache()
+
     def __init__(self, globals = {}):
         super().__init__()
-        self._lua = LuaRuntime(unpack_returned_tuples=True)
+        self._pooled_runtime = LuaManager.runtime_pool.checkout()
+        self._lua = self._pooled_runtime.runtime
+        self._pooled_runtime.bind(self.set_reference)
+        self._active_calls = 0
+        self._release_pending = False
 
         self._defined_variables = {}
         self._defined_functions = {}
 
-        setup_metatable = '''
-        local proxy = {}
-        local mt = {
-            __index = proxy,
-            __newindex = function(t, k, v)
-                rawset(proxy, k, v)
-                SetGlobalReference(k, v)
-            end,
-            __pairs = function(t)
-                return next, proxy, nil
-            end
-        }
-        setmetatable(_ENV, mt)
-        _G = {}
-        '''
-        self._lua.globals()["SetGlobalReference"] = self.set_reference
-        self._lua.execute(setup_metatable)
-        self._initial_globals = list(self._lua.globals().keys())
-        
         for key, value in globals.items():
             self.set_global(key, value)
 
+    def release(self):
+        """
+        Returns the underlying runtime to the shared pool, after which this LuaManager can no longer be used.
+        If called while a script is still running in this LuaManager, the release is deferred until the call returns.
+        """
+        if self._pooled_runtime is None:
+            return
+        if self._active_calls > 0:
+            self._release_pending = True
+            return
+        pooled_runtime = self._pooled_runtime
+        self._pooled_runtime = None
+        self._lua = None
+        self._release_pending = False
+        LuaManager.runtime_pool.release(pooled_runtime)
+
+    @property
+    def released(self):
+        return self._pooled_runtime is None
+
+    def _call(self, function, *args):
+        self._active_calls += 1
+        try:
+            return function(*args)
+        finally:
+            self._active_calls -= 1
+            if self._active_calls == 0 and self._release_pending:
+                self.release()
+
     def get(self, key):
         return self._lua.globals()[key]
 
     def set_global(self, key, value):
         self._lua.globals()[key] = value
 
+    def table_from(self, values):
+        """Returns a Lua table with the given list or dict of values, with lists indexed from 1."""
+        return self._lua.table_from(values)
+
     def set_reference(self, key, value):
         if lua_type(value) == 'function':
             self._defined_functions[key] = value
@@ -69,7 +340,11 @@ class LuaManager(Emitter):
         return info['namewhat']
 
     def execute(self, script):
-        return self._lua.execute(script)
+        bytecode = LuaManager.script_cache.get(script)
+        if bytecode is None:
+            # Scripts that fail to compile are run from source to raise the usual Lua error
+            return self._call(self._lua.execute, script)
+        return self._call(self._pooled_runtime.run_compiled, bytecode)
 
     def run(self, function_name, *args):
         function = self._get_function(function_name)
@@ -80,7 +355,7 @@ class LuaManager(Emitter):
             arg = args[i]
             if type(arg) == list or type(arg) == tuple or type(arg) == dict:
                 args[i] = self._lua.table_from(arg)
-        result = function(*args)
+        result = self._call(function, *args)
         if lua_type(result) == 'table':
             return self._recursive_table_convert(result)
         return result
@@ -89,7 +364,7 @@ class LuaManager(Emitter):
         function = self._lua.eval(function_pos)
         if function is None:
             raise ValueError("Function not found.")
-        result = function(*args)
+        result = self._call(function, *args)
         if lua_type(result) == 'table':
             return self._recursive_table_convert(result)
         return result
@@ -153,5 +428,6 @@ class LuaManager(Emitter):
         return converted
 
 
-    def analyze_for_call(self, script, param_name, property_name):
-        return bool(re.compile(f"(\s*|^){param_name}(\.|:){property_name}(\([^\n]*\))?\s*$", re.MULTILINE).search(script))
+    @staticmethod
+    def analyze_for_call(script, param_name, property_name):
+        return bool(re.compile(rf"(\s*|^){param_name}(\.|:){property_name}(\([^\n]*\))?\s*$", re.MULTILINE).search(script))
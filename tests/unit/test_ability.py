@@ -8,6 +8,9 @@ from src.stats.abilities.ability_index import AbilityIndex
 from src.stats.abilities.composite_ability import CompositeAbility
 from src.stats.abilities.sub_ability import SubAbility
 from src.util.return_status import ReturnStatus
+from src.combat.map.map import Map
+from src.combat.map.map_token import Token
+from src.stats.statblock import Statblock
 
 class TestAbilityInstancing(unittest.TestCase):
     INDEX = None
@@ -1114,6 +1117,25 @@ class TestAbilityStatblockWrapper(unittest.TestCase):
         self.WRAPPER.spell_attack_roll(target, "2d6+4 fire")
         ability_attack_roll.assert_called_once_with(target, "int", "2d6+4 fire")
     
+    def test_get_targets_in_area(self):
+        map = Map(10, 10)
+        caster = Token(Statblock("Caster"), (0, 0, 0))
+        near = Token(Statblock("Near"), (5, 4, 0))
+        far = Token(Statblock("Far"), (9, 9, 0))
+        for token in (caster, near, far):
+            map.add_token(token)
+        area_ability = Ability("area", '''
+            use_time = UseTime("action", 1)
+
+            function run(target)
+                local targets = statblock.get_targets_in_area("sphere", 10, target)
+                return #targets, targets[1].get_name()
+            end
+        ''')
+        area_ability.initialize({"statblock": StatblockAbilityWrapper(caster, area_ability)})
+        self.assertEqual((1, "Near"), area_ability.run((5, 5, 0)))
+        area_ability.release()
+
     @patch('src.stats.statblock.Statblock')
     @patch('src.stats.statblock.Statblock')
     def test_statblock_reference(self, target_A, target_B):
@@ -4,6 +4,7 @@ from src.util.constants import EventType
 from src.stats.effects.effect import Effect
 from src.stats.effects.sub_effect import SubEffect
 from src.stats.effects.effect_index import EffectIndex
+from src.stats.statblock import Statblock
 
 class TestEffect(unittest.TestCase):
     def test_add_effect(self):
@@ -556,3 +557,205 @@ class TestEffect(unittest.TestCase):
 
 
 
+
+    def test_persistent_environment(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            nondeterministic = {"modify_armor_class"}
+            calls = 0
+            function modify_armor_class()
+                calls = calls + 1
+                return AddValue(bonus)
+            end
+        ''')
+        effect._globals["bonus"] = 2
+        index.add(effect, -1, statblock)
+
+        # Verify that the environment is created once and reused between calls
+        self.assertEqual([{"operation": "add", "value": 2}], index.get_function_results("modify_armor_class", statblock))
+        lua = effect._lua
+        self.assertEqual([{"operation": "add", "value": 2}], index.get_function_results("modify_armor_class", statblock))
+        self.assertIs(lua, effect._lua)
+        self.assertEqual(1, lua.get("calls"))
+
+        # Verify that changed globals are pushed into the existing environment
+        effect._globals["bonus"] = 3
+        self.assertEqual([{"operation": "add", "value": 3}], index.get_function_results("modify_armor_class", statblock))
+        self.assertIs(lua, effect._lua)
+
+        # Verify that the environment is torn down on removal
+        index.remove("test_effect", statblock)
+        self.assertIsNone(effect._lua)
+        self.assertTrue(lua.released)
+
+    def test_globals_reset_between_calls(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            count = 0
+            function on_attack()
+                count = count + 1
+                local first = seen == nil
+                seen = true
+                return {count, first}
+            end
+        ''')
+        index.add(effect, -1, statblock)
+
+        # Verify that globals the script sets during a call don't carry over to the next call, matching the effect's stored globals
+        for _ in range(3):
+            self.assertEqual([[1, True]], index.get_function_results("on_attack", statblock))
+        self.assertEqual({"count": 0}, effect._globals)
+
+        # Verify that changed effect globals are still kept between calls
+        effect._globals["count"] = 5
+        self.assertEqual([[6, True]], index.get_function_results("on_attack", statblock))
+        self.assertEqual([[6, True]], index.get_function_results("on_attack", statblock))
+
+    def test_persistent_environment_changed_tables(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            nondeterministic = {"modify_armor_class"}
+            bonuses = {armor = 2}
+            function modify_armor_class()
+                return AddValue(bonuses.armor)
+            end
+        ''')
+        index.add(effect, -1, statblock)
+        self.assertEqual([{"operation": "add", "value": 2}], index.get_function_results("modify_armor_class", statblock))
+
+        # Verify that tables changed in place are pushed into the existing environment
+        effect._globals["bonuses"]["armor"] = 4
+        self.assertEqual([{"operation": "add", "value": 4}], index.get_function_results("modify_armor_class", statblock))
+
+    def test_nested_statblock_binding(self):
+        statblock = Statblock("Tester")
+        other = Statblock("Other")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            function get_names()
+                local before = statblock.get_name()
+                nested()
+                return {before, statblock.get_name()}
+            end
+
+            function get_name()
+                return statblock.get_name()
+            end
+        ''')
+        effect._globals["nested"] = lambda: index.get_function_results("get_name", other)
+        index.add(effect, -1, statblock)
+
+        # Verify that a nested call with another statblock doesn't change the binding of the outer call
+        self.assertEqual([["Tester", "Tester"]], index.get_function_results("get_names", statblock))
+        self.assertEqual(["Other"], index.get_function_results("get_name", other))
+
+    def test_hook_index(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect_a = Effect("effect_a", '''
+            function modify_armor_class()
+                return AddValue(1)
+            end
+        ''')
+        effect_b = Effect("effect_b", '''
+            function modify_armor_class()
+                return AddValue(2)
+            end
+
+            function get_proficiencies()
+                return {"stealth"}
+            end
+        ''')
+        index.add(effect_a, -1, statblock)
+        index.add(effect_b, -1, statblock)
+
+        self.assertEqual(["effect_a", "effect_b"], index._hooks["modify_armor_class"])
+        self.assertEqual(["effect_b"], index._hooks["get_proficiencies"])
+        self.assertFalse(index.has_hook("modify_speed"))
+        self.assertEqual([], index.get_function_results("modify_speed", statblock))
+        self.assertEqual([{"operation": "add", "value": 1}, {"operation": "add", "value": 2}], index.get_function_results("modify_armor_class", statblock))
+
+        index.remove("effect_b", statblock)
+        self.assertEqual(["effect_a"], index._hooks["modify_armor_class"])
+        self.assertFalse(index.has_hook("get_proficiencies"))
+
+    def test_memoized_results(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            function modify_armor_class()
+                record_call()
+                return AddValue(statblock.get_ability_modifier("dexterity"))
+            end
+        ''')
+        record_call = MagicMock()
+        effect._globals["record_call"] = record_call
+        index.add(effect, -1, statblock)
+        statblock._ability_scores.dexterity.value = 14
+
+        # Verify that repeated reads between changes do not run the effect again
+        epoch = statblock.epoch
+        self.assertEqual(12, statblock.get_armor_class())
+        self.assertEqual(12, statblock.get_armor_class())
+        self.assertEqual(1, record_call.call_count)
+        self.assertEqual(epoch, statblock.epoch)
+
+        # Verify that changing an ability score advances the epoch and recomputes the value
+        statblock._ability_scores.dexterity.value = 18
+        self.assertNotEqual(epoch, statblock.epoch)
+        self.assertEqual(14, statblock.get_armor_class())
+        self.assertEqual(2, record_call.call_count)
+
+        # Verify that level changes and effect changes advance the epoch
+        epoch = statblock.epoch
+        statblock._level.add_level("fighter")
+        self.assertNotEqual(epoch, statblock.epoch)
+        epoch = statblock.epoch
+        index.add(Effect("other_effect", ""), -1, statblock)
+        self.assertNotEqual(epoch, statblock.epoch)
+
+    def test_memoized_results_global_changes(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            bonus = 1
+            function modify_armor_class()
+                return AddValue(bonus)
+            end
+
+            function on_attack()
+                return bonus
+            end
+        ''')
+        index.add(effect, -1, statblock)
+        self.assertEqual(11, statblock.get_armor_class())
+
+        # Verify that changing an effect global advances the epoch and recomputes the value
+        epoch = statblock.epoch
+        effect._globals["bonus"] = 3
+        self.assertEqual(13, statblock.get_armor_class())
+        self.assertNotEqual(epoch, statblock.epoch)
+
+        # Verify that the same holds when another hook pushes the changed global first
+        effect._globals["bonus"] = 4
+        self.assertEqual([4], index.get_function_results("on_attack", statblock))
+        self.assertEqual(14, statblock.get_armor_class())
+
+    def test_nondeterministic_results(self):
+        statblock = Statblock("Tester")
+        index = statblock._effects
+        effect = Effect("test_effect", '''
+            nondeterministic = true
+            function modify_armor_class()
+                return AddValue(next_bonus())
+            end
+        ''')
+        bonuses = iter([1, 2])
+        effect._globals["next_bonus"] = lambda: next(bonuses)
+        index.add(effect, -1, statblock)
+
+        self.assertEqual(11, statblock.get_armor_class())
+        self.assertEqual(12, statblock.get_armor_class())
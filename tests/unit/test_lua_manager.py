@@ -0,0 +1,122 @@
+import unittest
+from src.util.lua_manager import LuaManager, LuaRuntimePool, LuaScriptCache
+
+class TestLuaRuntimePool(unittest.TestCase):
+    def test_release_returns_runtime_to_pool(self):
+        pool = LuaRuntimePool(2)
+        pooled_runtime = pool.checkout()
+        self.assertEqual(0, pool.idle_count)
+
+        pool.release(pooled_runtime)
+        self.assertEqual(1, pool.idle_count)
+        self.assertIs(pooled_runtime, pool.checkout())
+
+    def test_size_cap(self):
+        pool = LuaRuntimePool(1)
+        first = pool.checkout()
+        second = pool.checkout()
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(1, pool.idle_count)
+
+        pool.prewarm(5)
+        self.assertEqual(1, pool.idle_count)
+
+        pool.set_max_size(0)
+        self.assertEqual(0, pool.idle_count)
+
+    def test_reset_clears_user_globals(self):
+        lua = LuaManager({"preset": 5})
+        lua.execute('''
+            value = 10
+            function get_value()
+                return value + preset
+            end
+            print = nil
+        ''')
+        self.assertEqual(15, lua.run("get_value"))
+        runtime = lua._lua
+        lua.release()
+        self.assertTrue(lua.released)
+
+        # The pool hands back the most recently released runtime first
+        reused = LuaManager()
+        self.assertIs(runtime, reused._lua)
+        self.assertIsNone(reused.get("value"))
+        self.assertIsNone(reused.get("preset"))
+        self.assertIsNone(reused.get("get_value"))
+        self.assertIsNotNone(reused.get("print"))
+        self.assertEqual([], reused.get_defined_variables())
+        reused.release()
+
+    def test_reset_restores_standard_library(self):
+        lua = LuaManager()
+        runtime = lua._lua
+        lua.execute('''
+            string.upper = function() return "changed" end
+            string.extra = 1
+            math.floor = nil
+            setmetatable(math, {__index = function() return 0 end})
+        ''')
+        lua.release()
+
+        reused = LuaManager()
+        self.assertIs(runtime, reused._lua)
+        self.assertEqual("A", reused._lua.eval('("a"):upper()'))
+        self.assertIsNone(reused._lua.eval("string.extra"))
+        self.assertEqual(1, reused._lua.eval("math.floor(1.5)"))
+        self.assertIsNone(reused._lua.eval("math.missing"))
+        reused.release()
+
+    def test_release_deferred_during_call(self):
+        lua = LuaManager()
+        lua.set_global("release", lua.release)
+        lua.execute('''
+            function run()
+                release()
+                return 1
+            end
+        ''')
+        self.assertEqual(1, lua.run("run"))
+        self.assertTrue(lua.released)
+
+class TestLuaScriptCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = LuaScriptCache()
+        first = cache.get("value = 1")
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        self.assertIs(first, cache.get("value = 1"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(0.5, cache.hit_rate)
+
+    def test_lru_eviction(self):
+        cache = LuaScriptCache(2)
+        cache.get("a = 1")
+        cache.get("b = 2")
+        cache.get("a = 1")
+        cache.get("c = 3")
+        self.assertEqual(2, len(cache))
+
+        # The least recently used script should have been evicted
+        cache.get("a = 1")
+        cache.get("b = 2")
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(4, cache.misses)
+
+    def test_invalid_script(self):
+        cache = LuaScriptCache()
+        self.assertIsNone(cache.get("value = = 1"))
+        self.assertEqual(0, len(cache))
+
+    def test_execute_compiled_script(self):
+        lua = LuaManager()
+        lua.execute('''
+            value = 10
+            function get_value()
+                return value
+            end
+        ''')
+        self.assertEqual(10, lua.run("get_value"))
+        self.assertEqual(["value"], lua.get_defined_variables())
+        self.assertEqual(["get_value"], lua.get_defined_functions())
+        lua.release()
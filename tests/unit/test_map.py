@@ -0,0 +1,280 @@
+import unittest
+from src.combat.map.area_of_effect import AreaOfEffect
+from src.combat.map.cover import CoverEngine
+from src.combat.map.map import Map
+from src.combat.map.map_navigation import NavigationHandler
+from src.combat.map.map_token import Token
+from src.combat.map.movement_profile import MovementProfile
+from src.stats.items.tags import ItemTag
+from src.stats.items.weapon_item import WeaponItem
+from src.stats.size import Size
+from src.stats.statblock import Statblock
+
+class TestMap(unittest.TestCase):
+    def test_token_occupancy(self):
+        map = Map(6, 6)
+        small = Token(Statblock("Small", id = "small"), (0, 0, 0))
+        large = Token(Statblock("Large", id = "large", size = Size.LARGE), (2, 3, 0))
+        map.add_token(small)
+        map.add_token(large)
+
+        self.assertEqual([small], map.get_tokens(0, 0))
+        for cell in [(2, 3), (3, 3), (2, 4), (3, 4)]:
+            self.assertEqual([large], map.get_tokens(*cell))
+        self.assertEqual([], map.get_tokens(4, 4))
+        self.assertFalse(map.is_occupied(0, 0, ignore = small))
+
+        large.set_position((3, 4, 0))
+        self.assertEqual([], map.get_tokens(2, 3))
+        self.assertEqual([large], map.get_tokens(4, 5))
+
+        # Moving through an extension moves the whole token
+        large._extensions[(1, 1)].set_position((0, 2, 0))
+        self.assertEqual([large], map.get_tokens(1, 3))
+        self.assertEqual([], map.get_tokens(4, 5))
+
+    def test_token_lookup(self):
+        map = Map(3, 3)
+        first = Token(Statblock("First", id = "first"), (0, 0, 0))
+        second = Token(Statblock("Second", id = "second"), (1, 1, 0))
+        map.add_token(first)
+        map.add_token(second)
+
+        self.assertIs(second, map.get_token_by_id("second"))
+        self.assertEqual(1, map.get_token_index("second"))
+        self.assertIsNone(map.get_token_by_id("missing"))
+        self.assertIsNone(map.get_token_index("missing"))
+
+    def test_navigation_avoids_occupied_tiles(self):
+        map = Map(5, 1)
+        mover = Token(Statblock("Mover"), (0, 0, 0))
+        blocker = Token(Statblock("Blocker"), (2, 0, 0))
+        map.add_token(mover)
+        map.add_token(blocker)
+        nav = NavigationHandler(map)
+
+        paths = nav.get_all_paths(mover, mover.get_position(), MovementProfile(walk = 30))
+        self.assertEqual(5, paths[(1, 0, 0)].distance)
+        self.assertEqual(15, paths[(2, 0, 0)].distance)
+
+    def test_traversal_layer_updates(self):
+        map = Map(3, 3, 3)
+        layer = map.traversal
+        self.assertIsNone(map.get_climb_dc((1, 1, 0)))
+
+        map.get_tile(2, 1).height = 2
+        map.get_tile(1, 1)._wall_right.set_passable(False)
+        map.get_tile(1, 1)._wall_right.set_climb_dc(15, 0)
+        self.assertEqual(2, layer.ground[2, 1])
+        self.assertEqual(15, map.get_climb_dc((1, 1, 0)))
+        self.assertEqual(25, map.get_climb_dc((1, 1, 1)))
+        self.assertIsNone(map.get_climb_dc((1, 1, 2)))
+
+        map.get_tile(1, 1)._wall_right.set_passable(True)
+        self.assertFalse(layer.climbable[1, 1].any())
+
+        map.get_tile(0, 0).terrain_difficulty = 1
+        map.get_tile(0, 1).swimmable = True
+        map.get_tile(0, 1).max_depth = 2
+        self.assertEqual(2, layer.multiplier[0, 0])
+        self.assertTrue(layer.swimmable[0, 1])
+        self.assertEqual(2, layer.max_depth[0, 1])
+        self.assertEqual(2, layer.lists()[2][0][1])
+
+    def test_threat_map(self):
+        map = Map(10, 6)
+        mover = Token(Statblock("Mover"), (0, 2, 0))
+        guard = Token(Statblock("Guard"), (3, 2, 0))
+        ogre = Token(Statblock("Ogre", size = Size.LARGE), (7, 2, 0))
+        for token in (mover, guard, ogre):
+            map.add_token(token)
+        threats = map.threats
+
+        self.assertEqual([guard], threats.get_threatening(2, 1))
+        self.assertEqual([], threats.get_threatening(1, 2, ignore = mover))
+        # Large tokens threaten around their whole footprint
+        self.assertTrue(threats.is_threatened(9, 4))
+        self.assertFalse(threats.is_threatened(0, 2, ignore = mover))
+
+        path = [(x, 1, 0) for x in range(10)]
+        exits = threats.get_reach_exits(path, mover)
+        self.assertEqual([(4, guard)], exits)
+        self.assertEqual([], threats.get_reach_exits(path[:4], mover))
+
+        # Reach weapons extend the threatened area, once the map is rebuilt
+        guard._statblock._inventory.main_hand = WeaponItem("Glaive", "", 6, Size.MEDIUM, [ItemTag.WEAPON_REACH])
+        threats.invalidate()
+        self.assertEqual([guard], threats.get_threatening(1, 2, ignore = mover))
+        self.assertEqual([(5, guard)], threats.get_reach_exits(path, mover))
+
+        # Moving a token rebuilds the map
+        rebuilds = threats.rebuilds
+        guard.set_position((3, 5, 0))
+        self.assertEqual([], threats.get_reach_exits(path, mover))
+        self.assertEqual(rebuilds + 1, threats.rebuilds)
+
+        # Threat sets are kept per ignored token until the map is rebuilt or invalidated
+        threat_sets = threats.get_threat_sets(ignore = mover)
+        self.assertIs(threat_sets, threats.get_threat_sets(ignore = mover))
+        self.assertIsNot(threat_sets, threats.get_threat_sets(ignore = guard))
+        self.assertEqual(frozenset({id(guard)}), threat_sets[(3, 3)])
+        self.assertNotIn((0, 2), threat_sets)
+        threats.invalidate()
+        self.assertIsNot(threat_sets, threats.get_threat_sets(ignore = mover))
+
+    def test_field_of_view(self):
+        map = Map(6, 3, 2)
+        viewer = Token(Statblock("Viewer"), (0, 0, 0))
+        map.add_token(viewer)
+        fov = map.field_of_view
+
+        self.assertTrue(viewer.can_see((5, 2, 0)))
+        self.assertTrue(viewer.get_visibility().all())
+
+        # Walls block sight at the heights they are impassable at
+        map.get_tile(1, 0)._wall_right.set_passable(False, 0)
+        self.assertFalse(viewer.can_see((3, 0, 0)))
+        self.assertTrue(viewer.can_see((3, 1, 0)))
+        self.assertTrue(fov.can_see((0, 0, 1), (3, 0, 1)))
+
+        # Raised ground blocks sight below its height, and positions inside it can't be seen
+        map.get_tile(2, 2).height = 2
+        self.assertFalse(fov.can_see((0, 2, 0), (4, 2, 0)))
+        self.assertFalse(fov.can_see((0, 2, 0), (2, 2, 1)))
+        self.assertTrue(fov.can_see((0, 2, 1), (1, 2, 1)))
+
+        # Results are cached until the map changes
+        viewer.can_see((5, 2, 0))
+        hits = fov.cache.hits
+        viewer.can_see((4, 2, 0))
+        self.assertEqual(hits + 1, fov.cache.hits)
+        self.assertFalse(fov.can_see((0, 0, 0), (6, 0, 0)))
+
+    def test_cover(self):
+        map = Map(8, 8)
+        attacker = Token(Statblock("Attacker"), (0, 5, 0))
+        ogre = Token(Statblock("Ogre", size = Size.LARGE), (0, 0, 0))
+        target = Token(Statblock("Target"), (6, 5, 0))
+        for token in (attacker, ogre, target):
+            map.add_token(token)
+        cover = map.cover
+
+        self.assertEqual(cover.NONE, cover.get_cover(attacker, target))
+
+        # Walls give their cover at every height, and gaps in them can be attacked through
+        for y in range(8):
+            map.get_tile(3, y)._wall_right.set_cover(cover.HALF)
+        self.assertEqual(cover.HALF, cover.get_cover(attacker, target))
+        self.assertEqual(cover.HALF, cover.get_cover(target, attacker))
+        map.get_tile(3, 5)._wall_right.set_cover(cover.NONE)
+        self.assertEqual(cover.NONE, cover.get_cover(attacker, target))
+
+        # Lines blocked entirely only give total cover when every line is blocked, large tokens can attack from any corner of their space
+        for y in range(8):
+            map.get_tile(3, y)._wall_right.set_cover(cover.TOTAL if y >= 2 else cover.NONE)
+        matrix = cover.get_cover_matrix([attacker, ogre], [target])
+        self.assertEqual([[cover.TOTAL], [cover.THREE_QUARTERS]], matrix.tolist())
+        # Raised ground blocks the lines passing below its height
+        map.get_tile(3, 0).height = 1
+        map.get_tile(3, 1).height = 1
+        self.assertEqual(cover.TOTAL, cover.get_cover(ogre, target))
+
+        # Results are cached until the map changes or a token moves
+        cover.get_cover_matrix([attacker, ogre], [target])
+        hits = cover.cache.hits
+        cover.get_cover_matrix([attacker, ogre], [target])
+        self.assertEqual(hits + 2, cover.cache.hits)
+        target.set_position((2, 5, 0))
+        self.assertEqual(cover.NONE, cover.get_cover(attacker, target))
+
+    def test_cover_walls_next_to_tokens(self):
+        # Walls on the edges of the tokens' spaces give cover like walls between them
+        for wall_x, defender_x in ((0, 1), (0, 3), (2, 3), (1, 3)):
+            for wall_cover in (CoverEngine.HALF, CoverEngine.TOTAL):
+                map = Map(6, 3, 2)
+                attacker = Token(Statblock("Attacker"), (0, 1, 0))
+                defender = Token(Statblock("Defender"), (defender_x, 1, 0))
+                map.add_token(attacker)
+                map.add_token(defender)
+                for y in range(3):
+                    map.get_tile(wall_x, y)._wall_right.set_passable(wall_cover != CoverEngine.TOTAL)
+                    map.get_tile(wall_x, y)._wall_right.set_cover(wall_cover)
+                self.assertEqual(wall_cover, map.cover.get_cover(attacker, defender))
+                self.assertEqual(wall_cover, map.cover.get_cover(defender, attacker))
+
+    def test_get_tokens_in_area(self):
+        map = Map(12, 12)
+        caster = Token(Statblock("Caster"), (2, 5, 0))
+        ahead = Token(Statblock("Ahead"), (5, 5, 0))
+        beside = Token(Statblock("Beside"), (4, 6, 0))
+        ogre = Token(Statblock("Ogre", size = Size.LARGE), (8, 8, 0))
+        for token in (caster, ahead, beside, ogre):
+            map.add_token(token)
+
+        self.assertEqual([caster, ahead, beside], map.get_tokens_in_area(AreaOfEffect(AreaOfEffect.SPHERE, (4, 5, 0), 10)))
+        self.assertEqual([ahead, beside], map.get_tokens_in_area(AreaOfEffect(AreaOfEffect.SPHERE, (4, 5, 0), 10), ignore = caster))
+        # Large tokens are inside an area if any of their footprint is
+        self.assertEqual([ogre], map.get_tokens_in_area(AreaOfEffect(AreaOfEffect.CUBE, (10, 9, 0), 10, target = (0, 9, 0))))
+        self.assertEqual([ahead, beside], map.get_tokens_in_area(AreaOfEffect(AreaOfEffect.CONE, (2, 5, 0), 15, target = (5, 5, 0))))
+        self.assertEqual([ahead], map.get_tokens_in_area(AreaOfEffect(AreaOfEffect.LINE, (2, 5, 0), 60, target = (11, 5, 0))))
+        self.assertEqual([ogre], map.get_tokens_in_area(AreaOfEffect(AreaOfEffect.CYLINDER, (8, 7, 0), 5)))
+
+        # Walls between the point of origin and a token block the line of effect
+        map.get_tile(3, 5)._wall_right.set_passable(False)
+        area = AreaOfEffect(AreaOfEffect.LINE, (2, 5, 0), 60, target = (11, 5, 0))
+        self.assertEqual([ahead], map.get_tokens_in_area(area))
+        self.assertEqual([], map.get_tokens_in_area(area, line_of_effect = True))
+
+    def test_spatial_hash(self):
+        map = Map(30, 30)
+        center = Token(Statblock("Center"), (10, 10, 0))
+        near = Token(Statblock("Near"), (12, 10, 0))
+        ogre = Token(Statblock("Ogre", size = Size.LARGE), (4, 10, 0))
+        far = Token(Statblock("Far"), (29, 29, 0))
+        for token in (center, near, ogre, far):
+            map.add_token(token)
+
+        # Distances are measured to the closest tile of a footprint
+        self.assertEqual([near, ogre], map.get_tokens_in_range((10, 10, 0), 25, ignore = center))
+        self.assertEqual([center, near], map.get_nearest_tokens((10, 10, 0), 2))
+        self.assertEqual([center, near, ogre], map.get_nearest_tokens((10, 10, 0), 5, max_distance = 50))
+        self.assertEqual([far], map.get_nearest_tokens((28, 28, 0), 1))
+        self.assertEqual([center, ogre], map.get_tokens_in_bounds(5, 10, 10, 20))
+
+        # Moving tokens moves them between buckets
+        far.set_position((11, 11, 0))
+        self.assertEqual([center, far], map.get_nearest_tokens((10, 10, 0), 2))
+        self.assertEqual([], map.get_tokens_in_range((28, 28, 0), 30))
+        self.assertEqual(4, len(map.spatial_hash))
+
+    def test_export_view_data_fog_of_war(self):
+        map = Map(8, 3)
+        for y in range(3):
+            map.get_tile(3, y)._wall_right.set_passable(False)
+        viewer = Token(Statblock("Viewer", id = "viewer"), (0, 1, 0))
+        hidden = Token(Statblock("Hidden", id = "hidden"), (6, 1, 0))
+        map.add_token(viewer)
+        map.add_token(hidden)
+
+        # Only the tiles and tokens on the viewer's side of the wall are exported
+        view = map.export_view_data("viewer")
+        self.assertEqual(12, len(view["tiles"]))
+        self.assertTrue(all(tile["visible"] and tile["x"] <= 3 for tile in view["tiles"]))
+        self.assertEqual(["viewer"], [token["id"] for token in view["tokens"]])
+        view = map.export_view_data("viewer", view_range = 5)
+        self.assertEqual(6, sum(tile["visible"] for tile in view["tiles"]))
+
+        # Tiles seen before are remembered as they were last seen
+        map.get_tile(0, 0).height = 1
+        map.export_view_data("viewer")
+        viewer.set_position((5, 1, 0))
+        map.get_tile(0, 0).terrain_difficulty = 1
+        view = map.export_view_data("viewer")
+        self.assertEqual(24, len(view["tiles"]))
+        remembered = next(tile for tile in view["tiles"] if (tile["x"], tile["y"]) == (0, 0))
+        self.assertFalse(remembered["visible"])
+        self.assertEqual((1, 0), (remembered["height"], remembered["terrain_difficulty"]))
+        self.assertEqual(["viewer", "hidden"], [token["id"] for token in view["tokens"]])
+
+        # Statblocks without a token see the whole map
+        self.assertEqual(24, len(map.export_view_data("someone")["tiles"]))
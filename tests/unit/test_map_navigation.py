@@ -0,0 +1,353 @@
+import unittest
+from unittest.mock import patch
+from src.combat.map.map import Map
+from src.combat.map.map_navigation import NavigationHandler
+from src.combat.map.map_token import Token
+from src.combat.map.movement_profile import MovementProfile
+from src.combat.map.navigation_graph import NavigationGraph
+from src.combat.map.path_cache import PathCache
+from src.stats.items.tags import ItemTag
+from src.stats.items.weapon_item import WeaponItem
+from src.stats.size import Size
+from src.stats.movement.speed import Speed
+from src.stats.statblock import Statblock
+
+class TestNavigationHandler(unittest.TestCase):
+    def test_movement_profile(self):
+        statblock = Statblock("Tester", speed = Speed(30, fly = 10))
+        statblock._speed.distance_moved = 5
+        profile = MovementProfile.from_statblock(statblock)
+
+        self.assertEqual((30, 10, 0, 0, 0, 5), (profile.walk, profile.fly, profile.swim, profile.climb, profile.burrow, profile.distance_moved))
+        self.assertEqual(profile, MovementProfile(30, 10, distance_moved = 5))
+        self.assertEqual(hash(profile), hash(MovementProfile(30, 10, distance_moved = 5)))
+        self.assertNotEqual(profile, profile.with_distance_moved(0))
+        with self.assertRaises(AttributeError):
+            profile._walk = 5
+
+    def test_speed_resolved_once_per_query(self):
+        map = Map(5, 5)
+        token = Token(Statblock("Tester"), (0, 0, 0))
+        map.add_token(token)
+        nav = NavigationHandler(map)
+
+        with patch.object(Statblock, "get_speed", return_value = Speed(30)) as get_speed:
+            paths = nav.get_all_paths(token, (0, 0, 0))
+        get_speed.assert_called_once()
+        self.assertEqual(15, paths[(3, 0, 0)].distance)
+        self.assertEqual(14, paths[(2, 2, 0)].distance)
+
+    def test_path_with_profile(self):
+        map = Map(5, 5)
+        nav = NavigationHandler(map)
+
+        path = nav.get_path(None, (0, 0, 0), (4, 0, 0), MovementProfile(walk = 30))
+        self.assertEqual([(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 0, 0), (4, 0, 0)], path.path)
+        self.assertEqual(20, path.distance)
+        self.assertIsNone(nav.get_path(None, (0, 0, 0), (4, 0, 0), MovementProfile(walk = 15)))
+
+    def test_navigation_graph(self):
+        graph = NavigationGraph(3, 3, 2, 5, 7, 8)
+        self.assertEqual(18, graph.node_count)
+        # Every ordered pair of adjacent nodes is an edge
+        self.assertEqual(178, graph.edge_count)
+
+        center = graph.node_id((1, 1, 0))
+        self.assertEqual((1, 1, 0), graph.position(center))
+        neighbors = dict((graph.position(id), length) for id, length in graph.neighbors(center))
+        self.assertEqual(17, len(neighbors))
+        self.assertEqual(5, neighbors[(2, 1, 0)])
+        self.assertEqual(5, neighbors[(1, 1, 1)])
+        self.assertEqual(7, neighbors[(2, 2, 0)])
+        self.assertEqual(8, neighbors[(2, 2, 1)])
+        self.assertIsNone(graph.node_id((3, 0, 0)))
+        self.assertLess(graph.node_id((0, 2, 1)), graph.node_id((1, 0, 0)))
+
+    def test_lazy_paths(self):
+        map = Map(5, 5)
+        nav = NavigationHandler(map)
+
+        paths = nav.get_all_paths(None, (0, 0, 0), MovementProfile(walk = 10))
+        costs = paths.costs()
+        self.assertEqual(len(paths), len(costs))
+        self.assertEqual(0, costs[(0, 0, 0)])
+        self.assertEqual(10, costs[(2, 0, 0)])
+        self.assertNotIn((3, 0, 0), paths)
+        self.assertIsNone(paths.distance((3, 0, 0)))
+        with self.assertRaises(KeyError):
+            paths[(3, 0, 0)]
+
+        path = paths[(2, 0, 0)]
+        self.assertEqual([(0, 0, 0), (1, 0, 0), (2, 0, 0)], path.path)
+        self.assertEqual(10, path.distance)
+
+    def test_reachable_within(self):
+        map = Map(9, 9)
+        token = Token(Statblock("Tester"), (4, 4, 0))
+        map.add_token(token)
+        nav = NavigationHandler(map)
+
+        reachable = nav.reachable_within(token, 10, profile = MovementProfile(walk = 30))
+        self.assertEqual(0, reachable.costs[(4, 4, 0)])
+        self.assertEqual(10, reachable.costs[(6, 4, 0)])
+        self.assertEqual(7, reachable.costs[(5, 5, 0)])
+        self.assertNotIn((7, 4, 0), reachable)
+        self.assertTrue(all(cost <= 10 for cost in reachable.costs.values()))
+        self.assertEqual(reachable.costs, {position: cost for position, cost in nav.get_all_paths(token, (4, 4, 0), MovementProfile(walk = 30)).costs().items() if cost <= 10})
+
+        self.assertIn((6, 4, 0), reachable.frontier)
+        self.assertNotIn((4, 4, 0), reachable.frontier)
+        self.assertTrue(reachable.frontier <= set(reachable.costs))
+
+    def test_a_star_path(self):
+        map = Map(10, 10, 2)
+        for x in range(3, 7):
+            map.get_tile(x, 4).terrain_difficulty = 1
+        nav = NavigationHandler(map)
+        profile = MovementProfile(walk = 60)
+
+        self.assertEqual(25, NavigationHandler.estimate_distance((0, 0, 0), (2, 4, 1)))
+        all_paths = NavigationHandler(map).get_all_paths(None, (5, 1, 0), profile)
+        with patch.object(NavigationHandler, "_get_traversal_distance", wraps = nav._get_traversal_distance) as traversal:
+            path = nav.get_path(None, (5, 1, 0), (5, 8, 0), profile)
+        self.assertEqual(all_paths[(5, 8, 0)].distance, path.distance)
+        self.assertEqual((5, 1, 0), path.start)
+        self.assertEqual((5, 8, 0), path.end)
+        self.assertLess(traversal.call_count, nav._graph.edge_count)
+
+    def test_walls_block_movement(self):
+        map = Map(3, 3)
+        nav = NavigationHandler(map)
+        profile = MovementProfile(walk = 30)
+        self.assertEqual(7, nav.get_path(None, (0, 0, 0), (1, 1, 0), profile).distance)
+
+        # A wall between (0, 0) and (1, 0) blocks the straight move and the diagonal around its corner
+        map.get_tile(0, 0)._wall_right.set_passable(False)
+        self.assertEqual(1, map.version)
+        self.assertEqual(10, nav.get_path(None, (0, 0, 0), (1, 1, 0), profile).distance)
+        self.assertEqual(15, nav.get_path(None, (0, 0, 0), (1, 0, 0), profile).distance)
+        self.assertEqual(nav._graph.blocked.tolist(), NavigationHandler(map)._graph.blocked.tolist())
+
+        map.get_tile(0, 0)._wall_right.set_passable(True)
+        self.assertEqual(5, nav.get_path(None, (0, 0, 0), (1, 0, 0), profile).distance)
+
+    def test_dirty_regions(self):
+        map = Map(4, 4)
+        version = map.version
+        map.get_tile(2, 2).height = 1
+        self.assertEqual([(1, 1, 3, 3)], map.get_dirty_regions(version))
+        self.assertEqual([], map.get_dirty_regions(map.version))
+
+        for _ in range(Map.MAX_TRACKED_CHANGES):
+            map.get_tile(0, 0).terrain_difficulty = 1
+        self.assertIsNone(map.get_dirty_regions(version))
+
+    def test_path_cache(self):
+        map = Map(5, 5)
+        token = Token(Statblock("Tester"), (0, 0, 0))
+        map.add_token(token)
+        nav = NavigationHandler(map)
+        profile = MovementProfile(walk = 30)
+
+        with patch.object(NavigationHandler, "_search", wraps = nav._search) as search:
+            first = nav.get_all_paths(token, (0, 0, 0), profile)
+            second = nav.get_all_paths(token, (0, 0, 0), profile)
+            # Point-to-point queries reuse the full search from the same start
+            path = nav.get_path(token, (0, 0, 0), (4, 4, 0), profile)
+            self.assertEqual(1, search.call_count)
+            self.assertEqual(first.costs(), second.costs())
+            self.assertEqual(28, path.distance)
+            self.assertEqual((1, 2), (nav.cache.hits, nav.cache.misses))
+
+            nav.get_all_paths(token, (0, 0, 0), profile.with_distance_moved(5))
+            self.assertEqual(2, search.call_count)
+
+            # Moving a token or changing the map invalidates cached results
+            other = Token(Statblock("Other"), (2, 2, 0))
+            map.add_token(other)
+            self.assertEqual(21, nav.get_all_paths(token, (0, 0, 0), profile).distance((2, 2, 0)))
+            other.set_position((3, 3, 0))
+            self.assertEqual(7, nav.get_all_paths(token, (0, 0, 0), profile).distance((1, 1, 0)))
+            map.get_tile(1, 1).terrain_difficulty = 1
+            self.assertEqual(14, nav.get_all_paths(token, (0, 0, 0), profile).distance((1, 1, 0)))
+            self.assertEqual(5, search.call_count)
+        self.assertEqual(3, nav.cache.invalidations)
+
+    def test_path_cache_eviction(self):
+        cache = PathCache(2)
+        cache.put("a", (0, 0), 1)
+        cache.put("b", (0, 0), 2)
+        cache.get("a", (0, 0))
+        cache.put("c", (0, 0), 3)
+        self.assertIsNone(cache.get("b", (0, 0)))
+        self.assertEqual(1, cache.get("a", (0, 0)))
+        self.assertEqual(2 / 3, cache.hit_rate)
+        self.assertIsNone(cache.get("a", (1, 0)))
+        self.assertEqual(0, len(cache))
+
+    def test_distance_field(self):
+        map = Map(7, 3)
+        map.get_tile(3, 1).terrain_difficulty = 1
+        nav = NavigationHandler(map)
+
+        field = nav.get_distance_field([(0, 1, 0), (6, 1, 0)])
+        self.assertEqual(0, field.distance((0, 1, 0)))
+        self.assertEqual(10, field.distance((2, 1, 0)))
+        self.assertEqual((0, 1, 0), field.nearest_source((2, 1, 0)))
+        self.assertEqual((6, 1, 0), field.nearest_source((5, 0, 0)))
+        self.assertEqual((1, 1, 0), field.next_step((2, 1, 0)))
+        self.assertEqual((-1, 0, 0), field.direction((2, 1, 0)))
+        self.assertIsNone(field.next_step((0, 1, 0)))
+        # Leaving the difficult tile costs the same as leaving any other, entering it costs double
+        self.assertEqual(15, field.distance((3, 1, 0)))
+        self.assertEqual(sorted([(0, 0, 0), (0, 1, 0), (0, 2, 0), (1, 0, 0), (1, 1, 0), (1, 2, 0), (5, 0, 0), (5, 1, 0), (5, 2, 0), (6, 0, 0), (6, 1, 0), (6, 2, 0)]), sorted(field.within(7)))
+
+        # Each field is computed once until the map changes
+        self.assertIs(field, nav.get_distance_field([(6, 1, 0), (0, 1, 0)]))
+        map.get_tile(1, 1).terrain_difficulty = 1
+        self.assertEqual(14, nav.get_distance_field([(0, 1, 0), (6, 1, 0)]).distance((2, 1, 0)))
+
+        # Distances toward a single source match the cost of moving there
+        toward = nav.get_distance_field([(6, 2, 0)], profile = MovementProfile(walk = 1000))
+        for position, path in nav.get_all_paths(None, (6, 2, 0), MovementProfile(walk = 1000)).items():
+            self.assertEqual(nav.get_path(None, position, (6, 2, 0), MovementProfile(walk = 1000)).distance, toward.distance(position))
+
+    def test_hierarchical_path(self):
+        map = Map(32, 16)
+        # A wall down the middle with a single gap at the bottom
+        for y in range(0, 15):
+            map.get_tile(15, y)._wall_right.set_passable(False)
+        nav = NavigationHandler(map)
+        profile = MovementProfile(walk = 1000)
+
+        path = nav.get_path(None, (2, 2, 0), (29, 2, 0), profile, hierarchical = True)
+        exact = nav.get_path(None, (2, 2, 0), (29, 2, 0), profile, hierarchical = False)
+        self.assertEqual(exact.distance, path.distance)
+        self.assertIn((15, 15, 0), path.path)
+
+        layer = nav.get_cluster_layer(profile)
+        self.assertEqual((1, 0), layer.cluster_of((15, 2, 0)))
+        self.assertEqual({(0, 0), (1, 0), (1, 1), (2, 1), (2, 0), (3, 0)}, layer.find_corridor(nav._graph.node_id((2, 2, 0)), nav._graph.node_id((29, 2, 0))))
+
+        # Closing the gap only recomputes the clusters around it
+        map.get_tile(15, 15)._wall_right.set_passable(False)
+        self.assertIsNone(nav.get_path(None, (2, 2, 0), (29, 2, 0), profile, hierarchical = True))
+        self.assertEqual(2, layer.rebuilds)
+        self.assertIsNone(layer.find_corridor(nav._graph.node_id((2, 2, 0)), nav._graph.node_id((29, 2, 0))))
+
+    def test_node_layers(self):
+        map = Map(3, 3, 3)
+        map.get_tile(1, 1).height = 2
+        map.get_tile(2, 2).swimmable = True
+        map.get_tile(2, 2).height = 1
+        map.get_tile(1, 1)._wall_left.set_passable(False)
+        nav = NavigationHandler(map)
+        graph = nav._graph
+
+        layer_of = lambda position: int(graph.node_layers[graph.node_id(position)])
+        self.assertEqual(NavigationGraph.GROUND, layer_of((0, 0, 0)))
+        self.assertEqual(NavigationGraph.AIR, layer_of((0, 0, 1)))
+        self.assertEqual(NavigationGraph.AIR | NavigationGraph.CLIMB, layer_of((0, 1, 1)))
+        self.assertEqual(NavigationGraph.BURROW, layer_of((1, 1, 0)))
+        self.assertEqual(NavigationGraph.WATER, layer_of((2, 2, 0)))
+        self.assertEqual(NavigationGraph.GROUND | NavigationGraph.CLIMB | NavigationGraph.WATER, NavigationGraph.layers_for(MovementProfile(walk = 30)))
+
+        # Walking searches never evaluate moves into plain air
+        with patch.object(NavigationHandler, "_get_traversal_distance", wraps = nav._get_traversal_distance) as traversal:
+            walking = nav.get_all_paths(None, (0, 0, 0), MovementProfile(walk = 30))
+            walking_calls = traversal.call_count
+            nav.get_all_paths(None, (0, 0, 0), MovementProfile(walk = 30, fly = 30))
+        self.assertLess(2 * walking_calls, traversal.call_count - walking_calls)
+        self.assertNotIn((0, 0, 1), walking)
+        self.assertIn((0, 1, 1), walking)
+
+    def test_plan_route(self):
+        map = Map(20, 3)
+        map.get_tile(12, 0).terrain_difficulty = 1
+        nav = NavigationHandler(map)
+        profile = MovementProfile(walk = 30, distance_moved = 10)
+
+        route = nav.plan_route(None, (0, 0, 0), (19, 0, 0), profile)
+        self.assertEqual((0, 0, 0), route.path[0])
+        self.assertEqual((19, 0, 0), route.path[-1])
+        self.assertEqual(4, route.total_turns)
+        # 20ft are left this turn, after that each turn has the full 30ft, and the difficult (12, 0) is walked around
+        self.assertEqual((4, 0, 0), route.next_waypoint)
+        self.assertEqual([(4, 0, 0), (10, 0, 0), (15, 0, 0), (19, 0, 0)], route.waypoints())
+        self.assertEqual(99, route.distance)
+
+        # A route within the current turn costs the same as a path
+        route = nav.plan_route(None, (0, 0, 0), (3, 2, 0), profile)
+        self.assertEqual(1, route.total_turns)
+        self.assertEqual(nav.get_path(None, (0, 0, 0), (3, 2, 0), profile).distance, route.distance)
+
+        self.assertIsNone(nav.plan_route(None, (0, 0, 0), (19, 0, 0), profile, max_turns = 3))
+        self.assertIsNone(nav.plan_route(None, (0, 0, 0), (19, 0, 0), MovementProfile()))
+
+    def test_threat_cost(self):
+        map = Map(7, 3)
+        mover = Token(Statblock("Mover"), (0, 1, 0))
+        guard = Token(Statblock("Guard"), (3, 0, 0))
+        map.add_token(mover)
+        map.add_token(guard)
+        nav = NavigationHandler(map)
+        profile = MovementProfile(walk = 40)
+
+        path = nav.get_path(mover, (0, 1, 0), (6, 1, 0), profile)
+        self.assertEqual(30, path.distance)
+        self.assertEqual([(4, guard)], map.threats.get_reach_exits(path.path, mover))
+
+        # Pricing the opportunity attack makes walking around the guard's reach cheaper
+        path = nav.get_path(mover, (0, 1, 0), (6, 1, 0), profile, threat_cost = 10)
+        self.assertEqual(34, path.distance)
+        self.assertEqual([], map.threats.get_reach_exits(path.path, mover))
+
+        # The price doesn't use up movement, so the straight path is taken when the detour is too long
+        path = nav.get_path(mover, (0, 1, 0), (6, 1, 0), MovementProfile(walk = 30), threat_cost = 10)
+        self.assertEqual(30, path.distance)
+
+        # Changes to the threats without moving tokens are picked up by priced paths, once the threat map is invalidated
+        guard._statblock._inventory.main_hand = WeaponItem("Glaive", "", 6, Size.MEDIUM, [ItemTag.WEAPON_REACH])
+        map.threats.invalidate()
+        path = nav.get_path(mover, (0, 1, 0), (6, 1, 0), profile, threat_cost = 10)
+        self.assertEqual(30, path.distance)
+
+    def test_plan_group_moves(self):
+        map = Map(3, 2)
+        first = Token(Statblock("First", speed = Speed(30)), (0, 0, 0))
+        second = Token(Statblock("Second", speed = Speed(30)), (2, 0, 0))
+        map.add_token(first)
+        map.add_token(second)
+        nav = NavigationHandler(map)
+
+        # Independent paths would swap places through (1, 0), so the second token steps around the first
+        first_path, second_path = nav.plan_group_moves([(first, (2, 0, 0)), (second, (0, 0, 0))])
+        self.assertEqual([(0, 0, 0), (1, 0, 0), (2, 0, 0)], first_path.path)
+        self.assertEqual([(2, 0, 0), (1, 1, 0), (0, 0, 0)], second_path.path)
+        self.assertEqual(14, second_path.distance)
+
+        # A token can follow into a space the token before it leaves
+        map = Map(4, 1)
+        leader = Token(Statblock("Leader", speed = Speed(30)), (1, 0, 0))
+        follower = Token(Statblock("Follower", speed = Speed(30)), (0, 0, 0))
+        map.add_token(leader)
+        map.add_token(follower)
+        nav = NavigationHandler(map)
+        leader_path, follower_path = nav.plan_group_moves([(leader, (3, 0, 0)), (follower, (2, 0, 0))])
+        self.assertEqual([(1, 0, 0), (2, 0, 0), (3, 0, 0)], leader_path.path)
+        self.assertEqual([(0, 0, 0), (1, 0, 0), (2, 0, 0)], follower_path.path)
+
+        # Tokens can't pass each other in a corridor, so neither moves
+        leader_path, follower_path = nav.plan_group_moves([(leader, (0, 0, 0)), (follower, (3, 0, 0))])
+        self.assertIsNone(leader_path)
+        self.assertIsNone(follower_path)
+
+        # Diagonal steps can't cross through each other, so the second token waits for the first to step from (3, 0) to (4, 1)
+        map = Map(6, 6)
+        tokens = [Token(Statblock(f"Token {y}", speed = Speed(30)), (0, y, 0)) for y in range(3)]
+        for token in tokens:
+            map.add_token(token)
+        nav = NavigationHandler(map)
+        first_path, second_path, _ = nav.plan_group_moves([(tokens[0], (5, 2, 0)), (tokens[1], (5, 1, 0)), (tokens[2], (5, 0, 0))])
+        self.assertEqual([(0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 0, 0), (4, 1, 0), (5, 2, 0)], first_path.path)
+        self.assertEqual([(0, 1, 0), (1, 1, 0), (2, 1, 0), (3, 1, 0), (3, 1, 0), (4, 1, 0), (5, 1, 0)], second_path.path)